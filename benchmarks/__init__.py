@@ -0,0 +1,3 @@
+"""
+Benchmarks for textgame, see ``python -m benchmarks.run --help``
+"""
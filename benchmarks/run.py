@@ -0,0 +1,302 @@
+"""
+benchmark suite for textgame
+
+Run the benchmarks and save the results::
+
+    python -m benchmarks.run run --scales 100 10000 --output new.json
+
+Compare two runs, exits with status 1 if anything got slower than the threshold::
+
+    python -m benchmarks.run compare old.json new.json --threshold 0.1
+"""
+
+from time import perf_counter
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import tracemalloc
+
+from textgame.world import World
+from textgame.player import Player
+from textgame.parser import Parser
+from textgame.generator import WorldGenerator
+from textgame.memory import GCMonitor
+from textgame.globals import DIRECTIONS
+
+
+# commands whose throughput gets measured
+VERBS = ["look", "go", "take", "drop", "inventory", "listen", "score"]
+
+# for every metric: True if higher is better
+# pickle recurses about once per room in the default layout, big worlds need a
+# deeper stack than the main thread has
+RECURSION_LIMIT = 1000000
+STACK_SIZE = 512 * 1024 * 1024
+
+HIGHER_IS_BETTER = {
+    "build_seconds": False,
+    "memory_peak_bytes": False,
+    "throughput": True,
+    "latency": False,
+    "save_seconds": False,
+    "save_bytes": False,
+    "load_seconds": False,
+    "gc": False,
+}
+
+
+def percentiles(samples, ps=(50, 90, 99)):
+    samples = sorted(samples)
+    result = {}
+    for p in ps:
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        result["p{}".format(p)] = samples[index]
+    return result
+
+
+def build_world(n_rooms, args):
+    rooms, items, monsters = WorldGenerator(
+        n_rooms, seed=args.seed, regions=["field", "forest", "cave"],
+        loop_density=args.loop_density, locked_density=args.locked_density,
+        dark_density=args.dark_density, monster_density=args.monster_density
+    ).descriptions()
+    start = perf_counter()
+    world = World(rooms=rooms, items=items, monsters=monsters, seed=args.seed, door_ids=args.door_ids)
+    return world, perf_counter() - start
+
+
+def measure_full_collection():
+    start = perf_counter()
+    gc.collect()
+    return perf_counter() - start
+
+
+def measure_memory(n_rooms, args):
+    tracemalloc.start()
+    try:
+        world, _ = build_world(n_rooms, args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del world
+    return peak
+
+
+def command_for(verb, player, rng):
+    """return a command for verb that makes sense at the player's location"""
+    if verb == "go":
+        directions = [d for d in DIRECTIONS if player.location.doors[d]]
+        return "go " + rng.choice(directions) if directions else "look"
+    if verb == "take":
+        return "take " + next(iter(player.location.items), "nothing")
+    if verb == "drop":
+        return "drop " + next(iter(player.inventory), "nothing")
+    return verb
+
+
+def measure_commands(world, args):
+    rng = random.Random(args.seed)
+    player = Player(world, world.room("field_0"))
+    parser = Parser(player)
+    throughput = {}
+    latency = {}
+    for verb in VERBS:
+        samples = []
+        for _ in range(args.commands):
+            command = command_for(verb, player, rng)
+            start = perf_counter()
+            parser.understand(command)
+            samples.append(perf_counter() - start)
+            # keep the benchmark going even if something killed the player
+            player.status.update({"alive": True, "fighting": False, "trapped": False})
+        throughput[verb] = len(samples) / sum(samples)
+        if verb in ("go", "look"):
+            latency[verb] = percentiles(samples)
+    return parser, throughput, latency
+
+
+def deep_call(func, *args):
+    """
+    call ``func(*args)`` in a thread with a big stack and a high recursion limit
+    """
+    result = {}
+    def target():
+        try:
+            result["value"] = func(*args)
+        except BaseException as e:
+            result["error"] = e
+    old_limit = sys.getrecursionlimit()
+    old_stack = threading.stack_size(STACK_SIZE)
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    try:
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+    finally:
+        sys.setrecursionlimit(old_limit)
+        threading.stack_size(old_stack)
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def measure_save_load(parser):
+    return deep_call(_measure_save_load, parser)
+
+
+def _measure_save_load(parser):
+    directory = tempfile.mkdtemp()
+    try:
+        start = perf_counter()
+        parser.save_game(path=directory, session="bench")
+        save_seconds = perf_counter() - start
+        filename = os.path.join(directory, "textgame_bench.pickle")
+        save_bytes = os.path.getsize(filename)
+        start = perf_counter()
+        parser.load_game(path=directory, session="bench")
+        load_seconds = perf_counter() - start
+    except RecursionError:
+        # even the deep stack wasn't enough, compare reports the missing metrics
+        return {"error": "RecursionError"}
+    finally:
+        parser.delete_game(path=directory, session="bench")
+        os.rmdir(directory)
+    return {"save_seconds": save_seconds, "save_bytes": save_bytes, "load_seconds": load_seconds}
+
+
+def run_scale(n_rooms, args):
+    result = {}
+    world, result["build_seconds"] = build_world(n_rooms, args)
+    gcstats = {"full_collect_seconds": measure_full_collection()}
+    if args.freeze:
+        world.freeze()
+        gcstats["frozen_collect_seconds"] = measure_full_collection()
+    with GCMonitor() as monitor:
+        parser, result["throughput"], result["latency"] = measure_commands(world, args)
+    for generation, stats in monitor.summary().items():
+        gcstats["gen{}".format(generation)] = stats
+    result["gc"] = gcstats
+    if args.freeze:
+        world.unfreeze()
+    if not args.no_save:
+        result.update(measure_save_load(parser))
+    del world, parser
+    if not args.no_memory:
+        result["memory_peak_bytes"] = measure_memory(n_rooms, args)
+    return result
+
+
+def run(args):
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now().isoformat(),
+            "seed": args.seed,
+            "commands": args.commands,
+        },
+        "results": {},
+    }
+    for n_rooms in args.scales:
+        print("running {} rooms".format(n_rooms), file=sys.stderr)
+        results["results"][str(n_rooms)] = run_scale(n_rooms, args)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+def flatten(result, prefix=""):
+    """turn nested results into {"throughput.go": 123, ...}"""
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + "."))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(args):
+    with open(args.old) as f:
+        old = json.load(f)["results"]
+    with open(args.new) as f:
+        new = json.load(f)["results"]
+    regressions = []
+    for scale in sorted(set(old) & set(new), key=int):
+        old_flat, new_flat = flatten(old[scale]), flatten(new[scale])
+        error = new[scale].get("error")
+        # a metric that got measured before but failed or is gone now is a regression
+        for metric in sorted(set(old_flat) - set(new_flat)):
+            regressions.append((scale, metric))
+            print("{:>8} {:<32} {:>14.6g} {:>14} {:>8}  REGRESSION".format(
+                scale, metric, old_flat[metric], error or "missing", ""))
+        for metric in sorted(set(old_flat) & set(new_flat)):
+            before, after = old_flat[metric], new_flat[metric]
+            if not before:
+                continue
+            change = (after - before) / before
+            if HIGHER_IS_BETTER.get(metric.split(".")[0], False):
+                change = -change
+            marker = ""
+            if change > args.threshold:
+                marker = "  REGRESSION"
+                regressions.append((scale, metric))
+            print("{:>8} {:<32} {:>14.6g} {:>14.6g} {:>+8.1%}{}".format(
+                scale, metric, before, after, change, marker))
+    if regressions:
+        print("{} regression(s) above {:.0%}".format(len(regressions), args.threshold))
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="textgame benchmarks")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--scales", type=int, nargs="+", default=[100, 1000, 10000],
+        help="number of rooms of the generated worlds")
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--commands", type=int, default=1000,
+        help="commands per verb")
+    run_parser.add_argument("--loop-density", type=float, default=0.3)
+    run_parser.add_argument("--locked-density", type=float, default=0.05)
+    run_parser.add_argument("--dark-density", type=float, default=0.05)
+    run_parser.add_argument("--monster-density", type=float, default=0.01)
+    run_parser.add_argument("--door-ids", action="store_true",
+        help="build the worlds with door_ids=True")
+    run_parser.add_argument("--freeze", action="store_true",
+        help="call World.freeze after building the world")
+    run_parser.add_argument("--no-memory", action="store_true",
+        help="don't measure peak memory (it needs a second, slower build)")
+    run_parser.add_argument("--no-save", action="store_true",
+        help="don't measure save_game/load_game")
+    run_parser.add_argument("--output", help="write results to this file instead of stdout")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two runs")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+        help="relative change that counts as regression")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run(args)
+    elif args.command == "compare":
+        sys.exit(compare(args))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -90,18 +90,10 @@ class MyPlayer(textgame.player.Player):
 # create mapping between input and our new method
 class MyParser(textgame.parser.Parser):
 
-    def __init__(self, player):
-        textgame.parser.Parser.__init__(self, player)
-
-        # first, we map the inputs "scream" and "shout" both to the word "scream"
-        self.legal_verbs.update({
-            "scream": "scream",
-            "shout": "scream"
-        })
-        # now we map the word "scream" to our method
-        self.actionmap.update({
-            "scream": player.scream
-        })
+    # first, we map the inputs "scream" and "shout" both to the word "scream"
+    verbs = dict(textgame.parser.Parser.verbs, scream="scream", shout="scream")
+    # now we map the word "scream" to the name of our method
+    actions = dict(textgame.parser.Parser.actions, scream="scream")
 
 
 # create the world based on our rooms and items
@@ -1,8 +1,27 @@
 from . import movable
+from . import multiplayer
 from . import parser
 from . import player
 from . import room
 from . import world
+from . import vocabulary
+from . import generator
+from . import diagnostics
+from . import response
+from . import rng
+from . import scheduler
+from . import events
+from . import simulation
+from . import static
+from . import metrics
+from . import tracing
+from . import analytics
+from . import memory
+from . import watchdog
+from . import migration
+from . import balance
+from . import leaderboard
+from . import changefeed
 from . import globals
 
 __version__ = "0.2"
@@ -0,0 +1,381 @@
+"""
+textgame.analytics
+=====================
+
+Opt-in export of one record per command (session, tick, verb, noun, room, if the
+player moved, score delta, items taken, cause of death) into a compact columnar file, and aggregation of
+such files with `NumPy <https://numpy.org>`_.
+
+.. code-block:: python
+
+   import textgame.analytics
+
+   recorder = textgame.analytics.enable("events.tga")
+   recorder.set_session(parser, "alice")
+   # ... play ...
+   textgame.analytics.disable()   # writes the remaining records
+
+   events = textgame.analytics.load("events.tga")
+   events.room_visits()       # {room ID: number of times a player entered}
+   events.death_locations()   # {room ID: number of deaths}
+   events.death_causes()
+   events.pickup_rates()      # {item: (attempts, successes)}
+   events.command_frequency() # {verb: count}
+
+The file is a sequence of blocks that can be appended to at any time, also by a
+new process. Every block starts with the strings that were seen for the first time
+(verbs, nouns, room IDs, ...), followed by one array of 32 bit integers per column
+where strings are replaced by their number. Recording only needs the standard
+library, :func:`textgame.analytics.load` needs NumPy.
+"""
+
+from array import array
+import itertools
+import json
+import os
+import struct
+import sys
+import threading
+import weakref
+import logging
+logger = logging.getLogger("textgame.analytics")
+logger.addHandler(logging.NullHandler())
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+#: the active :class:`textgame.analytics.Recorder` or ``None`` if it's disabled
+recorder = None
+
+# the last two bytes are the version of the format
+MAGIC = b"TGEVNT02"
+# magic, number of rows, length of the new strings
+_BLOCK = struct.Struct("<8sII")
+
+# name, typecode; columns whose name is in STRING_COLUMNS store string numbers
+COLUMNS = (
+    ("session", "I"),
+    ("tick", "I"),
+    ("verb", "I"),
+    ("noun", "I"),
+    ("room", "I"),
+    ("moved", "I"),
+    ("score_delta", "i"),
+    ("taken", "i"),
+    ("cause", "I"),
+)
+STRING_COLUMNS = ("session", "verb", "noun", "room", "cause")
+_DTYPES = {"I": "<u4", "i": "<i4"}
+
+
+def enable(path, **kwargs):
+    """
+    start recording into the file ``path`` and return the :class:`textgame.analytics.Recorder`
+    """
+    global recorder
+    if recorder is not None:
+        recorder.close()
+    recorder = Recorder(path, **kwargs)
+    logger.info("recording analytics to {}".format(path))
+    return recorder
+
+
+def disable():
+    """
+    stop recording and write the remaining records
+    """
+    global recorder
+    if recorder is not None:
+        recorder.close()
+    recorder = None
+    logger.info("analytics disabled")
+
+
+def _pad(n):
+    return -n % 8
+
+
+def iter_blocks(f):
+    """
+    generator of ``(rows, new strings, {column: bytes})`` of the blocks in the open
+    binary file ``f``
+    """
+    while True:
+        preamble = f.read(_BLOCK.size)
+        if not preamble:
+            return
+        if len(preamble) < _BLOCK.size:
+            logger.warning("ignoring a truncated block at the end of the file")
+            return
+        magic, rows, length = _BLOCK.unpack(preamble)
+        if magic != MAGIC:
+            if magic[:6] == MAGIC[:6]:
+                raise ValueError("textgame analytics file of another version ({})".format(magic[6:].decode()))
+            raise ValueError("not a textgame analytics file")
+        strings = json.loads(f.read(length + _pad(_BLOCK.size + length))[:length])
+        columns = {}
+        for name, typecode in COLUMNS:
+            size = rows * 4
+            data = f.read(size + _pad(size))
+            if len(data) < size:
+                logger.warning("ignoring a truncated block at the end of the file")
+                return
+            columns[name] = data[:size]
+        yield rows, strings, columns
+
+
+class Recorder:
+    """
+    collects one record per command and appends them to ``path`` in blocks
+
+    :param path: file to append to
+    :param block_size: number of records that are written at once
+    """
+
+    def __init__(self, path, block_size=65536):
+        self.path = path
+        self.block_size = block_size
+        # column -> {string: number}, 0 stands for None/""
+        self.strings = {name: {"": 0} for name in STRING_COLUMNS}
+        # strings that are not in the file yet
+        self.new_strings = []
+        if os.path.exists(path):
+            # continue the numbering of the existing file
+            with open(path, "rb") as f:
+                for rows, strings, columns in iter_blocks(f):
+                    self._add_strings(strings)
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS}
+        self.sessions = weakref.WeakKeyDictionary()
+        self.rows = 0
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self.file = open(path, "ab")
+
+
+    def _add_strings(self, strings):
+        for column, string in strings:
+            table = self.strings[column]
+            table[string] = len(table)
+
+
+    def code(self, column, string):
+        """
+        return the number of ``string`` in ``column``
+        """
+        if string is None:
+            return 0
+        table = self.strings[column]
+        code = table.get(string)
+        if code is None:
+            code = table[string] = len(table)
+            self.new_strings.append((column, string))
+        return code
+
+
+    def set_session(self, parser, name):
+        """
+        record the commands of ``parser`` under the session name ``name``. By
+        default, sessions are named "<process ID>-<number>" in the order they're seen
+        """
+        with self._lock:
+            self.sessions[parser] = self.code("session", str(name))
+
+
+    def record(self, parser, input):
+        """
+        run the command ``input`` with ``parser`` and record it, called by
+        :func:`textgame.parser.Parser.understand_command`
+        """
+        player = parser.player
+        score = player.score
+        alive = player.status["alive"]
+        carrying = len(player.inventory)
+        room = player.location.id
+        msg = parser._understand_command(input)
+        # load_game may have replaced the player
+        after = parser.player
+        verb, noun = parser.last_command
+        cause = (after.death_cause or "unknown") if alive and not after.status["alive"] else None
+        with self._lock:
+            session = self.sessions.get(parser)
+            if session is None:
+                name = "{}-{}".format(os.getpid(), next(self._counter))
+                session = self.sessions[parser] = self.code("session", name)
+            columns = self.columns
+            columns["session"].append(session)
+            columns["tick"].append(after.world.time)
+            columns["verb"].append(self.code("verb", verb))
+            columns["noun"].append(self.code("noun", noun))
+            columns["room"].append(self.code("room", after.location.id))
+            columns["moved"].append(after.location.id != room)
+            columns["score_delta"].append(after.score - score)
+            columns["taken"].append(len(after.inventory) - carrying)
+            columns["cause"].append(self.code("cause", cause))
+            self.rows += 1
+            if self.rows >= self.block_size:
+                self._write()
+        return msg
+
+
+    def flush(self):
+        """
+        write all collected records to the file
+        """
+        with self._lock:
+            self._write()
+
+
+    def _write(self):
+        if not self.rows and not self.new_strings:
+            return
+        strings = json.dumps(self.new_strings, separators=(",", ":")).encode()
+        parts = [_BLOCK.pack(MAGIC, self.rows, len(strings)), strings,
+                 b"\0" * _pad(_BLOCK.size + len(strings))]
+        for name, typecode in COLUMNS:
+            column = self.columns[name]
+            if sys.byteorder == "big":
+                column.byteswap()
+            data = column.tobytes()
+            parts.append(data)
+            parts.append(b"\0" * _pad(len(data)))
+            self.columns[name] = array(typecode)
+        self.file.write(b"".join(parts))
+        self.file.flush()
+        logger.debug("wrote {} records to {}".format(self.rows, self.path))
+        self.rows = 0
+        self.new_strings = []
+
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+
+
+def load(path):
+    """
+    load an analytics file into a :class:`textgame.analytics.Events` object
+    """
+    if np is None:
+        raise ImportError("textgame.analytics.load needs numpy")
+    strings = {name: [""] for name in STRING_COLUMNS}
+    parts = {name: [] for name, _ in COLUMNS}
+    with open(path, "rb") as f:
+        for rows, new, columns in iter_blocks(f):
+            for column, string in new:
+                strings[column].append(string)
+            for name, typecode in COLUMNS:
+                parts[name].append(np.frombuffer(columns[name], dtype=_DTYPES[typecode]))
+    arrays = {
+        name: np.concatenate(parts[name]) if parts[name] else np.zeros(0, dtype=_DTYPES[typecode])
+        for name, typecode in COLUMNS
+    }
+    return Events(arrays, strings)
+
+
+class Events:
+    """
+    the records of an analytics file as NumPy arrays
+
+    :param columns: dict column name -> array
+    :param strings: dict column name -> list of strings, the index is the number stored in the column
+    """
+
+    def __init__(self, columns, strings):
+        if np is None:
+            raise ImportError("Events needs numpy")
+        self.columns = columns
+        self.strings = strings
+        for name, values in columns.items():
+            setattr(self, name, values)
+
+
+    def __len__(self):
+        return len(self.tick)
+
+
+    def _named(self, column, counts):
+        # {string: count} for all strings with a count, the most frequent first
+        names = self.strings[column]
+        order = np.argsort(-counts, kind="stable")
+        return {names[i]: int(counts[i]) for i in order if counts[i] and names[i]}
+
+
+    def _bincount(self, column, values, weights=None):
+        return np.bincount(values, weights=weights, minlength=len(self.strings[column]))
+
+
+    def command_frequency(self):
+        """
+        return ``{verb: number of commands}``
+        """
+        return self._named("verb", self._bincount("verb", self.verb))
+
+
+    def room_commands(self):
+        """
+        return ``{room ID: number of commands that ended in this room}``
+        """
+        return self._named("room", self._bincount("room", self.room))
+
+
+    def room_visits(self):
+        """
+        return ``{room ID: number of times a player entered it}``, the heatmap of the world
+        """
+        return self._named("room", self._bincount("room", self.room[self.moved != 0]))
+
+
+    def death_locations(self):
+        """
+        return ``{room ID: number of deaths}``
+        """
+        died = self.cause != 0
+        return self._named("room", self._bincount("room", self.room[died]))
+
+
+    def death_causes(self):
+        """
+        return ``{cause: number of deaths}``
+        """
+        return self._named("cause", self._bincount("cause", self.cause[self.cause != 0]))
+
+
+    def score_by_room(self):
+        """
+        return ``{room ID: sum of the score gained by the commands that ended there}``
+        """
+        counts = self._bincount("room", self.room, weights=self.score_delta).astype(np.int64)
+        return self._named("room", counts)
+
+
+    def pickup_rates(self, verb="take"):
+        """
+        return ``{item: (attempts, successes)}`` of commands with the verb ``verb``
+        """
+        code = self.strings["verb"].index(verb) if verb in self.strings["verb"] else -1
+        mask = self.verb == code
+        attempts = self._bincount("noun", self.noun[mask])
+        successes = self._bincount("noun", self.noun[mask & (self.taken > 0)])
+        names = self.strings["noun"]
+        order = np.argsort(-attempts, kind="stable")
+        return {names[i]: (int(attempts[i]), int(successes[i])) for i in order if attempts[i]}
+
+
+    def summary(self):
+        """
+        return a dict with all aggregations
+        """
+        return {
+            "records": len(self),
+            "sessions": int(len(np.unique(self.session))),
+            "commands": self.command_frequency(),
+            "room_visits": self.room_visits(),
+            "death_locations": self.death_locations(),
+            "death_causes": self.death_causes(),
+            "pickup_rates": self.pickup_rates(),
+        }
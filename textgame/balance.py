@@ -0,0 +1,193 @@
+"""
+textgame.balance
+=====================
+
+Fight outcomes for balancing monsters, without playing games. This module follows
+the rules of :func:`textgame.player.Player.attack` and
+:func:`textgame.world.World.manage_fight`:
+
+- a monster spawns with ``history`` 0 and the command during which it spawned
+  already reminds the player to defend (``history`` becomes 1)
+- every following command of the player is a round that increases ``history`` by one
+- an attack at ``history < 2`` kills the monster if a random number is bigger than
+  ``strength - history/10``, else the fight goes on
+- an attack at ``history == 2`` is the last chance: kill the monster if the number is
+  bigger than ``strength - 0.2``, else the player dies ("fight")
+- not attacking at ``history == 2`` kills the player ("ignored"), running away at any
+  time kills the player too ("cowardice"), and in the dark the player dies right away ("dark")
+
+A strategy is a list of actions (``ATTACK``, ``WAIT`` or ``FLEE``), one per round.
+If it's shorter than the fight, its last action is repeated. Needs `NumPy <https://numpy.org>`_:
+
+.. code-block:: python
+
+   import numpy as np
+   import textgame.balance as balance
+
+   strengths = np.linspace(0, 1, 11)
+   result = balance.exact(strengths, [balance.WAIT, balance.ATTACK])
+   result["killed"]        # probability to kill the monster for every strength
+   result["rounds"]        # expected number of commands until the fight is over
+
+   # the same by simulation, eg. to check custom changes of the rules
+   balance.monte_carlo(strengths, [balance.ATTACK], trials=1000000, seed=1)
+
+   for row in balance.table(strengths, balance.strategies()):
+       print(row)
+"""
+
+from itertools import product
+import logging
+logger = logging.getLogger("textgame.balance")
+logger.addHandler(logging.NullHandler())
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+ATTACK = "attack"
+WAIT = "wait"
+FLEE = "flee"
+ACTIONS = (ATTACK, WAIT, FLEE)
+
+#: "killed" means the monster died, the others are the causes of the player's death
+OUTCOMES = ("killed", "fight", "ignored", "cowardice", "dark")
+
+# history of a monster after the command during which it spawned
+SPAWNED = 1
+# at this history, an attack is the last chance and waiting is deadly
+LAST_ROUND = 2
+
+
+def _check(strategy, start_history):
+    if np is None:
+        raise ImportError("textgame.balance needs numpy")
+    if not strategy:
+        raise ValueError("a strategy needs at least one action")
+    for action in strategy:
+        if action not in ACTIONS:
+            raise ValueError("unknown action {}, must be one of {}".format(repr(action), ACTIONS))
+    if not 0 <= start_history <= LAST_ROUND:
+        raise ValueError("start_history must be between 0 and {}".format(LAST_ROUND))
+
+
+def kill_probability(strength, history):
+    """
+    probability that an attack at ``history`` kills a monster of ``strength``
+    """
+    threshold = strength - (history / 10 if history < LAST_ROUND else 0.2)
+    # random.random() is uniform in [0, 1)
+    return 1 - np.clip(threshold, 0, 1)
+
+
+def exact(strength, strategy, start_history=SPAWNED, dark=False):
+    """
+    compute the outcome probabilities of a fight
+
+    :param strength: float or array of monster strengths
+    :param strategy: list of actions, see above
+    :param start_history: history of the monster at the player's first command
+    :param dark: if the room is dark
+    :returns: dict with an array for every outcome in :data:`textgame.balance.OUTCOMES`
+        plus ``"rounds"``, the expected number of commands until the fight is over
+    """
+    _check(strategy, start_history)
+    strength = np.asarray(strength, dtype=float)
+    result = {outcome: np.zeros(strength.shape) for outcome in OUTCOMES}
+    result["rounds"] = np.zeros(strength.shape)
+    if dark:
+        # the player died during the command the monster spawned in
+        result["dark"][...] = 1
+        return result
+    # probability that the fight is still going on
+    ongoing = np.ones(strength.shape)
+    for round, history in enumerate(range(start_history, LAST_ROUND + 1)):
+        action = strategy[min(round, len(strategy) - 1)]
+        result["rounds"] += ongoing
+        if action == FLEE:
+            result["cowardice"] += ongoing
+            return result
+        if action == ATTACK:
+            killed = ongoing * kill_probability(strength, history)
+            result["killed"] += killed
+            ongoing = ongoing - killed
+            if history == LAST_ROUND:
+                result["fight"] += ongoing
+                return result
+        elif history == LAST_ROUND:
+            result["ignored"] += ongoing
+            return result
+    return result
+
+
+def monte_carlo(strength, strategy, trials=100000, start_history=SPAWNED, dark=False,
+                seed=None, chunk=1000000):
+    """
+    estimate the same as :func:`textgame.balance.exact` by simulating ``trials``
+    fights for every strength
+
+    :param chunk: maximum number of fights that are simulated at once
+    """
+    _check(strategy, start_history)
+    rng = np.random.default_rng(seed)
+    strength = np.atleast_1d(np.asarray(strength, dtype=float))
+    counts = {outcome: np.zeros(strength.shape) for outcome in OUTCOMES}
+    counts["rounds"] = np.zeros(strength.shape)
+    if dark:
+        counts["dark"][...] = trials
+    else:
+        per_chunk = max(1, chunk // max(strength.size, 1))
+        done = 0
+        while done < trials:
+            n = min(per_chunk, trials - done)
+            _simulate(strength.reshape(-1, 1), n, strategy, start_history, rng, counts)
+            done += n
+    return {key: value / trials for key, value in counts.items()}
+
+
+def _simulate(strength, n, strategy, start_history, rng, counts):
+    # strength has shape (s, 1), one row of n fights per strength
+    ongoing = np.ones((strength.shape[0], n), dtype=bool)
+    for round, history in enumerate(range(start_history, LAST_ROUND + 1)):
+        action = strategy[min(round, len(strategy) - 1)]
+        counts["rounds"] += ongoing.sum(axis=1)
+        if action == FLEE:
+            counts["cowardice"] += ongoing.sum(axis=1)
+            return
+        if action == ATTACK:
+            threshold = strength - (history / 10 if history < LAST_ROUND else 0.2)
+            killed = ongoing & (rng.random(ongoing.shape) > threshold)
+            counts["killed"] += killed.sum(axis=1)
+            ongoing &= ~killed
+            if history == LAST_ROUND:
+                counts["fight"] += ongoing.sum(axis=1)
+                return
+        elif history == LAST_ROUND:
+            counts["ignored"] += ongoing.sum(axis=1)
+            return
+
+
+def strategies(rounds=LAST_ROUND - SPAWNED + 1, actions=(ATTACK, WAIT)):
+    """
+    return all strategies with ``rounds`` actions
+    """
+    return [list(s) for s in product(actions, repeat=rounds)]
+
+
+def table(strengths, strategies, method=exact, **kwargs):
+    """
+    return a balance table: a list of dicts with ``strength``, ``strategy`` and the
+    result of ``method`` (:func:`textgame.balance.exact` or
+    :func:`textgame.balance.monte_carlo`) for every combination
+    """
+    strengths = np.atleast_1d(np.asarray(strengths, dtype=float))
+    rows = []
+    for strategy in strategies:
+        result = method(strengths, strategy, **kwargs)
+        for i, strength in enumerate(strengths):
+            row = {"strength": float(strength), "strategy": "-".join(strategy)}
+            row.update((key, float(value[i])) for key, value in result.items())
+            rows.append(row)
+    return rows
@@ -0,0 +1,288 @@
+"""
+textgame.changefeed
+=====================
+
+Opt-in feed of the changes to a :class:`textgame.world.World` and its players, as
+small ordered records. Use it to keep a standby copy of a game up to date, to show a
+game to spectators or to feed analytics, without pickling the whole game:
+
+.. code-block:: python
+
+   feed = textgame.changefeed.ChangeFeed().attach(world)
+   feed.register(player, "alice")
+   subscription = feed.subscribe(maxlen=10000)
+   # ... play ...
+   for change in subscription.poll():
+       send(tuple(change))
+
+   # in the standby process, with a world built from the same content and seed
+   replica = textgame.changefeed.Replica(standby_world, {"alice": standby_player})
+   replica.apply(received_changes)
+
+Every change is a :class:`textgame.changefeed.Change` ``(seq, kind, args)``:
+
+- ``ITEM_MOVED`` ``(item, source, target)``, places are ``"room:<ID>"`` or ``"player:<name>"``
+- ``DOOR_LOCKED`` ``(room, direction, closed)``
+- ``ROOM_VISITED`` ``(room,)``
+- ``MONSTER_CHANGED`` ``(monster, room, status, history)``, ``room`` is where the
+  monster (or its body) is, ``None`` if it's gone
+- ``SCORE_CHANGED`` ``(player, score)``
+- ``PLAYER_MOVED`` ``(player, room, oldroom)``
+- ``PLAYER_STATUS`` ``(player, status)``
+- ``TICK`` ``(time, daytime)``
+
+Only the changes made by textgame itself are captured. A ``special_func`` or a
+scheduled event that changes the world should call
+:func:`textgame.changefeed.ChangeFeed.publish` itself. A subscription keeps at most
+``maxlen`` changes. If the consumer is too slow, the oldest ones are dropped and
+``dropped`` tells how many, a replica then needs a fresh copy of the game.
+
+Nothing is recorded while there are no subscriptions. The feed is not saved with
+the game, after :func:`textgame.parser.Parser.load_game` attach it to the loaded
+world again.
+"""
+
+from collections import namedtuple, deque
+import itertools
+import threading
+import weakref
+import logging
+logger = logging.getLogger("textgame.changefeed")
+logger.addHandler(logging.NullHandler())
+
+
+ITEM_MOVED = "item_moved"
+DOOR_LOCKED = "door_locked"
+ROOM_VISITED = "room_visited"
+MONSTER_CHANGED = "monster_changed"
+SCORE_CHANGED = "score_changed"
+PLAYER_MOVED = "player_moved"
+PLAYER_STATUS = "player_status"
+TICK = "tick"
+
+
+Change = namedtuple("Change", ["seq", "kind", "args"])
+Change.__doc__ = """
+one change, ``seq`` numbers the changes of a feed without gaps
+"""
+
+
+class Subscription:
+    """
+    bounded buffer of changes, see :func:`textgame.changefeed.ChangeFeed.subscribe`
+    """
+
+    def __init__(self, feed, maxlen):
+        self.feed = feed
+        self.maxlen = maxlen
+        self.buffer = deque(maxlen=maxlen)
+        # number of changes that were dropped because the buffer was full
+        self.dropped = 0
+
+
+    def __len__(self):
+        return len(self.buffer)
+
+
+    def poll(self, max=None):
+        """
+        return and remove up to ``max`` (default: all) changes, the oldest first
+        """
+        buffer = self.buffer
+        n = len(buffer) if max is None else min(max, len(buffer))
+        return [buffer.popleft() for _ in range(n)]
+
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+
+class ChangeFeed:
+    """
+    records the changes of the worlds it's attached to
+    """
+
+    def __init__(self):
+        self.seq = 0
+        # tuple, replaced on (un)subscribe so publishing can iterate without a lock
+        self.subscriptions = ()
+        # player -> name
+        self.names = weakref.WeakKeyDictionary()
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+
+    def attach(self, world):
+        """
+        let ``world`` and its players publish their changes to this feed
+        """
+        world.feed = self
+        return self
+
+
+    @staticmethod
+    def detach(world):
+        world.feed = None
+
+
+    def subscribe(self, maxlen=10000):
+        """
+        :param maxlen: the most changes the subscription keeps
+        :rtype: :class:`textgame.changefeed.Subscription`
+        """
+        subscription = Subscription(self, maxlen)
+        with self._lock:
+            self.subscriptions = self.subscriptions + (subscription,)
+        return subscription
+
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscriptions = tuple(s for s in self.subscriptions if s is not subscription)
+
+
+    def register(self, player, name):
+        """
+        use ``name`` for ``player`` in the changes, by default players are named "player<number>"
+        """
+        self.names[player] = name
+
+
+    def place(self, player):
+        """
+        return ``"player:<name>"`` of ``player``
+        """
+        name = self.names.get(player)
+        if name is None:
+            name = self.names[player] = "player{}".format(next(self._counter))
+        return "player:" + name
+
+
+    def name(self, player):
+        return self.place(player)[len("player:"):]
+
+
+    def publish(self, kind, *args):
+        """
+        add a change to all subscriptions
+        """
+        if not self.subscriptions:
+            return
+        with self._lock:
+            self.seq += 1
+            change = Change(self.seq, kind, args)
+            for subscription in self.subscriptions:
+                if len(subscription.buffer) == subscription.maxlen:
+                    subscription.dropped += 1
+                subscription.buffer.append(change)
+
+
+    def monster_changed(self, monster_id, monster, room):
+        """
+        publish the state of a monster, ``room`` is the room it's in or ``None``
+        """
+        self.publish(MONSTER_CHANGED, monster_id, room.id if room is not None else None,
+                     dict(monster.status), monster.history)
+
+
+class Replica:
+    """
+    applies changes to a copy of a game, eg. a world in a standby process that was
+    built from the same content and seed
+
+    :param world: :class:`textgame.world.World`
+    :param players: dict name -> :class:`textgame.player.Player`
+    :param seq: ``seq`` of the last change that's already contained in ``world``,
+        ``None`` to accept whatever comes first
+    """
+
+    def __init__(self, world, players, seq=None):
+        self.world = world
+        self.players = players
+        self.seq = seq
+        # monster ID -> ID of the room it's in
+        self.monster_rooms = {}
+        for room in world.rooms.values():
+            for ID in room.monsters:
+                self.monster_rooms[ID] = room.id
+
+
+    def apply(self, changes):
+        """
+        apply ``changes`` in order. Changes that were applied already are skipped
+
+        :raises RuntimeError: if changes are missing, the replica needs a fresh copy of the game
+        """
+        for change in changes:
+            seq, kind, args = change
+            if self.seq is not None:
+                if seq <= self.seq:
+                    continue
+                if seq != self.seq + 1:
+                    raise RuntimeError("missing changes {} to {}, the replica is out of sync".format(
+                        self.seq + 1, seq - 1))
+            getattr(self, "_" + kind)(*args)
+            self.seq = seq
+
+
+    def _container(self, place):
+        kind, _, name = place.partition(":")
+        if kind == "room":
+            return self.world.rooms[name].items
+        return self.players[name].inventory
+
+
+    def _item_moved(self, item, source, target):
+        self._container(target)[item] = self._container(source).pop(item)
+
+
+    def _door_locked(self, room, direction, closed):
+        self.world.rooms[room].locked[direction]["closed"] = closed
+
+
+    def _room_visited(self, room):
+        self.world.rooms[room].visited = True
+
+
+    def _monster_changed(self, monster_id, room, status, history):
+        monster = self.world.monsters[monster_id]
+        previous = self.monster_rooms.pop(monster_id, None)
+        if previous is not None:
+            self.world.rooms[previous].monsters.pop(monster_id, None)
+        if monster.status["alive"] and not status["alive"]:
+            monster.kill()
+        monster.status.update(status)
+        monster.history = history
+        if room is None:
+            return
+        if status["alive"]:
+            self.world.rooms[room].monsters[monster_id] = monster
+            self.monster_rooms[monster_id] = room
+        else:
+            # dead monsters lie around as items named like the monster
+            monster.id = monster.name
+            self.world.rooms[room].items[monster.name] = monster
+
+
+    def _score_changed(self, player, score):
+        self.players[player].score = score
+
+
+    def _player_moved(self, player, room, oldroom):
+        player = self.players[player]
+        player.location = self.world.rooms[room]
+        player.oldlocation = self.world.rooms[oldroom] if oldroom is not None else None
+
+
+    def _player_status(self, player, status):
+        self.players[player].status.update(status)
+
+
+    def _tick(self, time, daytime):
+        world = self.world
+        world.time = time
+        if daytime != world.daytime:
+            world.daytime = daytime
+            if daytime == "night":
+                for room in world.rooms.values():
+                    room.dark["always"] = True
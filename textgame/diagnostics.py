@@ -0,0 +1,270 @@
+"""
+textgame.diagnostics
+=====================
+
+This module checks a whole world definition (the dicts you pass to
+:class:`textgame.world.World`) in one go and returns a :class:`textgame.diagnostics.Report`
+instead of logging every problem on its own:
+
+.. code-block:: python
+
+   report = textgame.diagnostics.check_world(rooms=myrooms, items=myitems, monsters=mymonsters)
+   if report.errors:
+       print(report.summary())
+       for diagnostic in report.errors:
+           print(diagnostic.subject, diagnostic.message)
+   json.dumps(report.as_dict())
+
+Every room, item and monster is looked at once, so checking is linear in the size
+of the world. Besides what :class:`textgame.world.World` complains about, the
+check finds keys that fit no lock, locks without a key, rooms that can't be reached
+and monsters that will never spawn. Use :func:`textgame.diagnostics.check_parser`
+to find verbs that aren't mapped to any action.
+"""
+
+from collections import namedtuple, deque, Counter
+import inspect
+import logging
+logger = logging.getLogger("textgame.diagnostics")
+logger.addHandler(logging.NullHandler())
+
+from textgame.globals import DIRECTIONS
+from textgame.room import Room
+
+
+ERROR = "error"
+WARNING = "warning"
+
+Diagnostic = namedtuple("Diagnostic", ["severity", "code", "subject", "message"])
+Diagnostic.__doc__ = """
+a single problem. ``code`` is a short identifier like "dangling-door", ``subject``
+is the ID of the room, item or monster (or the verb) the problem is about
+"""
+
+# keyword arguments Room.fill_info accepts
+ROOM_FIELDS = set(inspect.signature(Room.fill_info).parameters) - {"self"}
+DAYTIMES = {"day", "night", "always"}
+
+
+class Report:
+    """
+    list of :class:`textgame.diagnostics.Diagnostic` objects
+    """
+
+    def __init__(self):
+        self.diagnostics = []
+
+
+    def add(self, severity, code, subject, message):
+        self.diagnostics.append(Diagnostic(severity, code, subject, message))
+
+
+    @property
+    def errors(self):
+        return [d for d in self.diagnostics if d.severity == ERROR]
+
+
+    @property
+    def warnings(self):
+        return [d for d in self.diagnostics if d.severity == WARNING]
+
+
+    def by_code(self, code):
+        return [d for d in self.diagnostics if d.code == code]
+
+
+    def summary(self):
+        """
+        return a one-line summary like "2 errors, 1 warning (dangling-door: 2, ...)"
+        """
+        errors, warnings = len(self.errors), len(self.warnings)
+        counts = Counter(d.code for d in self.diagnostics)
+        text = "{} error{}, {} warning{}".format(
+            errors, "" if errors == 1 else "s", warnings, "" if warnings == 1 else "s")
+        if counts:
+            text += " (" + ", ".join("{}: {}".format(c, n) for c,n in counts.most_common()) + ")"
+        return text
+
+
+    def log(self, logger=logger):
+        """
+        log the summary, as error if there are errors, else as warning
+        """
+        if self.errors:
+            logger.error(self.summary())
+        elif self.warnings:
+            logger.warning(self.summary())
+
+
+    def as_dict(self):
+        return {
+            "summary": self.summary(),
+            "diagnostics": [d._asdict() for d in self.diagnostics],
+        }
+
+
+def check_world(rooms=None, items=None, weapons=None, monsters=None, start=None):
+    """
+    check the descriptions of a world
+
+    :param rooms: dict describing all rooms
+    :param items: dict describing all items
+    :param weapons: dict describing all weapons
+    :param monsters: dict describing all monsters
+    :param start: ID of the room the player starts in (the first room by default).
+        Rooms that can't be reached from here are reported
+    :rtype: :class:`textgame.diagnostics.Report`
+    """
+    report = Report()
+    rooms = rooms or {}
+    items = dict(items or {}, **(weapons or {}))
+    monsters = monsters or {}
+
+    edges = {}
+    locks = {}  # key -> list of (room, direction)
+    for ID, description in rooms.items():
+        edges[ID] = _check_room(report, ID, description, rooms, locks)
+
+    keys = {}
+    for ID, description in items.items():
+        if not isinstance(description, dict):
+            report.add(ERROR, "bad-description", ID, "item description is not a dict")
+            continue
+        _check_initlocation(report, ID, description.get("initlocation", ""), rooms, "item", required=True)
+        key = description.get("key")
+        if key is not None:
+            keys.setdefault(key, []).append(ID)
+
+    for key, owners in keys.items():
+        if key not in locks:
+            for ID in owners:
+                report.add(WARNING, "key-without-lock", ID,
+                    "item has key {} but no door is locked with it".format(repr(key)))
+    for key, doors in locks.items():
+        if key not in keys:
+            for roomid, direction in doors:
+                report.add(WARNING, "lock-without-key", roomid,
+                    "the door {} is locked with key {} but no item has it".format(direction, repr(key)))
+
+    _check_monsters(report, monsters, rooms)
+
+    if rooms:
+        _check_reachable(report, edges, start if start is not None else next(iter(rooms)))
+    return report
+
+
+def _check_room(report, ID, description, rooms, locks):
+    """check a single room and return the IDs of the rooms it's connected to"""
+    if not description:
+        report.add(WARNING, "missing-description", ID, "room does not have a description")
+        return []
+    if not isinstance(description, dict):
+        report.add(ERROR, "bad-description", ID, "room description is not a dict")
+        return []
+    unknown = set(description) - ROOM_FIELDS
+    for field in sorted(unknown):
+        report.add(ERROR, "unknown-field", ID, "rooms don't have a field {}".format(repr(field)))
+    if not description.get("descript"):
+        report.add(WARNING, "missing-description", ID, "room does not have a description")
+
+    targets = []
+    if not description.get("doors"):
+        report.add(WARNING, "no-doors", ID, "room does not have any doors")
+    for field in ("doors", "hiddendoors"):
+        for direction, target in (description.get(field) or {}).items():
+            _check_direction(report, ID, field, direction)
+            if target not in rooms:
+                report.add(ERROR, "dangling-door", ID,
+                    "{} {} points to unknown room {}".format(field, direction, repr(target)))
+            else:
+                targets.append(target)
+
+    for field in ("errors", "dir_descriptions"):
+        for direction in description.get(field) or {}:
+            _check_direction(report, ID, field, direction)
+
+    for direction, lock in (description.get("locked") or {}).items():
+        _check_direction(report, ID, "locked", direction)
+        if not isinstance(lock, dict) or "closed" not in lock or "key" not in lock:
+            report.add(ERROR, "bad-lock", ID,
+                "locked dict in direction {} needs 'closed' and 'key'".format(direction))
+            continue
+        if lock["key"] is not None:
+            locks.setdefault(lock["key"], []).append((ID, direction))
+    return targets
+
+
+def _check_direction(report, ID, field, direction):
+    if direction not in DIRECTIONS:
+        report.add(ERROR, "bad-direction", ID, "in {}: {} is not a direction".format(field, repr(direction)))
+
+
+def _check_initlocation(report, ID, initlocation, rooms, kind, required):
+    if initlocation and initlocation not in rooms:
+        report.add(WARNING, "missing-initlocation", ID,
+            "{}'s initlocation {} could not be found".format(kind, repr(initlocation)))
+    elif required and not initlocation:
+        report.add(WARNING, "missing-initlocation", ID, "{} has no initlocation".format(kind))
+
+
+def _check_monsters(report, monsters, rooms):
+    # all room IDs in one string, so a substring search over all of them is a single scan
+    allids = "\0".join(rooms)
+    found = {}
+    for ID, description in monsters.items():
+        if not isinstance(description, dict):
+            report.add(ERROR, "bad-description", ID, "monster description is not a dict")
+            continue
+        initlocation = description.get("initlocation", "")
+        _check_initlocation(report, ID, initlocation, rooms, "monster", required=False)
+        if initlocation:
+            continue
+        # monster has to spawn to ever appear
+        spawns_in = description.get("spawns_in") or []
+        spawns_at = description.get("spawns_at", "always")
+        reason = None
+        if description.get("spawn_prob", 0) <= 0:
+            reason = "its spawn_prob is 0"
+        elif spawns_at not in DAYTIMES:
+            reason = "spawns_at is {}".format(repr(spawns_at))
+        else:
+            for pattern in spawns_in:
+                if pattern not in found:
+                    found[pattern] = pattern in allids
+            if not any(found[p] for p in spawns_in):
+                reason = "no room ID contains any of {}".format(repr(spawns_in))
+        if reason:
+            report.add(WARNING, "never-spawns", ID,
+                "monster has no initlocation and never spawns because " + reason)
+
+
+def _check_reachable(report, edges, start):
+    if start not in edges:
+        report.add(ERROR, "missing-start", start, "start room does not exist")
+        return
+    seen = {start}
+    queue = deque([start])
+    while queue:
+        for target in edges[queue.popleft()]:
+            if target not in seen:
+                seen.add(target)
+                queue.append(target)
+    for ID in edges:
+        if ID not in seen:
+            report.add(WARNING, "unreachable-room", ID,
+                "room can't be reached from {}".format(repr(start)))
+
+
+def check_parser(parser):
+    """
+    check if every verb a :class:`textgame.parser.Parser` knows has an action
+
+    :rtype: :class:`textgame.diagnostics.Report`
+    """
+    report = Report()
+    actions = set(parser._dispatch) | set(parser.actionmap)
+    for verb in sorted(set(parser.legal_verbs.values())):
+        if verb not in actions:
+            report.add(ERROR, "verb-without-action", verb,
+                "{} is a legal verb but has no action".format(repr(verb)))
+    return report
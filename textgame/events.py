@@ -0,0 +1,135 @@
+"""
+textgame.events
+=====================
+
+This module contains :class:`textgame.events.EventBus`. Instead of a ``special_func``
+that checks the player's state every time a room is entered, handlers subscribe to
+the events they care about, optionally only for one room, item or monster:
+
+.. code-block:: python
+
+   bus = textgame.events.EventBus().attach(world)
+
+   def guard_notices(event):
+       return "The guard frowns at the {}.".format(event.data["item"])
+
+   bus.subscribe(textgame.events.ITEM_TAKEN, guard_notices, key="hall")
+   bus.subscribe(textgame.events.ROOM_ENTERED, lambda e: "It's cold.", key="cellar")
+   bus.subscribe(textgame.events.MONSTER_KILLED, count_kills)
+
+Handlers get a :class:`textgame.events.GameEvent`. The events and the keys they can
+be subscribed to:
+
+- ``ROOM_ENTERED`` (room) from :func:`textgame.player.Player.go`
+- ``ITEM_TAKEN``, ``ITEM_DROPPED`` (item, room) from :func:`textgame.player.Player.take` and ``drop``
+- ``MONSTER_SPAWNED`` (monster, room) from :func:`textgame.world.World.spawn_monster`
+- ``MONSTER_KILLED`` (monster, room) from :func:`textgame.world.World.manage_fight`
+- ``NIGHT_FELL`` from :func:`textgame.world.World.manage_daylight`
+- ``TICK`` every time the world's time increases
+
+If a handler returns a string, it's added to the output of the command, except for
+``MONSTER_SPAWNED`` and ``NIGHT_FELL`` (there's no command output to add it to).
+
+Events nobody subscribed to cost one set lookup. The bus is not saved with the
+game. After :func:`textgame.parser.Parser.load_game`, attach it to the loaded world
+again.
+"""
+
+from collections import namedtuple
+import logging
+logger = logging.getLogger("textgame.events")
+logger.addHandler(logging.NullHandler())
+
+
+ROOM_ENTERED = "room_entered"
+ITEM_TAKEN = "item_taken"
+ITEM_DROPPED = "item_dropped"
+MONSTER_SPAWNED = "monster_spawned"
+MONSTER_KILLED = "monster_killed"
+NIGHT_FELL = "night_fell"
+TICK = "tick"
+EVENT_TYPES = (ROOM_ENTERED, ITEM_TAKEN, ITEM_DROPPED, MONSTER_SPAWNED, MONSTER_KILLED, NIGHT_FELL, TICK)
+
+
+GameEvent = namedtuple("GameEvent", ["type", "world", "player", "data"])
+GameEvent.__doc__ = """
+an event of :class:`textgame.events.EventBus`. ``player`` is ``None`` for events that
+don't concern a player and ``data`` is a dict like ``{"room": ..., "item": ...}`` with IDs
+"""
+
+
+class EventBus:
+    """
+    handlers indexed by event type and key
+    """
+
+    def __init__(self):
+        # (type, key) -> tuple of handlers, key None means all keys
+        self.handlers = {}
+        # types that have at least one handler, checked before building an event
+        self.active = set()
+
+
+    def attach(self, world):
+        """
+        let ``world`` and its players emit their events to this bus
+        """
+        world.events = self
+        return self
+
+
+    @staticmethod
+    def detach(world):
+        world.events = None
+
+
+    def subscribe(self, type, handler, key=None):
+        """
+        call ``handler(event)`` on events of ``type``
+
+        :param key: only call it for events that concern this room, item or monster ID
+        :returns: a handle for :func:`textgame.events.EventBus.unsubscribe`
+        """
+        if type not in EVENT_TYPES:
+            raise ValueError("unknown event type {}, must be one of {}".format(repr(type), EVENT_TYPES))
+        # tuples are replaced, not changed, so emitting never sees a half updated list
+        self.handlers[(type, key)] = self.handlers.get((type, key), ()) + (handler,)
+        self.active.add(type)
+        return (type, key, handler)
+
+
+    def unsubscribe(self, handle):
+        type, key, handler = handle
+        handlers = list(self.handlers.get((type, key), ()))
+        if handler in handlers:
+            handlers.remove(handler)
+        if handlers:
+            self.handlers[(type, key)] = tuple(handlers)
+        else:
+            self.handlers.pop((type, key), None)
+            if not any(t == type for t,k in self.handlers):
+                self.active.discard(type)
+
+
+    def emit(self, type, world, player, keys=(), **data):
+        """
+        call the handlers of ``type`` that subscribed to all keys or to one of ``keys``
+
+        :returns: the strings returned by the handlers, joined by newlines
+        """
+        if type not in self.active:
+            return ""
+        handlers = self.handlers.get((type, None), ())
+        for key in keys:
+            handlers += self.handlers.get((type, key), ())
+        if not handlers:
+            return ""
+        event = GameEvent(type, world, player, data)
+        msg = []
+        for handler in handlers:
+            result = handler(event)
+            if result:
+                msg.append(result)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("{} handlers of {} called".format(len(handlers), type))
+        return "\n".join(msg)
@@ -0,0 +1,196 @@
+"""
+textgame.generator
+=====================
+
+This module contains :class:`textgame.generator.WorldGenerator` that builds random,
+but reproducible worlds of any size. The generated worlds are playable by construction:
+
+- every room can be reached from the first room
+- the key to every locked door lies in a room that can be reached without passing this door
+- there is a lamp (see :class:`textgame.globals.LIGHT`) that can be reached without
+  entering a dark room
+- room IDs start with a region prefix, so monsters can spawn in whole regions with ``spawns_in``
+
+.. code-block:: python
+
+   generator = textgame.generator.WorldGenerator(100000, seed=42, regions=["field", "forest"])
+   # stream the rooms directly into a world
+   world = generator.build()
+   # or get the description dicts that World accepts
+   rooms, items, monsters = textgame.generator.WorldGenerator(100, seed=42).descriptions()
+
+Rooms are laid out on a grid and connected to their northern and western neighbours.
+The generator only keeps two rows of this grid in memory, plus one byte per room to
+remember which rooms are dark. Keys, the lamp and monsters are collected in
+``generator.items`` and ``generator.monsters``.
+"""
+
+from collections import OrderedDict
+import random
+import logging
+logger = logging.getLogger("textgame.generator")
+logger.addHandler(logging.NullHandler())
+
+from textgame.world import World
+from textgame.globals import LIGHT
+
+
+class WorldGenerator:
+    """
+    :param n_rooms: number of rooms
+    :param seed: the same seed and parameters always give the same world
+    :param regions: list of prefixes for the room IDs. The rooms get split in blocks,
+        one for each region
+    :param width: width of the grid, by default the grid is roughly quadratic
+    :param loop_density: probability for an additional door that creates a loop
+    :param locked_density: probability that the door to a new room is locked
+    :param dark_density: probability that a room is dark
+    :param monster_density: number of monsters per room
+    :param spawn_ratio: fraction of monsters that spawn randomly, the others sit
+        in fixed rooms
+    """
+
+    def __init__(self, n_rooms, seed=0, regions=("field",), width=None, loop_density=0.2,
+                 locked_density=0.05, dark_density=0.05, monster_density=0.01, spawn_ratio=0.5):
+        if n_rooms < 1:
+            raise ValueError("a world needs at least one room")
+        self.n_rooms = n_rooms
+        self.seed = seed
+        self.regions = list(regions)
+        self.width = width if width else max(1, int(n_rooms ** 0.5))
+        self.loop_density = loop_density
+        self.locked_density = locked_density
+        self.dark_density = dark_density
+        self.monster_density = monster_density
+        self.spawn_ratio = spawn_ratio
+        # get filled by iter_rooms
+        self.items = OrderedDict()
+        self.monsters = OrderedDict()
+
+
+    def room_id(self, index):
+        """return the ID of the room with the given index"""
+        region = self.regions[index * len(self.regions) // self.n_rooms]
+        return region + "_" + str(index)
+
+
+    def iter_rooms(self):
+        """
+        generator of ``(ID, description)`` tuples, see :func:`textgame.world.World.add_rooms`.
+        While iterating, ``self.items`` and ``self.monsters`` get filled with the
+        descriptions of keys, the lamp and the monsters
+        """
+        rng = random.Random(self.seed)
+        n, width = self.n_rooms, self.width
+        self.items.clear()
+        self.monsters.clear()
+        dark = bytearray(n)
+        # the lamp lies in one of the first rooms, darkness only starts after it
+        lamp_index = rng.randrange(min(n, width))
+        self.items[LIGHT[0]] = {
+            "description": "A lamp stands on the ground.",
+            "name": LIGHT[0],
+            "initlocation": self.room_id(lamp_index),
+        }
+
+        regions, n_regions = self.regions, len(self.regions)
+        previous_row = []
+        for row_start in range(0, n, width):
+            row = []
+            for index in range(row_start, min(n, row_start+width)):
+                ID = regions[index * n_regions // n] + "_" + str(index)
+                room = {
+                    "descript": "You are in " + ID + ". Paths lead away in several directions.",
+                    "sdescript": "You are in " + ID + ".",
+                    "doors": {},
+                }
+                row.append((ID, room))
+                if index > lamp_index and rng.random() < self.dark_density:
+                    dark[index] = 1
+                    room["dark"] = {"now": True, "always": True}
+                if index == 0:
+                    continue
+
+                west = row[-2] if index > row_start else None
+                north = previous_row[index-row_start] if previous_row else None
+                if west and north:
+                    parent = west if rng.random() < 0.5 else north
+                else:
+                    parent = west or north
+                for other, direction, opposite in ((west, "east", "west"), (north, "south", "north")):
+                    if not other or (other is not parent and rng.random() >= self.loop_density):
+                        continue
+                    other[1]["doors"][direction] = ID
+                    room["doors"][opposite] = other[0]
+                    if other is parent and rng.random() < self.locked_density:
+                        self._lock(other[1], direction, index, dark, rng)
+
+                self._place_monster(index, ID, dark, rng)
+
+            for room in previous_row:
+                yield room
+            previous_row = row
+        for room in previous_row:
+            yield room
+
+
+    def _lock(self, room, direction, index, dark, rng):
+        """lock the door and put the key in a lit room that comes before ``index``"""
+        keyroom = rng.randrange(index)
+        while dark[keyroom]:
+            keyroom = rng.randrange(index)
+        keyid = "key_{}".format(index)
+        room.setdefault("locked", {})[direction] = {"closed": True, "key": keyid}
+        self.items[keyid] = {
+            "description": "A small key lies around.",
+            "name": keyid,
+            "key": keyid,
+            "initlocation": self.room_id(keyroom),
+        }
+
+
+    def _place_monster(self, index, ID, dark, rng):
+        if rng.random() >= self.monster_density:
+            return
+        monsterid = "monster_{}".format(index)
+        description = {
+            "description": "A monster glares at you.",
+            "name": monsterid,
+            "deaddescript": "A dead monster lies on the ground.",
+            "strength": rng.random() * 0.5,
+        }
+        if rng.random() < self.spawn_ratio:
+            description.update({
+                "spawns_in": [ID.rsplit("_", 1)[0]],
+                "spawns_at": rng.choice(["day", "night", "always"]),
+                "spawn_prob": rng.random() * 0.1,
+            })
+        elif not dark[index] and index:
+            description["initlocation"] = ID
+            description["ignoretext"] = "The monster ignores you."
+        else:
+            return
+        self.monsters[monsterid] = description
+
+
+    def descriptions(self):
+        """
+        return ``(rooms, items, monsters)`` dicts that can be passed to :class:`textgame.world.World`
+        """
+        rooms = OrderedDict(self.iter_rooms())
+        return rooms, OrderedDict(self.items), OrderedDict(self.monsters)
+
+
+    def build(self, world=None):
+        """
+        stream the generated rooms into ``world`` (a new :class:`textgame.world.World`
+        with this generator's seed if not given) and return it
+        """
+        if world is None:
+            world = World(seed=self.seed)
+        world.add_rooms(self.iter_rooms())
+        world.create_items(self.items)
+        world.create_items(self.monsters, tag="monsters")
+        world.put_items_in_place()
+        world.put_monsters_in_place()
+        return world
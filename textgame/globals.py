@@ -55,18 +55,23 @@ ACTION.ALREADY_OPEN = "The door is already open."
 ACTION.ALREADY_CLOSED = "The door is already closed."
 ACTION.FAIL_OPEN = "None of your keys fit."
 ACTION.NOW_OPEN = "You take the key and {} the door."
+ACTION.NOT_CARRYING = "You don't have a {}."
 
 INFO = namedtuple("INFO", [])
 INFO.HINT_WARNING = "I have a hint for you, but it will cost you {} points. Do you want to hear it?"
 INFO.NIGHT_COMES_IN = "The sun has set. Night comes in."
 INFO.NO_HINT = "I don't have any special hints for you."
 INFO.NOT_UNDERSTOOD = "I don't understand that."
+INFO.DID_YOU_MEAN = "I don't understand that. Did you mean {}?"
 INFO.NOTHING = "Nothing happens."
 INFO.SCORE = "Your score is {}."
-INFO.TOO_MANY_ARGUMENTS = "Please restrict your command to two words."
+INFO.RANK = "You are on rank {} of {}."
+INFO.TOO_MANY_ARGUMENTS = "I don't know which thing you mean."
+INFO.WHICH_ONE = "There's more than one {} here, which one do you mean?"
 INFO.YES_NO = "Please answer yes or no."
 INFO.SAVED = "Game saved!"
 INFO.LOADED = "Game loaded!"
+INFO.TOO_SLOW = "Nothing happens. Something seems to be stuck."
 
 
 FIGHTING = namedtuple("FIGHTING", [])
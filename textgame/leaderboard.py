@@ -0,0 +1,356 @@
+"""
+textgame.leaderboard
+=====================
+
+This module contains :class:`textgame.leaderboard.Leaderboard` that ranks the
+scores of many players across sessions. Players that joined a leaderboard report
+every change of their score (see :func:`textgame.player.Player.add_score`):
+
+.. code-block:: python
+
+   board = textgame.leaderboard.Leaderboard("scores.sqlite")
+   board.join(player, "alice")
+   # ... play ...
+   board.top(10)          # [("bob", 120), ("alice", 95), ...]
+   board.rank("alice")    # 2
+   board.around("alice")  # the players just before and after alice
+   board.close()
+
+The scores are kept in a sorted list of buckets with a Fenwick tree over their
+sizes, so updates, ranks and the player at a given rank take ``O(log n)`` steps
+(plus moving at most a bucket of keys in memory). Changed scores are written to SQLite in batches,
+:func:`textgame.leaderboard.Leaderboard.flush` writes them right away.
+
+The leaderboard is not saved with the game. After
+:func:`textgame.parser.Parser.load_game`, join the loaded player again.
+"""
+
+from bisect import bisect_left, insort
+import sqlite3
+import threading
+import weakref
+import logging
+logger = logging.getLogger("textgame.leaderboard")
+logger.addHandler(logging.NullHandler())
+
+
+class SortedKeys:
+    """
+    sorted list of unique keys with fast insertion, removal, rank and index lookup.
+    The keys are kept in sorted buckets of about ``load`` keys, a Fenwick tree over
+    the sizes of the buckets finds the bucket of an index in ``O(log n)``
+
+    :param load: size of the buckets, bigger buckets mean less overhead but slower insertion
+    """
+
+    def __init__(self, keys=(), load=512):
+        self.load = load
+        keys = sorted(keys)
+        self.buckets = [keys[i:i+load] for i in range(0, len(keys), load)]
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self.size = len(keys)
+        self._build_tree()
+
+
+    def _build_tree(self):
+        # Fenwick tree of the bucket sizes, tree[i] covers buckets (i & (i+1)) to i
+        tree = [len(bucket) for bucket in self.buckets]
+        for i in range(len(tree)):
+            parent = i | (i + 1)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+
+    def _tree_add(self, i, n):
+        tree = self.tree
+        while i < len(tree):
+            tree[i] += n
+            i |= i + 1
+
+
+    def _tree_prefix(self, i):
+        # number of keys in the buckets before bucket i
+        tree = self.tree
+        total = 0
+        while i > 0:
+            total += tree[i-1]
+            i &= i - 1
+        return total
+
+
+    def _tree_find(self, index):
+        # bucket that contains index and the position in it
+        tree = self.tree
+        bucket = 0
+        step = 1 << (len(tree).bit_length())
+        while step:
+            following = bucket + step
+            if following <= len(tree) and tree[following-1] <= index:
+                index -= tree[following-1]
+                bucket = following
+            step >>= 1
+        return bucket, index
+
+
+    def __len__(self):
+        return self.size
+
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            for key in bucket:
+                yield key
+
+
+    def insert(self, key):
+        maxes = self.maxes
+        if not maxes:
+            self.buckets.append([key])
+            maxes.append(key)
+            self.size = 1
+            self._build_tree()
+            return
+        i = bisect_left(maxes, key)
+        if i == len(maxes):
+            i -= 1
+            self.buckets[i].append(key)
+            maxes[i] = key
+        else:
+            insort(self.buckets[i], key)
+        self.size += 1
+        bucket = self.buckets[i]
+        if len(bucket) > 2 * self.load:
+            half = len(bucket) // 2
+            self.buckets[i:i+1] = [bucket[:half], bucket[half:]]
+            maxes[i:i+1] = [bucket[half-1], bucket[-1]]
+            self._build_tree()
+        else:
+            self._tree_add(i, 1)
+
+
+    def _locate(self, key):
+        i = bisect_left(self.maxes, key)
+        if i < len(self.maxes):
+            bucket = self.buckets[i]
+            j = bisect_left(bucket, key)
+            if bucket[j] == key:
+                return i, j
+        raise KeyError(key)
+
+
+    def remove(self, key):
+        """
+        :raises KeyError: if ``key`` is not in the list
+        """
+        i, j = self._locate(key)
+        bucket = self.buckets[i]
+        del bucket[j]
+        self.size -= 1
+        if not bucket:
+            del self.buckets[i]
+            del self.maxes[i]
+            self._build_tree()
+            return
+        self.maxes[i] = bucket[-1]
+        self._tree_add(i, -1)
+
+
+    def index(self, key):
+        """
+        return the index of ``key``
+
+        :raises KeyError: if ``key`` is not in the list
+        """
+        i, j = self._locate(key)
+        return self._tree_prefix(i) + j
+
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("index out of range")
+        i, j = self._tree_find(index)
+        return self.buckets[i][j]
+
+
+    def slice(self, start, stop):
+        """
+        return the keys from index ``start`` to ``stop`` (exclusive)
+        """
+        start = max(start, 0)
+        stop = min(stop, self.size)
+        if start >= stop:
+            return []
+        i, j = self._tree_find(start)
+        result = []
+        while len(result) < stop - start:
+            result.extend(self.buckets[i][j:j + stop - start - len(result)])
+            i, j = i + 1, 0
+        return result
+
+
+class Leaderboard:
+    """
+    :param path: SQLite database to store the scores in, ``None`` to keep them in memory only
+    :param flush_every: write changed scores after this many updates
+    """
+
+    def __init__(self, path=None, flush_every=1000):
+        self.path = path
+        self.flush_every = flush_every
+        # name -> score
+        self.scores = {}
+        # keys are (-score, name), so the best player comes first
+        self.ranking = SortedKeys()
+        # name -> score of the changes that are not written yet, None if removed
+        self.pending = {}
+        # player -> name
+        self.players = weakref.WeakKeyDictionary()
+        self._lock = threading.RLock()
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            # a batch of scores doesn't need to wait for the disk, losing the
+            # last batch on a power cut is fine for a leaderboard
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS scores (name TEXT PRIMARY KEY, score INTEGER NOT NULL)")
+            self.scores.update(self.db.execute("SELECT name, score FROM scores"))
+            self.ranking = SortedKeys((-score, name) for name, score in self.scores.items())
+            logger.info("loaded {} scores from {}".format(len(self.scores), path))
+
+
+    def __len__(self):
+        return len(self.scores)
+
+
+    def __contains__(self, name):
+        return name in self.scores
+
+
+    def submit(self, name, score):
+        """
+        set the score of ``name``
+        """
+        with self._lock:
+            old = self.scores.get(name)
+            if old == score:
+                return
+            if old is not None:
+                self.ranking.remove((-old, name))
+            self.scores[name] = score
+            self.ranking.insert((-score, name))
+            self._changed(name, score)
+
+
+    def add(self, name, points):
+        """
+        add ``points`` to the score of ``name``
+        """
+        with self._lock:
+            self.submit(name, self.scores.get(name, 0) + points)
+
+
+    def remove(self, name):
+        with self._lock:
+            score = self.scores.pop(name, None)
+            if score is None:
+                return
+            self.ranking.remove((-score, name))
+            self._changed(name, None)
+
+
+    def _changed(self, name, score):
+        self.pending[name] = score
+        if self.db is not None and len(self.pending) >= self.flush_every:
+            self.flush()
+
+
+    def score(self, name):
+        return self.scores.get(name)
+
+
+    def rank(self, name):
+        """
+        return the rank of ``name`` (1 is the best) or ``None`` if it's not on the leaderboard
+        """
+        with self._lock:
+            score = self.scores.get(name)
+            if score is None:
+                return None
+            return self.ranking.index((-score, name)) + 1
+
+
+    def top(self, k=10):
+        """
+        return a list of the ``k`` best ``(name, score)`` tuples
+        """
+        with self._lock:
+            return [(name, -score) for score, name in self.ranking.slice(0, k)]
+
+
+    def around(self, name, radius=5):
+        """
+        return the ``(name, score)`` tuples of the ``radius`` players before and after ``name``
+        """
+        with self._lock:
+            rank = self.rank(name)
+            if rank is None:
+                return []
+            keys = self.ranking.slice(rank - 1 - radius, rank + radius)
+            return [(n, -score) for score, n in keys]
+
+
+    def join(self, player, name):
+        """
+        report the score of ``player`` as ``name`` from now on
+        """
+        with self._lock:
+            self.players[player] = name
+            player.leaderboard = self
+            self.submit(name, player.score)
+
+
+    def leave(self, player):
+        """
+        stop reporting the score of ``player``, the score stays on the leaderboard
+        """
+        with self._lock:
+            self.players.pop(player, None)
+        if player.leaderboard is self:
+            player.leaderboard = None
+
+
+    def player_scored(self, player):
+        """
+        called by :func:`textgame.player.Player.add_score`
+        """
+        name = self.players.get(player)
+        if name is not None:
+            self.submit(name, player.score)
+
+
+    def flush(self):
+        """
+        write the changed scores to the database
+        """
+        with self._lock:
+            if self.db is None or not self.pending:
+                return
+            removed = [(name,) for name, score in self.pending.items() if score is None]
+            changed = [(name, score) for name, score in self.pending.items() if score is not None]
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO scores (name, score) VALUES (?, ?)", changed)
+                self.db.executemany("DELETE FROM scores WHERE name = ?", removed)
+            logger.debug("wrote {} scores to {}".format(len(self.pending), self.path))
+            self.pending.clear()
+
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            if self.db is not None:
+                self.db.close()
+                self.db = None
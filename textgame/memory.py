@@ -0,0 +1,105 @@
+"""
+textgame.memory
+=====================
+
+This module measures the pauses of Python's garbage collector. Big worlds consist
+of millions of objects and a full collection has to look at all of them, which
+shows up as latency spikes on commands that have nothing to do with it.
+
+.. code-block:: python
+
+   import textgame.memory
+
+   with textgame.memory.GCMonitor() as monitor:
+       # ... play ...
+   print(monitor.summary())
+
+   # pauses are much shorter if the world isn't built of cycles and isn't looked at anymore
+   world = textgame.world.World(rooms=myrooms, door_ids=True)
+   world.freeze()
+
+If :mod:`textgame.metrics` is enabled, every pause is also recorded in the histogram
+``gc_pause_seconds`` per generation.
+"""
+
+from time import perf_counter
+import gc
+import logging
+logger = logging.getLogger("textgame.memory")
+logger.addHandler(logging.NullHandler())
+
+from textgame import metrics
+from textgame.metrics import Histogram
+
+
+class GCMonitor:
+    """
+    records the duration of every garbage collection while it's started,
+    see :data:`gc.callbacks`
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.max = {}
+        self._start = None
+
+
+    def __call__(self, phase, info):
+        if phase == "start":
+            self._start = perf_counter()
+            return
+        if self._start is None:
+            return
+        duration = perf_counter() - self._start
+        self._start = None
+        generation = info["generation"]
+        histogram = self.histograms.get(generation)
+        if histogram is None:
+            histogram = self.histograms[generation] = Histogram()
+        histogram.observe(duration)
+        if duration > self.max.get(generation, 0):
+            self.max[generation] = duration
+        if metrics.registry is not None:
+            metrics.registry.observe("gc_pause_seconds", str(generation), duration)
+
+
+    def start(self):
+        if self not in gc.callbacks:
+            gc.callbacks.append(self)
+        return self
+
+
+    def stop(self):
+        if self in gc.callbacks:
+            gc.callbacks.remove(self)
+        self._start = None
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+    def reset(self):
+        self.histograms.clear()
+        self.max.clear()
+
+
+    def summary(self):
+        """
+        return ``{generation: {"count", "total", "max", "p99"}}`` with times in seconds.
+        ``p99`` is the upper bound of the histogram bucket, see
+        :func:`textgame.metrics.Histogram.quantile`
+        """
+        return {
+            generation: {
+                "count": h.count,
+                "total": h.sum,
+                "max": self.max[generation],
+                "p99": h.quantile(0.99),
+            }
+            for generation,h in sorted(self.histograms.items())
+        }
@@ -0,0 +1,215 @@
+"""
+textgame.metrics
+=====================
+
+Opt-in counters and latency histograms for the game's hot paths. Metrics are
+disabled by default, in which case the instrumented code only checks
+``textgame.metrics.registry is None``: no clocks are read and no dicts get updated.
+
+.. code-block:: python
+
+   import textgame.metrics
+
+   metrics = textgame.metrics.enable()
+   # ... play ...
+   print(metrics.to_prometheus())
+   snapshot = metrics.snapshot()
+   textgame.metrics.disable()
+
+The following metrics are recorded:
+
+- ``commands`` (counter) and ``command_seconds`` (histogram) per verb in :func:`textgame.parser.Parser.understand`
+- ``action_seconds`` (histogram) per player method decorated with :func:`textgame.player.action_method`
+- ``update_seconds`` (histogram) for :func:`textgame.world.World.update`
+- ``special_func_seconds`` (histogram) per room in :func:`textgame.room.Room.check_restrictions`
+- ``spawns`` and ``fight_rounds`` (counters) per monster
+- ``gc_pause_seconds`` (histogram) per generation while a :class:`textgame.memory.GCMonitor` runs
+- ``watchdog_overruns`` (counter) per room or verb that ran over its budget, see :mod:`textgame.watchdog`
+"""
+
+from bisect import bisect_left
+import logging
+logger = logging.getLogger("textgame.metrics")
+logger.addHandler(logging.NullHandler())
+
+
+#: the active :class:`textgame.metrics.Metrics` or ``None`` if metrics are disabled
+registry = None
+
+#: upper bounds of the histogram buckets in seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# names of the labels of the predefined metrics
+LABELS = {
+    "commands": "verb",
+    "command_seconds": "verb",
+    "action_seconds": "method",
+    "update_seconds": "",
+    "special_func_seconds": "room",
+    "spawns": "monster",
+    "fight_rounds": "monster",
+    "gc_pause_seconds": "generation",
+    "watchdog_overruns": "hook",
+}
+
+
+def enable(metrics=None):
+    """
+    start recording metrics into ``metrics`` (a new :class:`textgame.metrics.Metrics`
+    if not given) and return it
+    """
+    global registry
+    registry = metrics if metrics is not None else Metrics()
+    logger.info("metrics enabled")
+    return registry
+
+
+def disable():
+    """
+    stop recording metrics
+    """
+    global registry
+    registry = None
+    logger.info("metrics disabled")
+
+
+class Histogram:
+    """
+    counts observations in fixed buckets
+
+    :param buckets: sorted upper bounds of the buckets
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # the last bucket is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+    def quantile(self, q):
+        """
+        return the upper bound of the bucket that contains the ``q``-quantile
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+    def as_dict(self):
+        return {
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+class Metrics:
+    """
+    holds all counters and histograms, each metric maps a label value (eg. the verb)
+    to a number or a :class:`textgame.metrics.Histogram`
+
+    :param buckets: bucket bounds for all histograms
+    :param prefix: prefix for metric names in :func:`textgame.metrics.Metrics.to_prometheus`
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix="textgame_"):
+        self.buckets = buckets
+        self.prefix = prefix
+        self.counters = {}
+        self.histograms = {}
+
+
+    def inc(self, name, label="", n=1):
+        """
+        increase counter ``name`` for ``label`` by ``n``
+        """
+        counter = self.counters.get(name)
+        if counter is None:
+            counter = self.counters[name] = {}
+        counter[label] = counter.get(label, 0) + n
+
+
+    def observe(self, name, label, value):
+        """
+        add ``value`` to histogram ``name`` for ``label``
+        """
+        histograms = self.histograms.get(name)
+        if histograms is None:
+            histograms = self.histograms[name] = {}
+        histogram = histograms.get(label)
+        if histogram is None:
+            histogram = histograms[label] = Histogram(self.buckets)
+        histogram.observe(value)
+
+
+    def reset(self):
+        self.counters.clear()
+        self.histograms.clear()
+
+
+    def snapshot(self):
+        """
+        return all metrics as a dict of plain python objects
+        """
+        return {
+            "counters": {name: dict(values) for name,values in self.counters.items()},
+            "histograms": {
+                name: {label: h.as_dict() for label,h in values.items()}
+                for name,values in self.histograms.items()
+            },
+        }
+
+
+    def to_prometheus(self):
+        """
+        return all metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for name, values in sorted(self.counters.items()):
+            fullname = self.prefix + name + "_total"
+            lines.append("# TYPE {} counter".format(fullname))
+            for label, value in sorted(values.items()):
+                lines.append("{}{} {}".format(fullname, self._labels(name, label), value))
+        for name, values in sorted(self.histograms.items()):
+            fullname = self.prefix + name
+            lines.append("# TYPE {} histogram".format(fullname))
+            for label, h in sorted(values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), h.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append("{}_bucket{} {}".format(
+                        fullname, self._labels(name, label, le=le), cumulative))
+                lines.append("{}_sum{} {}".format(fullname, self._labels(name, label), h.sum))
+                lines.append("{}_count{} {}".format(fullname, self._labels(name, label), h.count))
+        return "\n".join(lines) + "\n"
+
+
+    @staticmethod
+    def _labels(name, label, **extra):
+        pairs = []
+        labelname = LABELS.get(name, "label")
+        if labelname:
+            pairs.append((labelname, label))
+        pairs.extend(extra.items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(
+            '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+            for k,v in pairs
+        ) + "}"
@@ -0,0 +1,325 @@
+"""
+textgame.migration
+=====================
+
+This module updates running games to a new version of the world's content. Compute
+the difference between two versions of the description dicts once, then apply it to
+every running :class:`textgame.world.World`:
+
+.. code-block:: python
+
+   patch = textgame.migration.diff(
+       {"rooms": oldrooms, "items": olditems, "monsters": oldmonsters},
+       {"rooms": newrooms, "items": newitems, "monsters": newmonsters},
+       new_version="1.1"
+   )
+   # the patch can be sent around as JSON
+   patch = textgame.migration.WorldDiff.from_dict(json.loads(json.dumps(patch.as_dict())))
+
+   for session in sessions:
+       textgame.migration.apply(patch, session.world, players=[session.player], fallback="field_0")
+
+Applying a patch only touches the rooms, items and monsters that changed. The state of
+the game is kept: players stay where they are and keep their inventory, monsters keep
+their status and doors that were opened stay open unless the patch changes their lock.
+Players in rooms that get removed are moved to the room ``fallback``.
+"""
+
+from collections import OrderedDict
+import inspect
+import logging
+logger = logging.getLogger("textgame.migration")
+logger.addHandler(logging.NullHandler())
+
+from textgame.room import Room
+from textgame.movable import Item, Weapon, Monster
+from textgame.globals import DIRECTIONS, MOVING
+
+
+CATEGORIES = ("rooms", "items", "weapons", "monsters")
+
+# default values of the room description fields
+ROOM_DEFAULTS = {
+    name: parameter.default
+    for name,parameter in inspect.signature(Room.fill_info).parameters.items()
+    if name != "self"
+}
+
+# description key -> attribute of Room
+ROOM_ATTRIBUTES = {"descript": "description", "sdescript": "shortdescription"}
+
+# attributes of items and monsters a patch may change, status and history stay untouched
+ITEM_ATTRIBUTES = ("description", "name", "takable", "value", "key", "initlocation")
+MONSTER_ATTRIBUTES = ("name", "deaddescript", "initlocation", "strength", "spawns_in",
+                      "spawns_at", "ignoretext")
+
+CLASSES = {"items": Item, "weapons": Weapon, "monsters": Monster}
+
+
+class WorldDiff:
+    """
+    difference between two versions of a world. For every category (rooms, items,
+    weapons, monsters), ``added`` maps IDs to descriptions, ``removed`` is a list of IDs
+    and ``changed`` maps IDs to dicts of the fields that changed and their new values
+
+    :param old_version: version a world must have to apply this (``None`` to not check)
+    :param new_version: version of the world after applying this
+    """
+
+    def __init__(self, old_version=None, new_version=None):
+        self.old_version = old_version
+        self.new_version = new_version
+        self.added = {c: OrderedDict() for c in CATEGORIES}
+        self.removed = {c: [] for c in CATEGORIES}
+        self.changed = {c: OrderedDict() for c in CATEGORIES}
+
+
+    def __bool__(self):
+        return any(self.added[c] or self.removed[c] or self.changed[c] for c in CATEGORIES)
+
+
+    def summary(self):
+        """
+        return a string like "rooms: +1 -0 ~3, items: ..."
+        """
+        return ", ".join(
+            "{}: +{} -{} ~{}".format(c, len(self.added[c]), len(self.removed[c]), len(self.changed[c]))
+            for c in CATEGORIES
+        )
+
+
+    def as_dict(self):
+        return {
+            "old_version": self.old_version,
+            "new_version": self.new_version,
+            "added": self.added,
+            "removed": self.removed,
+            "changed": self.changed,
+        }
+
+
+    @classmethod
+    def from_dict(cls, data):
+        patch = cls(data.get("old_version"), data.get("new_version"))
+        for c in CATEGORIES:
+            patch.added[c].update(data["added"].get(c, {}))
+            patch.removed[c].extend(data["removed"].get(c, []))
+            patch.changed[c].update(data["changed"].get(c, {}))
+        return patch
+
+
+def diff(old, new, old_version=None, new_version=None):
+    """
+    compare two versions of a world
+
+    :param old: dict with the keys "rooms", "items", "weapons", "monsters" (all optional)
+        that map to the description dicts you'd pass to :class:`textgame.world.World`
+    :param new: the same for the new version
+    :rtype: :class:`textgame.migration.WorldDiff`
+    """
+    patch = WorldDiff(old_version, new_version)
+    for category in CATEGORIES:
+        before = old.get(category) or {}
+        after = new.get(category) or {}
+        for ID, description in after.items():
+            if ID not in before:
+                patch.added[category][ID] = description
+            elif description != before[ID]:
+                previous = before[ID] or {}
+                description = description or {}
+                changes = {}
+                for key in set(previous) | set(description):
+                    if previous.get(key, _MISSING) != description.get(key, _MISSING):
+                        changes[key] = description.get(key, _default(category, key))
+                if "locked" in changes and category == "rooms":
+                    # only keep the directions whose lock changed
+                    changes["locked"] = _changed_locks(previous.get("locked"), description.get("locked"))
+                patch.changed[category][ID] = changes
+        for ID in before:
+            if ID not in after:
+                patch.removed[category].append(ID)
+    logger.info("diff from {} to {}: {}".format(old_version, new_version, patch.summary()))
+    return patch
+
+
+_MISSING = object()
+
+
+def _changed_locks(before, after):
+    before, after = before or {}, after or {}
+    default = {"closed": False, "key": None}
+    return {
+        dir: after.get(dir, default) for dir in set(before) | set(after)
+        if before.get(dir, default) != after.get(dir, default)
+    }
+
+
+def _default(category, key):
+    if category == "rooms":
+        return ROOM_DEFAULTS.get(key)
+    parameters = inspect.signature(CLASSES[category]).parameters
+    return parameters[key].default if key in parameters else None
+
+
+def apply(patch, world, players=(), fallback=None):
+    """
+    apply a :class:`textgame.migration.WorldDiff` to a running world
+
+    :param patch: :class:`textgame.migration.WorldDiff`
+    :param world: :class:`textgame.world.World`
+    :param players: the :class:`textgame.player.Player` objects in this world
+    :param fallback: ID of the room where players go if their room gets removed
+    :returns: number of rooms, items and monsters that were touched
+    """
+    current = world.content_version
+    if patch.old_version is not None and current is not None and current != patch.old_version:
+        raise ValueError("patch is for version {} but the world has version {}".format(
+            patch.old_version, current))
+    removed_rooms = set(patch.removed["rooms"])
+    stranded = [p for p in players if p.location.id in removed_rooms]
+    if stranded and (fallback is None or fallback in removed_rooms or
+                     (fallback not in world.rooms and fallback not in patch.added["rooms"])):
+        raise ValueError("players are in rooms that get removed, a fallback room is needed")
+
+    # add new rooms first, doors of changed rooms may lead there
+    newdoors = {}
+    for ID, description in patch.added["rooms"].items():
+        description = dict(description or {})
+        newdoors[ID] = {k: description.pop(k, None) for k in ("doors", "hiddendoors")}
+        world.add_room(ID, description)
+    for ID, doors in newdoors.items():
+        _update_doors(world, world.rooms[ID], doors)
+    for ID, changes in patch.changed["rooms"].items():
+        room = world.rooms.get(ID)
+        if room is None:
+            logger.warning("can't change room {}, it's not in the world".format(ID))
+            continue
+        _update_room(world, room, changes)
+
+    touched = len(patch.added["rooms"]) + len(patch.changed["rooms"])
+    for category in ("items", "weapons", "monsters"):
+        touched += _update_things(patch, world, players, category)
+
+    for player in stranded:
+        player.location = world.rooms[fallback]
+        player.status["fighting"] = False
+        player.status["trapped"] = False
+    for player in players:
+        if player.oldlocation is not None and player.oldlocation.id in removed_rooms:
+            player.oldlocation = None
+    for ID in patch.removed["rooms"]:
+        if ID in world.rooms:
+            world.remove_room(ID)
+    touched += len(removed_rooms)
+
+    if patch.new_version is not None:
+        world.content_version = patch.new_version
+    logger.info("applied patch to version {}: {}".format(patch.new_version, patch.summary()))
+    return touched
+
+
+def _update_room(world, room, changes):
+    changes = dict(changes)
+    doors = {k: changes.pop(k) for k in ("doors", "hiddendoors") if k in changes}
+    _update_doors(world, room, doors, replace=True)
+    for key, value in changes.items():
+        if key == "dark":
+            value = dict(value) if value else {"now": False, "always": False}
+            if world.daytime == "night":
+                # it's still night
+                value["always"] = True
+            room.dark = value
+        elif key in ("errors", "dir_descriptions"):
+            default = MOVING.FAIL_CANT_GO if key == "errors" else ""
+            table = {dir: default for dir in DIRECTIONS}
+            table.update(value or {})
+            setattr(room, key, table)
+        elif key == "locked":
+            # only the locks that changed, the others may have been opened by the player
+            for dir, lock in (value or {}).items():
+                room.locked[dir] = dict(lock)
+        elif key in ROOM_DEFAULTS:
+            setattr(room, ROOM_ATTRIBUTES.get(key, key), value)
+        else:
+            logger.warning("rooms don't have a field {}".format(repr(key)))
+
+
+def _update_doors(world, room, doors, replace=False):
+    for key, hidden in (("doors", False), ("hiddendoors", True)):
+        if key not in doors:
+            continue
+        new = doors[key] or {}
+        current = room.hiddendoors if hidden else room.doors
+        if replace:
+            for dir in list(current):
+                if current[dir] is not None and dir not in new:
+                    world.remove_door(room.id, dir, hidden=hidden)
+        for dir, target in new.items():
+            existing = world.door_target(room, dir, hidden)
+            if existing is None or existing.id != target:
+                world.add_door(room.id, dir, target, hidden=hidden)
+
+
+def _update_things(patch, world, players, category):
+    """add, change and remove items, weapons or monsters, return how many were touched"""
+    table = world.monsters if category == "monsters" else world.items
+    cls = CLASSES[category]
+    touched = 0
+    for ID in patch.removed[category]:
+        thing = table.pop(ID, None)
+        if thing is not None:
+            _take_out(world, players, thing, category)
+            touched += 1
+    for ID, changes in patch.changed[category].items():
+        thing = table.get(ID)
+        if thing is None:
+            logger.warning("can't change {} {}, it's not in the world".format(category, ID))
+            continue
+        attributes = MONSTER_ATTRIBUTES if category == "monsters" else ITEM_ATTRIBUTES
+        for key, value in changes.items():
+            if key in attributes:
+                setattr(thing, key, value)
+            elif category == "monsters" and key == "description":
+                # dead monsters keep showing their deaddescript
+                if thing.status["alive"]:
+                    thing.description = value
+            elif category == "monsters" and key == "spawn_prob":
+                if thing.status["alive"]:
+                    thing.spawn_prob = value
+            elif key == "status" and category == "monsters":
+                logger.info("not changing the status of monster {}, it's game state".format(ID))
+            elif key != "ID":
+                logger.warning("{} don't have a field {}".format(category, repr(key)))
+        touched += 1
+    for ID, description in patch.added[category].items():
+        thing = table[ID] = cls(**description)
+        room = world.rooms.get(thing.initlocation)
+        if room is not None:
+            if category == "monsters":
+                room.add_monster(thing)
+            else:
+                room.add_item(thing)
+        elif category != "monsters" or thing.initlocation:
+            logger.warning("{}'s initlocation ({}) could not be found".format(ID, repr(thing.initlocation)))
+        touched += 1
+    return touched
+
+
+def _take_out(world, players, thing, category):
+    # most things are still where they started, else look everywhere
+    room = world.rooms.get(thing.initlocation)
+    places = []
+    if room is not None:
+        places.append(room)
+    places.extend(p for p in players)
+    places.extend(world.rooms.values())
+    for place in places:
+        if hasattr(place, "inventory"):
+            containers = [place.inventory]
+        else:
+            # dead monsters lie around as items
+            containers = [place.items, place.monsters]
+        for container in containers:
+            if container.get(thing.id) is thing:
+                del container[thing.id]
+                return
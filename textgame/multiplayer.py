@@ -0,0 +1,225 @@
+"""
+textgame.multiplayer
+=====================
+
+This module contains :class:`textgame.multiplayer.MultiplayerWorld`, a
+:class:`textgame.world.World` that many players can play in at the same time,
+eg. from a thread pool:
+
+.. code-block:: python
+
+   world = textgame.multiplayer.MultiplayerWorld(rooms=myrooms, items=myitems)
+   parsers = []
+   for name in ["alice", "bob"]:
+       player = textgame.player.Player(world, world.room("field_0"))
+       world.join(player)
+       parsers.append(textgame.parser.Parser(player))
+
+   # one command, thread safe
+   world.execute(parsers[0], "take lamp")
+   # let everybody play their commands concurrently
+   results = world.play_all([(parsers[0], ["n", "e"]), (parsers[1], ["look", "s"])])
+
+Every room has its own lock. A command locks the room the player is in and all
+rooms it is connected to, so players who are not close to each other don't wait
+for each other. The locks are always acquired in the order of the room IDs, so
+players can't deadlock. Time, spawning of monsters and the world's random numbers
+are guarded by one lock for the whole world that is only held briefly.
+
+Things to keep in mind:
+
+- each command of an input like "n. n. e" is locked on its own
+- a ``special_func`` that changes other rooms than the one the player enters, or
+  a scheduled event (see :mod:`textgame.scheduler`) that changes rooms, must take care of locking itself
+- fights only happen with the monsters in the player's room, and a room is lit
+  if any player inside has light
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import threading
+import logging
+logger = logging.getLogger("textgame.multiplayer")
+logger.addHandler(logging.NullHandler())
+
+from textgame.world import World
+from textgame.response import Response
+
+
+class MultiplayerWorld(World):
+    """
+    takes the same arguments as :class:`textgame.world.World`
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._create_locks()
+        # room ID -> set of players in this room
+        self.occupants = {}
+        World.__init__(self, *args, **kwargs)
+
+
+    def _create_locks(self):
+        self.world_lock = threading.RLock()
+        self.room_locks = {}
+        self.player_locks = {}
+
+
+    def __getstate__(self):
+        state = World.__getstate__(self)
+        # locks can't be pickled
+        for key in ("world_lock", "room_locks", "player_locks"):
+            del state[key]
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._create_locks()
+        for player in self.players():
+            self.player_locks[player] = threading.RLock()
+
+
+    def join(self, player):
+        """
+        add ``player`` to the world
+        """
+        with self.world_lock:
+            self.player_locks.setdefault(player, threading.RLock())
+        with self.locked([player.location]):
+            self.occupants.setdefault(player.location.id, set()).add(player)
+        logger.info("a player joined in {}".format(player.location.id))
+
+
+    def leave(self, player):
+        """
+        remove ``player`` from the world
+        """
+        with self.locked([player.location]):
+            self._remove_occupant(player, player.location)
+        with self.world_lock:
+            self.player_locks.pop(player, None)
+
+
+    def _remove_occupant(self, player, room):
+        occupants = self.occupants.get(room.id)
+        if occupants:
+            occupants.discard(player)
+            if not occupants:
+                del self.occupants[room.id]
+
+
+    def players(self):
+        """
+        return a list of all players in the world
+        """
+        return [p for occupants in list(self.occupants.values()) for p in occupants]
+
+
+    def room_lock(self, ID):
+        lock = self.room_locks.get(ID)
+        if lock is None:
+            # setdefault is atomic, two threads get the same lock
+            lock = self.room_locks.setdefault(ID, threading.RLock())
+        return lock
+
+
+    @contextmanager
+    def locked(self, rooms):
+        """
+        context manager that holds the locks of all ``rooms`` (in the order of their IDs)
+        """
+        locks = [self.room_lock(ID) for ID in sorted({room.id for room in rooms})]
+        acquired = []
+        try:
+            for lock in locks:
+                lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+
+    def neighbourhood(self, room):
+        """
+        return the rooms a command in ``room`` might touch: the room itself and all
+        rooms it is connected to (including hidden connections)
+        """
+        rooms = [room]
+        for hidden, doors in ((False, room.doors), (True, room.hiddendoors)):
+            for dir,other in doors.items():
+                if other is not None:
+                    rooms.append(self.door_target(room, dir, hidden))
+        return [r for r in rooms if r is not None]
+
+
+    def execute(self, parser, input):
+        """
+        like :func:`textgame.parser.Parser.understand` but thread safe. Only one
+        command per player runs at a time
+        """
+        player = parser.player
+        lock = self.player_locks.get(player)
+        if lock is None:
+            raise ValueError("player has not joined this world, see MultiplayerWorld.join")
+        with lock:
+            commands = parser.split_commands(input)
+            if len(commands) == 1:
+                return self._execute_command(parser, commands[0])
+            response = Response()
+            status = player.status
+            for command in commands:
+                response.write(self._execute_command(parser, command))
+                if parser.in_yesno or not status["alive"] or status["trapped"]:
+                    break
+            return response.render()
+
+
+    def _execute_command(self, parser, command):
+        player = parser.player
+        location = player.location
+        with self.locked(self.neighbourhood(location)):
+            msg = parser.understand_command(command)
+            if player.location is not location:
+                self._remove_occupant(player, location)
+                self.occupants.setdefault(player.location.id, set()).add(player)
+        return msg
+
+
+    def play_all(self, scripts, max_workers=None):
+        """
+        run the commands of many players concurrently, the commands of each player
+        are executed one after another
+
+        :param scripts: list of ``(parser, commands)`` tuples
+        :param max_workers: number of threads
+        :rtype: list of lists of responses in the same order as ``scripts``
+        """
+        def play(script):
+            parser, commands = script
+            return [self.execute(parser, command) for command in commands]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(play, scripts))
+
+
+    def _tick(self, player):
+        # fights only concern the player's room whose lock is held by execute,
+        # time and daylight concern everybody
+        with self.world_lock:
+            return World._tick(self, player)
+
+
+    def spawn_monster(self, location):
+        with self.world_lock:
+            World.spawn_monster(self, location)
+
+
+    def is_lit(self, room, player):
+        if World.is_lit(self, room, player):
+            return True
+        return any(p.has_light() for p in self.occupants.get(room.id, ()))
+
+
+    def _fight_candidates(self, player):
+        return list(player.location.monsters.items())
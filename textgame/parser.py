@@ -6,7 +6,8 @@ This module's main class is :class:`textgame.parser.Parser`. The parser can take
 user input, call a function that's associated to the input and return to the user a
 message describing what happened.
 
-Use ``actionmap`` and ``legal_verbs`` to define how verbs should be mapped to functions, eg:
+Use ``actionmap`` and ``legal_verbs`` to define how verbs should be mapped to functions
+for a single session, eg:
 
 .. code-block:: python
 
@@ -18,8 +19,28 @@ Use ``actionmap`` and ``legal_verbs`` to define how verbs should be mapped to fu
     "shout": "scream"
    })
 
+Verbs that every session should know are better defined on class level, see
+:class:`textgame.parser.Parser`.
+
 You can use ``legal_nouns`` to define synonyms for nouns.
 
+Both ``legal_verbs`` and ``legal_nouns`` are :class:`textgame.vocabulary.Vocabulary` objects,
+so the parser also understands unique abbreviations ("tak key") and small typos
+("inventry"). Nouns get additionally resolved against the things in the player's
+current room and inventory.
+
+The parser understands more than just verb and noun. Articles get ignored, nouns may
+come with adjectives ("take red key") and with an indirect object ("unlock door north
+with key"). Several commands can be given at once ("n. n. e then take key"), they get
+executed in one call of :func:`textgame.parser.Parser.understand`.
+
+Pass ``structured=True`` to :func:`textgame.parser.Parser.understand` to get a
+:class:`textgame.response.Response` with typed events instead of a string.
+
+To push many commands through a session at once (eg. for bots or tests), use
+:func:`textgame.parser.Parser.understand_many` or its generator variant
+:func:`textgame.parser.Parser.iter_understand`.
+
 A parser is the only thing needed to during the main loop of a game:
 
 .. code-block:: python
@@ -59,11 +80,29 @@ Example: a player method that saves the user from drinking poison
 from collections import namedtuple
 import pickle
 import os
+import re
+from time import perf_counter
 import logging
 logger = logging.getLogger("textgame.parser")
 logger.addHandler(logging.NullHandler())
 
-from textgame.globals import INFO
+from textgame.globals import INFO, ACTION
+from textgame.vocabulary import Vocabulary, resolve_among
+from textgame.response import Response, Text
+from textgame import metrics
+from textgame import tracing
+from textgame import analytics
+
+
+# commands in one input can be separated by '.', ';' or 'then'
+_COMMAND_SEPARATORS = re.compile(r"[.;]|\bthen\b")
+
+
+Command = namedtuple("Command", ["verb", "noun", "preposition", "object"])
+Command.__doc__ = """
+a single parsed command, eg. "unlock door north with key" gives
+``Command(verb="unlock", noun="north", preposition="with", object="key")``
+"""
 
 
 class EnterYesNoLoop:
@@ -99,8 +138,122 @@ class EnterYesNoLoop:
 class Parser:
     """
     :param player: :class:`textgame.player.Player` object
+
+    The vocabulary and the dispatch table are defined on class level in ``verbs``,
+    ``nouns``, ``actions`` and ``parser_actions``. They get compiled once per class
+    and are shared by all parsers, so creating a parser for a new session is cheap.
+    Subclasses can extend them like this:
+
+    .. code-block:: python
+
+       class MyParser(textgame.parser.Parser):
+           verbs = dict(textgame.parser.Parser.verbs, scream="scream", shout="scream")
+           actions = dict(textgame.parser.Parser.actions, scream="scream")
+
+    ``self.legal_verbs``, ``self.legal_nouns`` and ``self.actionmap`` are per-session
+    overlays on top of the shared tables. Everything put in there takes precedence.
     """
 
+    #: maps words the user may type to commands
+    verbs = {
+        "": "continue",    # dont do anything on empty input
+        "attack": "attack",
+        "back": "back",
+        "close": "close",
+        "d": "down",
+        "down": "down",
+        "drop": "drop",
+        "e": "east",
+        "east": "east",
+        "enter": "go",
+        "go": "go",
+        "grab": "take",
+        "hear": "listen",
+        "hint": "hint",
+        "inventory": "inventory",
+        "kill": "attack",
+        "listen": "listen",
+        "lock": "close",
+        "look": "look",
+        "n": "north",
+        "north": "north",
+        "open": "open",
+        "s": "south",
+        "score": "score",
+        "south": "south",
+        "take": "take",
+        "u": "up",
+        "unlock": "open",
+        "up": "up",
+        "w": "west",
+        "walk": "go",
+        "west": "west",
+        "save": "save",
+        "load": "load",
+    }
+
+    #: words that get ignored
+    articles = {"a", "an", "the"}
+
+    #: words that separate the noun from the indirect object
+    prepositions = {"with", "using", "at", "to", "into", "on", "from"}
+
+    #: prepositions that require the player to carry the indirect object
+    instrumental = {"with", "using"}
+
+    #: this may be used to define synonyms
+    nouns = {
+        "all": "all",
+        "back": "back",
+        "d": "down",
+        "e": "east",
+        "n": "north",
+        "s": "south",
+        "u": "up",
+        "w": "west",
+    }
+
+    #: maps commands to names of player methods. If the value is a tuple
+    #: ``(name, noun)``, the method always gets called with ``noun``
+    actions = {
+        "attack": "attack",
+        "back": ("go", "back"),
+        "down": ("go", "down"),
+        "drop": "drop",
+        "east": ("go", "east"),
+        "go": "go",
+        "hint": "ask_hint",
+        "inventory": "list_inventory",
+        "listen": "listen",
+        "look": "look",
+        "close": "close",
+        "north": ("go", "north"),
+        "open": "open",
+        "score": "show_score",
+        "south": ("go", "south"),
+        "take": "take",
+        "up": ("go", "up"),
+        "west": ("go", "west"),
+    }
+
+    #: commands whose noun may be a misspelled word of ``nouns`` (eg. "go nrth"),
+    #: for all other commands only the things in reach get typos corrected
+    vocabulary_commands = {"go", "open", "close"}
+
+    #: same as ``actions`` but for methods of the parser
+    parser_actions = {
+        "continue": "do_nothing",
+        "save": "save_command",
+        "load": "load_command",
+    }
+
+    # compiled dispatch tables, keyed by (parser class, player class)
+    _dispatch_tables = {}
+
+    #: ``(verb, noun)`` of the last command as it was executed, eg. for
+    #: :mod:`textgame.analytics`. ``None`` where the input couldn't be understood
+    last_command = (None, None)
+
     def __init__(self, player):
 
         self.player = player
@@ -110,79 +263,54 @@ class Parser:
         # user output. it will be executed if yes/no conversation ends with yes
         self.yesno_backup = None
 
-        self.legal_verbs = {
-            "": "continue",    # dont do anything on empty input
-            "attack": "attack",
-            "back": "back",
-            "close": "close",
-            "d": "down",
-            "down": "down",
-            "drop": "drop",
-            "e": "east",
-            "east": "east",
-            "enter": "go",
-            "go": "go",
-            "grab": "take",
-            "hear": "listen",
-            "hint": "hint",
-            "inventory": "inventory",
-            "kill": "attack",
-            "listen": "listen",
-            "lock": "close",
-            "look": "look",
-            "n": "north",
-            "north": "north",
-            "open": "open",
-            "s": "south",
-            "score": "score",
-            "south": "south",
-            "take": "take",
-            "u": "up",
-            "up": "up",
-            "w": "west",
-            "walk": "go",
-            "west": "west",
-            "save": "save",
-            "load": "load",
-        }
-
-        # this may be used to define synonyms
-        self.legal_nouns = {
-            "d": "down",
-            "e": "east",
-            "n": "north",
-            "s": "south",
-            "u": "up",
-            "w": "west",
-        }
-
-        # the lambdas are there because the values in this dict must be
-        # callable with exactly one argument
-        self.actionmap = {
-            "attack": player.attack,
-            "back": lambda x: player.go("back"),
-            "continue": lambda x: "",
-            "down": lambda x: player.go("down"),
-            "drop": player.drop,
-            "east": lambda x: player.go("east"),
-            "go": player.go,
-            "hint": player.ask_hint,
-            "inventory": player.list_inventory,
-            "listen": player.listen,
-            "look": player.look,
-            "close": player.close,
-            "north": lambda x: player.go("north"),
-            "open": player.open,
-            "score": player.show_score,
-            "south": lambda x: player.go("south"),
-            "take": player.take,
-            "up": lambda x: player.go("up"),
-            "west": lambda x: player.go("west"),
-            "save": lambda session="": self.save_game(session=session),
-            "load": lambda session="": self.load_game(session=session),
-        }
-
-        self.check()
+        shared_verbs, shared_nouns = type(self).shared_vocabulary()
+        self.legal_verbs = Vocabulary(base=shared_verbs)
+        self.legal_nouns = Vocabulary(identity=True, base=shared_nouns)
+        # session specific actions, the values must be callable with exactly one argument
+        self.actionmap = {}
+        self._dispatch = type(self).dispatch_table(type(player))
+
+
+    @classmethod
+    def shared_vocabulary(cls):
+        """
+        return the frozen vocabularies ``(verbs, nouns)`` that all instances of this
+        class share. They get built on first use
+        """
+        shared = cls.__dict__.get("_shared_vocabulary")
+        if shared is None:
+            shared = (
+                Vocabulary(cls.verbs).freeze(),
+                Vocabulary(cls.nouns, identity=True).freeze()
+            )
+            cls._shared_vocabulary = shared
+        return shared
+
+
+    @classmethod
+    def dispatch_table(cls, player_class):
+        """
+        return a dict mapping commands to tuples ``(function, on_parser, noun)``.
+        ``function`` is an unbound method of ``player_class`` (or of the parser if
+        ``on_parser`` is true). If ``noun`` is not ``None``, it replaces the user's noun.
+        Tables are built once per combination of parser and player class
+        """
+        key = (cls, player_class)
+        table = Parser._dispatch_tables.get(key)
+        if table is None:
+            table = {}
+            for owner, actions in ((player_class, cls.actions), (cls, cls.parser_actions)):
+                for command, action in actions.items():
+                    name, noun = action if isinstance(action, tuple) else (action, None)
+                    function = getattr(owner, name, None)
+                    if function is None:
+                        logger.error("{} has no method {} (needed for command {})"
+                            .format(owner.__name__, name, command))
+                        continue
+                    table[command] = (function, owner is cls, noun)
+            Parser._dispatch_tables[key] = table
+            cls._check_table(table, cls.shared_vocabulary()[0])
+        return table
 
 
     def save_game(self, path="", session=""):
@@ -229,11 +357,63 @@ class Parser:
 
 
     def lookup_verb(self, verb):
-        return self.legal_verbs.get(verb)
+        """
+        return the command associated with ``verb``. Unique abbreviations and
+        small typos get resolved (see :class:`textgame.vocabulary.Vocabulary`)
+        """
+        result = self.legal_verbs.get(verb)
+        if result is None:
+            result, _ = self.legal_verbs.resolve(verb)
+        return result
+
+
+    def lookup_noun(self, noun, command=None):
+        """
+        return the noun associated with ``noun``. Abbreviations and typos are first
+        resolved among the IDs of items and the names of monsters in the current room
+        and the player's inventory, then among ``legal_nouns``
+
+        :param command: the command the noun belongs to. If it's given and not in
+            ``vocabulary_commands``, typos don't get corrected to words of
+            ``legal_nouns``, so "take nest" isn't taken for "take west"
+        """
+        result = self.legal_nouns.get(noun)
+        if result is not None or not noun:
+            return result
+        result = resolve_among(noun, self.room_nouns())
+        if result is not None:
+            return result
+        if self.legal_nouns.is_value(noun):
+            return noun
+        if command is None or command in self.vocabulary_commands:
+            result, _ = self.legal_nouns.resolve(noun)
+        elif len(noun) >= Vocabulary.min_prefix:
+            result = self.legal_nouns.complete(noun)
+        return result
 
 
-    def lookup_noun(self, noun):
-        return self.legal_nouns.get(noun)
+    def room_nouns(self):
+        """
+        return a set of nouns that refer to things the player can currently deal with
+        """
+        location = self.player.location
+        nouns = set(location.items)
+        nouns.update(m.name for m in location.monsters.values())
+        nouns.update(self.player.inventory)
+        return nouns
+
+
+    def not_understood(self, verb):
+        """
+        return :class:`textgame.globals.INFO.NOT_UNDERSTOOD` or, if there are verbs
+        similar to ``verb``, :class:`textgame.globals.INFO.DID_YOU_MEAN`
+        """
+        _, suggestions = self.legal_verbs.resolve(verb)
+        if suggestions:
+            return INFO.DID_YOU_MEAN.format(
+                " or ".join("'{}'".format(s) for s in suggestions)
+            )
+        return INFO.NOT_UNDERSTOOD
 
 
     def check(self):
@@ -243,18 +423,35 @@ class Parser:
 
         logs the error
         """
-        for verb in set(self.legal_verbs.values()):
-            if verb not in self.actionmap:
+        self._check_table(dict(self._dispatch, **self.actionmap), self.legal_verbs)
+
+
+    @staticmethod
+    def _check_table(table, verbs):
+        for verb in set(verbs.values()):
+            if verb not in table:
                 logger.error("{} is a legal verb but has no definition"
                     "in actionmap".format(verb))
 
 
+    def do_nothing(self, noun):
+        return ""
+
+
+    def save_command(self, session):
+        return self.save_game(session=session)
+
+
+    def load_command(self, session):
+        return self.load_game(session=session)
+
+
     def check_result(self, result):
         """
         checks if result is EnterYesNoLoop or str, if it's EnterYesNoLoop,
         return the question and fall back to yes/no mode
         """
-        if type(result) is str:
+        if type(result) is str or type(result) is Text:
             return result
         else:
             # assume that result is of type enteryesnoloop
@@ -267,37 +464,217 @@ class Parser:
         """
         call function associated with verb with noun as argument
         """
-        return self.actionmap[verb](noun)
+        action = self.actionmap.get(verb)
+        if action is not None:
+            return action(noun)
+        function, on_parser, fixed_noun = self._dispatch[verb]
+        if fixed_noun is not None:
+            noun = fixed_noun
+        return function(self if on_parser else self.player, noun)
+
+
+    def split_commands(self, input):
+        """
+        split input into single commands, eg. "n. n. e then take key" gives
+        ``["n", "n", "e", "take key"]``. Commas separate commands too, unless the
+        part after a comma doesn't start with a verb: "take key, lamp" gives
+        ``["take key", "take lamp"]``
+        """
+        commands = []
+        for part in _COMMAND_SEPARATORS.split(input):
+            verb = None
+            for piece in part.split(","):
+                words = piece.split()
+                if not words:
+                    continue
+                if verb is not None and self.legal_verbs.get(words[0]) is None:
+                    # "take key, lamp"
+                    words.insert(0, verb)
+                verb = words[0]
+                commands.append(" ".join(words))
+        return commands if commands else [""]
+
+
+    def parse(self, input):
+        """
+        take a single command and return a :class:`textgame.parser.Command`.
+        Articles get dropped, the part after a preposition becomes the
+        indirect object and noun phrases like "red key" get reduced to a single noun
+        (see :func:`textgame.parser.Parser.reduce_phrase`).
+
+        :raises ValueError: if the command can't be reduced to verb and noun
+        """
+        args = [word for word in input.split() if word not in self.articles]
+        if not args:
+            return Command("", "", None, None)
+        verb, args = args[0], args[1:]
+        preposition = None
+        indirect = []
+        for i,word in enumerate(args):
+            if word in self.prepositions:
+                preposition = word
+                args, indirect = args[:i], args[i+1:]
+                break
+        noun = self.reduce_phrase(args)
+        obj = self.reduce_phrase(indirect) if indirect else None
+        if not noun and obj:
+            # "look at wolf"
+            noun, obj = obj, None
+        return Command(verb, noun, preposition, obj)
+
+
+    def reduce_phrase(self, words):
+        """
+        reduce a list of words to a single noun. This works if the words are the name
+        of (or adjectives plus noun of) an item in reach or if exactly one of the words
+        is a known noun, eg. ``["door", "north"]`` gives "north"
+
+        :raises ValueError: if that's not possible, with the answer for the player as
+            message: :class:`textgame.globals.INFO.WHICH_ONE` if several things in
+            reach match, :class:`textgame.globals.ACTION.NO_SUCH_ITEM` if the adjectives
+            don't fit, else :class:`textgame.globals.INFO.TOO_MANY_ARGUMENTS`
+        """
+        if not words:
+            return ""
+        if len(words) == 1 and self._is_noun(words[0]):
+            return words[0]
+        location = self.player.location
+        things = [(i.id, i.name) for i in location.items.values()]
+        things += [(i.id, i.name) for i in self.player.inventory.values()]
+        things += [(m.name, m.name) for m in location.monsters.values()]
+        phrase = set(words)
+        matches = {ID for ID,name in things if phrase.issubset(name.split())}
+        if len(matches) == 1:
+            return matches.pop()
+        if len(matches) > 1:
+            # "take key" with a red and a blue key
+            raise ValueError(INFO.WHICH_ONE.format(" ".join(words)))
+        if len(words) == 1:
+            return words[0]
+        known = [w for w in words if self._is_noun(w)]
+        if len(known) == 1:
+            # "door north" is fine, but "red key" must not give any key that is in reach
+            if not any(known[0] == ID or known[0] in name.split() for ID,name in things):
+                return known[0]
+            raise ValueError(ACTION.NO_SUCH_ITEM.format(" ".join(words)))
+        # this gets catched in Parser.understand
+        raise ValueError(INFO.TOO_MANY_ARGUMENTS)
+
+
+    def _is_noun(self, word):
+        return self.legal_nouns.get(word) is not None or self.legal_nouns.is_value(word) \
+            or word in self.room_nouns()
 
 
     def _split_input(self, input):
         """
         take input and return verb and noun
         """
-        args = input.split()
-        if len(args) > 2:
-            # this gets catched in Parser.understand
-            raise ValueError()
-        elif len(args) == 2:
-            verb, noun = args
-        elif len(args) == 1:
-            verb = args[0]
-            noun = ""
-        else:
-            verb = ""
-            noun = ""
-        return verb, noun
+        command = self.parse(input)
+        return command.verb, command.noun
 
 
-    def understand(self, input):
+    def understand(self, input, structured=False):
         """
         based on the input, perform player method and return its output
         the return value is what can be printed to the user
+
+        The input may consist of several commands (see :func:`textgame.parser.Parser.split_commands`).
+        They get executed one after another until the player dies, gets trapped
+        or a yes/no question comes up. The responses are joined to a single one
+
+        :param structured: if true, return a :class:`textgame.response.Response` instead of a string
         """
+        if structured:
+            return self._understand_structured(self.split_commands(input))
+        return self._understand_commands(self.split_commands(input))
+
+
+    def _understand_commands(self, commands):
+        if len(commands) == 1:
+            return self.understand_command(commands[0])
+        response = Response()
+        self._collect(commands, response)
+        return response.render()
+
+
+    def _collect(self, commands, response):
+        # write the output of the commands to response, the text is only built on render
+        status = self.player.status
+        for command in commands:
+            response.write(self.understand_command(command))
+            if self.in_yesno or not status["alive"] or status["trapped"]:
+                break
+
+
+    def _understand_structured(self, commands):
+        response = Response()
+        player = self.player
+        player.response = response
         try:
-            verb, noun = self._split_input(input)
-        except ValueError:
-            return INFO.TOO_MANY_ARGUMENTS
+            self._collect(commands, response)
+        finally:
+            # the player may have been replaced by load_game
+            player.response = None
+            self.player.response = None
+        return response
+
+
+    def iter_understand(self, commands, structured=False):
+        """
+        generator that feeds every command in the iterable ``commands`` to
+        :func:`textgame.parser.Parser.understand` and yields the responses as they are
+        produced. Useful for bots and scripted sessions
+        """
+        split_commands = self.split_commands
+        understand_command = self.understand_command
+        if structured:
+            understand_commands = self._understand_structured
+        else:
+            understand_commands = self._understand_commands
+        for input in commands:
+            parts = split_commands(input)
+            if len(parts) == 1 and not structured:
+                yield understand_command(parts[0])
+            else:
+                yield understand_commands(parts)
+
+
+    def understand_many(self, commands, structured=False):
+        """
+        same as :func:`textgame.parser.Parser.iter_understand` but returns a list
+        """
+        return list(self.iter_understand(commands, structured))
+
+
+    def understand_command(self, input):
+        """
+        same as :func:`textgame.parser.Parser.understand` but for a single command
+        """
+        tracer = tracing.tracer
+        recorder = analytics.recorder
+        if tracer is not None:
+            root = tracer.begin("parser.understand", input=input)
+            if root is not None:
+                try:
+                    if recorder is not None:
+                        return recorder.record(self, input)
+                    return self._understand_command(input)
+                finally:
+                    tracer.end(root)
+        if recorder is not None:
+            return recorder.record(self, input)
+        return self._understand_command(input)
+
+
+    def _understand_command(self, input):
+        try:
+            command = self.parse(input)
+        except ValueError as e:
+            self.last_command = (None, None)
+            return e.args[0] if e.args else INFO.TOO_MANY_ARGUMENTS
+        verb, noun = command.verb, command.noun
+        self.last_command = (verb or None, noun or None)
 
         # if a yes/no conversation is going on, only allow yes/no as answers
         if self.in_yesno:
@@ -315,18 +692,33 @@ class Parser:
                 return self.check_result(result)
 
         commandverb = self.lookup_verb(verb)
-        commandnoun = self.lookup_noun(noun)
+        commandnoun = self.lookup_noun(noun, commandverb)
         # if noun is illegal, reset to it's original value and feed it to
         # the actionmethods. More creative output if erronous input :)
         if not commandnoun:
             commandnoun = noun
-        logger.debug("I understood: verb={} noun={}".format(repr(commandverb), repr(commandnoun)))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("I understood: verb={} noun={}".format(repr(commandverb), repr(commandnoun)))
+        self.last_command = (commandverb or verb or None, commandnoun or None)
 
         # illegal nouns are okay but illegal verbs are not
         if not commandverb:
-            return INFO.NOT_UNDERSTOOD
+            return self.not_understood(verb)
+
+        # "open door with key" only makes sense if the player has a key
+        if command.object and command.preposition in self.instrumental:
+            obj = self.lookup_noun(command.object, commandverb) or command.object
+            if obj not in self.player.inventory:
+                return ACTION.NOT_CARRYING.format(command.object)
 
         # perform the associated method
-        result = self.do(commandverb, commandnoun)
+        registry = metrics.registry
+        if registry is None:
+            result = self.do(commandverb, commandnoun)
+        else:
+            start = perf_counter()
+            result = self.do(commandverb, commandnoun)
+            registry.inc("commands", commandverb)
+            registry.observe("command_seconds", commandverb, perf_counter() - start)
 
         return self.check_result(result)
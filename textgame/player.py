@@ -6,6 +6,9 @@ This module contains a class :class:`textgame.player.Player` that is used to def
 what a player is able to do in the game. Every of its methods that get called by
 :class:`textgame.parser.Parser` must take a noun (string) as an argument and return
 either a string that describes the action or a :class:`textgame.parser.EnterYesNoLoop`.
+During structured calls (see :mod:`textgame.response`), the string may also be a
+:class:`textgame.response.Text` built by :func:`textgame.player.Player.say` or
+:func:`textgame.player.Player.join`.
 For convenience, this module provides wrappers for Player methods:
 
 - :func:`textgame.player.player_method`
@@ -14,6 +17,7 @@ For convenience, this module provides wrappers for Player methods:
 
 from inspect import signature
 from collections import OrderedDict
+from time import perf_counter
 import random
 import logging
 logger = logging.getLogger("textgame.player")
@@ -22,6 +26,12 @@ logger.addHandler(logging.NullHandler())
 from textgame.globals import DIRECTIONS, MOVING, INFO, ACTION, LIGHT, DESCRIPTIONS
 from textgame.globals import FIGHTING
 from textgame.parser import EnterYesNoLoop
+from textgame import metrics
+from textgame import tracing
+from textgame import watchdog
+from textgame.response import MOVED, TOOK, DROPPED, DIED, SCORE_CHANGED, Text
+from textgame.events import ROOM_ENTERED, ITEM_TAKEN, ITEM_DROPPED
+from textgame import changefeed
 
 
 def player_method(f):
@@ -57,15 +67,43 @@ def action_method(f):
     does something.
 
     Also, this saves the undecorated function in a new attribute ``f.undecorated``.
+
+    If :mod:`textgame.metrics` or :mod:`textgame.tracing` are enabled, the time spent
+    in the method is recorded. If :mod:`textgame.watchdog` is enabled, the method
+    (without ``World.update``) runs under its time budget.
     """
     func = player_method(f)
 
+    name = f.__name__
+    spanname = "player." + name
+    # the watchdog only skips or aborts verbs that the game defines itself
+    enforce = f.__module__ != __name__
+
     # append self.world.update to the end of every method
     def _f(self, noun):
-        msg = func(self, noun)
-        if type(msg) is str:
-            # the other possibility is EnterYesNoLoop
-            msg += self.world.update(self)
+        registry = metrics.registry
+        if registry is not None:
+            start = perf_counter()
+        span = tracing.start_span(spanname) if tracing.tracer is not None else None
+        try:
+            dog = watchdog.watchdog
+            if dog is None:
+                msg = func(self, noun)
+            else:
+                msg = dog.run_action(name, func, self, noun, enforce)
+            if type(msg) is str or type(msg) is Text:
+                # the other possibility is EnterYesNoLoop
+                update = self.world.update(self)
+                if update:
+                    if self.response is None:
+                        msg += update
+                    else:
+                        msg = Text((msg, update))
+        finally:
+            if span is not None:
+                tracing.finish_span(span)
+        if registry is not None:
+            registry.observe("action_seconds", name, perf_counter() - start)
         return msg
 
     # save the undecorated function
@@ -88,8 +126,15 @@ class Player:
     - ``self.location`` contains the room the player is currently in, ``self.oldlocation`` contains the previous location
     - ``self.inventory`` is a dict mapping the item's IDs to the items the player is carrying
     - ``self.status`` tracks the player's status: ``{"alive": True, "fighting": False, "trapped": False}``
+    - ``self.response`` is the :class:`textgame.response.Response` that collects events during a command or ``None``
     """
 
+    response = None
+    # what killed the player, see Player.die
+    death_cause = None
+    # textgame.leaderboard.Leaderboard that gets told about score changes
+    leaderboard = None
+
     def __init__(self, world, initlocation):
         self.location = initlocation
         self.oldlocation = None
@@ -107,6 +152,70 @@ class Player:
         self.random.seed(self.world.seed+42)
 
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # the response only lives during a single command
+        state.pop("response", None)
+        # the leaderboard belongs to the server, not to the saved game
+        state.pop("leaderboard", None)
+        return state
+
+
+    def record(self, kind, **data):
+        """
+        add an event to ``self.response`` if a structured response is being collected
+        (see :mod:`textgame.response`)
+        """
+        if self.response is not None:
+            self.response.add(kind, **data)
+
+
+    def say(self, template, *args):
+        """
+        return ``template.format(*args)``. If a structured response is being collected,
+        return a :class:`textgame.response.Text` that formats it only when it's rendered
+        """
+        if self.response is None:
+            return template.format(*args)
+        return Text(((template, args),))
+
+
+    def join(self, separator, parts):
+        """
+        return ``separator.join(parts)``. If a structured response is being collected,
+        return a :class:`textgame.response.Text` that joins them only when it's rendered
+        """
+        if self.response is None:
+            return separator.join(parts)
+        return Text(parts, separator)
+
+
+    def add_score(self, points):
+        """
+        add ``points`` (may be negative) to the score
+        """
+        if points:
+            self.score += points
+            self.record(SCORE_CHANGED, delta=points, score=self.score)
+            feed = self.world.feed
+            if feed is not None and feed.subscriptions:
+                feed.publish(changefeed.SCORE_CHANGED, feed.name(self), self.score)
+            if self.leaderboard is not None:
+                self.leaderboard.player_scored(self)
+
+
+    def die(self, cause):
+        """
+        set the player's status to dead. ``cause`` is recorded, eg. "cowardice"
+        """
+        self.status["alive"] = False
+        self.death_cause = cause
+        self.record(DIED, cause=cause, room=self.location.id)
+        feed = self.world.feed
+        if feed is not None and feed.subscriptions:
+            feed.publish(changefeed.PLAYER_STATUS, feed.name(self), dict(self.status))
+
+
     @action_method
     def go(self, direction):
         """
@@ -127,10 +236,10 @@ class Player:
             return MOVING.FAIL_TRAPPED
         elif self.status["fighting"]:
             # running away from a fight will kill player
-            self.status["alive"] = False
+            self.die("cowardice")
             return MOVING.DEATH_BY_COWARDICE
         else:
-            destination = self.location.doors[direction]
+            destination = self.world.door_target(self.location, direction)
             # see if there is a door
             if destination:
                 # see if door is open
@@ -140,18 +249,31 @@ class Player:
                     # move, but remember previous room
                     self.oldlocation = self.location
                     self.location = destination
+                    self.record(MOVED, origin=self.oldlocation.id,
+                        destination=destination.id, direction=direction)
+                    feed = self.world.feed
+                    if feed is not None and feed.subscriptions:
+                        feed.publish(changefeed.PLAYER_MOVED, feed.name(self), destination.id, self.oldlocation.id)
 
                     # spawn monsters before describing the room
                     self.world.spawn_monster(destination)
                     # check if room is dark etc, plus extrawürste
-                    msg = self.location.check_restrictions(self)
+                    msg = [self.location.check_restrictions(self)]
+                    events = self.world.events
+                    if events is not None:
+                        entered = events.emit(ROOM_ENTERED, self.world, self, (destination.id,),
+                            room=destination.id, origin=self.oldlocation.id, direction=direction)
+                        if entered:
+                            msg += [entered, '\n']
                     # if the room is not dark, add dir_description to the beginning
                     if not self.location.dark["now"] and dir_description:
-                        msg = dir_description + '\n' + msg
-                    msg += self.location.describe()
+                        msg[:0] = [dir_description, '\n']
+                    msg.append(self.location.describe(lazy=self.response is not None))
                     if not self.location.visited:
-                        self.score += self.location.visit()
-                    return msg
+                        self.add_score(self.location.visit())
+                        if self.location.visited and feed is not None and feed.subscriptions:
+                            feed.publish(changefeed.ROOM_VISITED, self.location.id)
+                    return self.join('', msg)
                 else:
                     return MOVING.FAIL_DOOR_LOCKED
             else:
@@ -162,18 +284,14 @@ class Player:
         """
         change location to previous location if there's a connection
         """
-        if self.oldlocation == self.location:
+        if self.oldlocation is None or self.oldlocation == self.location:
             return MOVING.FAIL_NO_MEMORY
+        # find in which direction oldlocation is
+        for dir in self.location.doors:
+            if self.world.door_target(self.location, dir) is self.oldlocation:
+                return type(self).go.undecorated(self, dir)
         # maybe there's no connection to oldlocation
-        if not self.oldlocation in self.location.doors.values():
-            return MOVING.FAIL_NO_WAY_BACK
-        else:
-            # find in which direction oldlocation is
-            for dir,dest in self.location.doors.items():
-                if dest == self.oldlocation:
-                    direction = dir
-                    break
-            return type(self).go.undecorated(self, direction)
+        return MOVING.FAIL_NO_WAY_BACK
 
 
     @action_method
@@ -194,7 +312,7 @@ class Player:
 
     def _close_or_lock(self, action, direction):
         if direction not in DIRECTIONS:
-            return ACTION.FAIL_OPENDIR.format(action)
+            return self.say(ACTION.FAIL_OPENDIR, action)
         # check if there's a door
         if not self.location.doors[direction]:
             return MOVING.FAIL_NO_DOOR
@@ -211,7 +329,10 @@ class Player:
                 if key.key == self.location.locked[direction]["key"]:
                     # open/close the door, depending on action
                     self.location.locked[direction]["closed"] = (action == "lock")
-                    return ACTION.NOW_OPEN.format(action)
+                    feed = self.world.feed
+                    if feed is not None and feed.subscriptions:
+                        feed.publish(changefeed.DOOR_LOCKED, self.location.id, direction, action == "lock")
+                    return self.say(ACTION.NOW_OPEN, action)
             return ACTION.FAIL_OPEN
         return ACTION.FAIL_NO_KEY
 
@@ -224,7 +345,7 @@ class Player:
         and add it to inventory
         """
         if not itemid:
-            return ACTION.WHICH_ITEM.format("take")
+            return self.say(ACTION.WHICH_ITEM, "take")
         elif itemid == "all":
             return self.takeall()
 
@@ -238,11 +359,22 @@ class Player:
             if item.takable:
                 # move item from location to inventory
                 self.inventory[itemid] = self.location.items.pop(itemid)
-                return ACTION.SUCC_TAKE.format(item.name)
+                self.record(TOOK, item=itemid, room=self.location.id)
+                feed = self.world.feed
+                if feed is not None and feed.subscriptions:
+                    feed.publish(changefeed.ITEM_MOVED, itemid, "room:" + self.location.id, feed.place(self))
+                msg = self.say(ACTION.SUCC_TAKE, item.name)
+                events = self.world.events
+                if events is not None:
+                    taken = events.emit(ITEM_TAKEN, self.world, self, (itemid, self.location.id),
+                        item=itemid, room=self.location.id)
+                    if taken:
+                        msg += '\n' + taken
+                return msg
             return ACTION.FAIL_TAKE
         elif itemid in self.location.description:
             return ACTION.FAIL_TAKE
-        return ACTION.NO_SUCH_ITEM.format(itemid)
+        return self.say(ACTION.NO_SUCH_ITEM, itemid)
 
 
     def takeall(self):
@@ -256,7 +388,7 @@ class Player:
         response = []
         for itemid in list(self.location.items.keys()):
             response.append(type(self).take.undecorated(self, itemid))
-        return '\n'.join(response)
+        return self.join('\n', response)
 
 
     @action_method
@@ -265,9 +397,9 @@ class Player:
         return a pretty formatted list of what's inside inventory
         """
         if self.inventory:
-            response = "You are now carrying:\n A "
-            response += '\n A '.join(i.name for i in self.inventory.values())
-            return response
+            response = ["You are now carrying:"]
+            response += [i.name for i in self.inventory.values()]
+            return self.join('\n A ', response)
         return ACTION.NO_INVENTORY
 
 
@@ -278,7 +410,7 @@ class Player:
         it from inventory and add it to location
         """
         if not itemid:
-            return ACTION.WHICH_ITEM.format("drop")
+            return self.say(ACTION.WHICH_ITEM, "drop")
 
         if itemid == "all":
             return self.dropall()
@@ -287,6 +419,16 @@ class Player:
             return ACTION.FAIL_DROP
         # move item from inventory to current room
         self.location.add_item( self.inventory.pop(itemid) )
+        self.record(DROPPED, item=itemid, room=self.location.id)
+        feed = self.world.feed
+        if feed is not None and feed.subscriptions:
+            feed.publish(changefeed.ITEM_MOVED, itemid, feed.place(self), "room:" + self.location.id)
+        events = self.world.events
+        if events is not None:
+            dropped = events.emit(ITEM_DROPPED, self.world, self, (itemid, self.location.id),
+                item=itemid, room=self.location.id)
+            if dropped:
+                return ACTION.SUCC_DROP + '\n' + dropped
         return ACTION.SUCC_DROP
 
 
@@ -317,26 +459,26 @@ class Player:
         if len(monsters) == 0:
             # maybe there's a dead one?
             if monstername in [m.name for m in self.location.items.values()]:
-                return FIGHTING.ALREADY_DEAD.format(monstername)
-            return FIGHTING.NO_MONSTER.format(monstername)
+                return self.say(FIGHTING.ALREADY_DEAD, monstername)
+            return self.say(FIGHTING.NO_MONSTER, monstername)
 
         elif len(monsters) == 1:
             monster = monsters[0]
             if monster.status["singleencounter"]:
-                return FIGHTING.ALREADY_GONE.format(monstername)
+                return self.say(FIGHTING.ALREADY_GONE, monstername)
 
             monster.status["fighting"] = True
             if monster.history == -1:
                 return monster.ignoretext
             elif monster.history < 2:
-                if self.random.random() > monster.strength-monster.history/10:
+                if self._roll(monster) > monster.strength-monster.history/10:
                     monster.kill()
                 return FIGHTING.ATTACK
             elif monster.history == 2:
-                if self.random.random() > monster.strength-0.2:
+                if self._roll(monster) > monster.strength-0.2:
                     monster.kill()
                     return FIGHTING.LAST_ATTACK
-                self.status["alive"] = False
+                self.die("fight")
                 return FIGHTING.DEATH
 
         else:
@@ -344,9 +486,22 @@ class Player:
                 "name {} in room {}. This should not be possible!".format(monstername, self.location.id))
 
 
+    def _roll(self, monster):
+        # random number for an attack on monster, see textgame.rng
+        rng = self.world.rng
+        if rng is None:
+            return self.random.random()
+        return rng.random(self.world.time, "attack", monster.id, monster.history)
+
+
     @action_method
     def show_score(self):
-        return INFO.SCORE.format(self.score)
+        msg = self.say(INFO.SCORE, self.score)
+        if self.leaderboard is not None:
+            rank = self.leaderboard.rank(self.leaderboard.players.get(self))
+            if rank is not None:
+                msg = self.join(" ", (msg, self.say(INFO.RANK, rank, len(self.leaderboard))))
+        return msg
 
 
     def forget(self):
@@ -366,8 +521,7 @@ class Player:
         self.world.spawn_monster(self.location)
         # check if room is dark etc, plus extrawürste
         msg = self.location.check_restrictions(self)
-        msg += self.location.describe(long=True)
-        return msg
+        return self.join('', (msg, self.location.describe(long=True, lazy=self.response is not None)))
 
 
     @action_method
@@ -398,7 +552,7 @@ class Player:
 
         def hint_conversation():
             warning, hint = self.location.get_hint()
-            self.score -= self.location.hint_value
+            self.add_score(-self.location.hint_value)
             return hint
 
         # stuff hint_conversation inside the EnterYesNoLoop,
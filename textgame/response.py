@@ -0,0 +1,151 @@
+"""
+textgame.response
+=====================
+
+This module contains :class:`textgame.response.Response`, a structured alternative
+to the plain strings returned by :func:`textgame.parser.Parser.understand`.
+A response collects typed events (the player moved, took an item, night fell, ...)
+and the text fragments of every command, so clients don't have to parse the text to
+find out what happened:
+
+.. code-block:: python
+
+   response = parser.understand("n. take key", structured=True)
+   for event in response.events:
+       if event.kind == textgame.response.DIED:
+           ...
+   # send events without any text
+   json.dumps(response.as_dict(text=False))
+   # or render the text as understand would have returned it
+   print(response.render())
+
+Player methods record events with :func:`textgame.player.Player.record`. This is
+a no-op unless the player is collecting a structured response.
+
+While a response is collected, the action methods, :func:`textgame.world.World.update`
+and :func:`textgame.room.Room.describe` don't format or join any text. They return
+:class:`textgame.response.Text` objects that hold the templates, their arguments and
+the pieces to join, and the text gets built only in :func:`textgame.response.Response.render`.
+Clients that only want the events never pay for it. Use :func:`textgame.player.Player.say`
+and :func:`textgame.player.Player.join` to do the same in your own action methods.
+"""
+
+from collections import namedtuple
+
+
+# event kinds
+MOVED = "moved"
+TOOK = "took"
+DROPPED = "dropped"
+FIGHT = "fight"
+DIED = "died"
+NIGHT_FELL = "night_fell"
+SCORE_CHANGED = "score_changed"
+
+
+Event = namedtuple("Event", ["kind", "data"])
+Event.__doc__ = """
+something that happened during a command. ``data`` is a dict with JSON-friendly values
+(IDs instead of objects)
+"""
+
+
+class Text:
+    """
+    text that gets built only when it's converted to a string. ``parts`` are
+    strings, other ``Text`` objects or ``(template, args)`` tuples that stand for
+    ``template.format(*args)``. They get joined by ``separator``.
+
+    Adding strings to a ``Text`` (or the other way around) gives a new ``Text``
+    without copying any characters
+    """
+
+    __slots__ = ("parts", "separator")
+
+    def __init__(self, parts=(), separator=""):
+        self.parts = parts
+        self.separator = separator
+
+
+    def __add__(self, other):
+        return Text((self, other))
+
+
+    def __radd__(self, other):
+        return Text((other, self))
+
+
+    def __bool__(self):
+        if self.separator and len(self.parts) > 1:
+            return True
+        return any(self.parts)
+
+
+    def __str__(self):
+        return self.separator.join(
+            p if type(p) is str else p[0].format(*p[1]) if type(p) is tuple else str(p)
+            for p in self.parts
+        )
+
+
+    def __repr__(self):
+        return "Text({})".format(repr(str(self)))
+
+
+class Response:
+    """
+    collects events and text fragments during one call of
+    :func:`textgame.parser.Parser.understand`
+    """
+
+    #: string that joins the fragments of several commands
+    separator = "\n\n"
+
+    def __init__(self):
+        self.events = []
+        self.fragments = []
+
+
+    def add(self, kind, **data):
+        """
+        record an event of type ``kind``
+        """
+        self.events.append(Event(kind, data))
+
+
+    def write(self, text):
+        """
+        add the text output of a command (a string or a :class:`textgame.response.Text`)
+        """
+        if text:
+            self.fragments.append(text)
+
+
+    def of_kind(self, kind):
+        """
+        return a list of all events of type ``kind``
+        """
+        return [e for e in self.events if e.kind == kind]
+
+
+    def render(self):
+        """
+        return the text exactly like :func:`textgame.parser.Parser.understand` would.
+        This is where the text of the commands gets formatted
+        """
+        return self.separator.join(
+            f if type(f) is str else str(f) for f in self.fragments
+        )
+
+    __str__ = render
+
+
+    def as_dict(self, text=True):
+        """
+        return a dict that can be serialized as JSON. If ``text`` is false, the
+        text is left out and never gets formatted
+        """
+        result = {"events": [dict(e.data, kind=e.kind) for e in self.events]}
+        if text:
+            result["text"] = self.render()
+        return result
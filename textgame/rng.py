@@ -0,0 +1,125 @@
+"""
+textgame.rng
+=====================
+
+Counter-based random numbers. A :class:`textgame.rng.Streams` object has no state
+but its seed: every number is computed from the seed and a key like
+``(tick, "spawn", room ID, monster ID)``. The numbers therefore don't depend on the
+order in which rooms, monsters or players are handled, and a game gives the same
+results whether it runs serially, batched or spread over processes:
+
+.. code-block:: python
+
+   streams = textgame.rng.Streams(world.seed)
+   streams.attach(world)   # spawns and attacks now use the streams
+
+   streams.random(world.time, "spawn", "field_0", "wolf")   # the same number every time
+   streams.stream("loot", "chest_3").randint(1, 6)          # a random.Random for this key
+   streams.batch(100000, world.time, "move")                # NumPy array, needs numpy
+
+``random`` hashes the key with BLAKE2b. ``batch`` creates a NumPy ``Philox``
+generator keyed by the hash of the key, element ``i`` of a batch is always the same
+number no matter how long the batch is, so a batch over all monsters can be indexed
+by monster.
+
+Saving a game only saves the seed.
+"""
+
+from hashlib import blake2b
+import random
+import logging
+logger = logging.getLogger("textgame.rng")
+logger.addHandler(logging.NullHandler())
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# 2**-53, turns 53 random bits into a float in [0, 1)
+_SCALE = 1.0 / (1 << 53)
+
+
+def _digest(seed, key, size):
+    # keys are joined with a separator that doesn't show up in IDs
+    data = "\x1f".join(str(k) for k in (seed,) + key).encode()
+    return blake2b(data, digest_size=size).digest()
+
+
+class Streams:
+    """
+    :param seed: int, the world's seed for example
+    """
+
+    def __init__(self, seed):
+        self.seed = seed
+
+
+    def __repr__(self):
+        return "Streams({})".format(self.seed)
+
+
+    def random(self, *key):
+        """
+        return a float in ``[0, 1)`` for ``key``
+        """
+        value = int.from_bytes(_digest(self.seed, key, 8), "little")
+        return (value >> 11) * _SCALE
+
+
+    def randint(self, a, b, *key):
+        """
+        return an int ``N`` with ``a <= N <= b`` for ``key``
+        """
+        return a + int(self.random(*key) * (b - a + 1))
+
+
+    def stream(self, *key):
+        """
+        return a :class:`random.Random` seeded for ``key``, for code that needs a sequence of numbers
+        """
+        return random.Random(int.from_bytes(_digest(self.seed, key, 16), "little"))
+
+
+    def split(self, *key):
+        """
+        return independent :class:`textgame.rng.Streams` for ``key``, eg. one per region
+        """
+        return Streams(int.from_bytes(_digest(self.seed, key, 8), "little"))
+
+
+    def generator(self, *key):
+        """
+        return a NumPy ``Generator`` based on ``Philox`` for ``key``
+        """
+        if np is None:
+            raise ImportError("Streams.generator needs numpy")
+        philox = np.random.Philox(key=int.from_bytes(_digest(self.seed, key, 16), "little"))
+        return np.random.Generator(philox)
+
+
+    def batch(self, n, *key):
+        """
+        return an array of ``n`` floats in ``[0, 1)`` for ``key``. The first ``m``
+        numbers of a batch are the same for every ``n >= m``
+        """
+        return self.generator(*key).random(n)
+
+
+    def attach(self, world):
+        """
+        let ``world`` (and its players and monster simulation) draw from these streams,
+        see :attr:`textgame.world.World.rng`
+        """
+        world.rng = self
+        logger.info("world uses random streams with seed {}".format(self.seed))
+        return self
+
+
+    @staticmethod
+    def detach(world):
+        """
+        let ``world`` use its :class:`random.Random` again
+        """
+        world.rng = None
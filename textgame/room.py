@@ -44,8 +44,14 @@ all the player's money gets stolen if he/she enters ``myroom2``:
 import logging
 logger = logging.getLogger("textgame.room")
 logger.addHandler(logging.NullHandler())
+from time import perf_counter
 
 from textgame.globals import MOVING, DESCRIPTIONS, INFO, DIRECTIONS, LIGHT
+from textgame import metrics
+from textgame import tracing
+from textgame import watchdog
+from textgame.tracing import traced
+from textgame.response import Text
 
 
 class Room:
@@ -138,20 +144,25 @@ class Room:
             self.dir_descriptions.update(dir_descriptions)
 
 
-    def describe(self, long=False):
+    @traced("room.describe")
+    def describe(self, long=False, lazy=False):
         """
         return the description (``long=True``) or short description (``long=False``)
         of the room or :class:`textgame.globals.DESCRIPTIONS.DARK_L` if the room is dark
+
+        :param lazy: if true, return a :class:`textgame.response.Text` that joins the lines only when it's rendered
         """
         long = long or not self.visited
         if self.dark["now"]:
             return DESCRIPTIONS.DARK_L
-        descript = self.description if long else self.shortdescription
+        descript = [self.description if long else self.shortdescription]
         for item in self.items.values():
-            descript += "\n" + item.describe()
+            descript.append(item.describe())
         for monster in self.monsters.values():
-            descript += "\n" + monster.describe()
-        return descript
+            descript.append(monster.describe())
+        if lazy:
+            return Text(descript, "\n")
+        return "\n".join(descript)
 
 
     def add_connection(self, dir, room, hidden=False):
@@ -201,15 +212,35 @@ class Room:
         self.special_args = kwargs if kwargs else {}
 
 
+    @traced("room.check_restrictions")
     def check_restrictions(self, player):
         """check if it's dark and call the function set by :func:`textgame.room.Room.set_specials`
 
         :param player: :class:`textgame.player.Player` object
         :returns: empty string or the string returned by the special function
         """
-        self.dark["now"] = self.dark["always"] and not (self.has_light() or player.has_light())
+        self.dark["now"] = self.dark["always"] and not player.world.is_lit(self, player)
         if self.special_func:
-            return self.special_func(player, **self.special_args)
+            registry = metrics.registry
+            dog = watchdog.watchdog
+            if registry is None and tracing.tracer is None:
+                if dog is None:
+                    return self.special_func(player, **self.special_args)
+                return dog.call(watchdog.ROOM, self.id, "", self.special_func, player, **self.special_args)
+            start = perf_counter()
+            span = tracing.start_span("room.special_func", room=self.id) \
+                if tracing.tracer is not None else None
+            try:
+                if dog is None:
+                    msg = self.special_func(player, **self.special_args)
+                else:
+                    msg = dog.call(watchdog.ROOM, self.id, "", self.special_func, player, **self.special_args)
+            finally:
+                if span is not None:
+                    tracing.finish_span(span)
+            if registry is not None:
+                registry.observe("special_func_seconds", self.id, perf_counter() - start)
+            return msg
         return ""
 
 
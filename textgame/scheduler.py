@@ -0,0 +1,183 @@
+"""
+textgame.scheduler
+=====================
+
+This module contains :class:`textgame.scheduler.Scheduler`, a priority queue of
+functions that should be called at a certain time of the world. Every
+:class:`textgame.world.World` has one, use :func:`textgame.world.World.schedule`
+to add events:
+
+.. code-block:: python
+
+   def slam_door(room, direction):
+       room.locked[direction]["closed"] = True
+       return "The door slams shut."
+
+   # close the door in 10 steps
+   world.schedule(10, slam_door, world.room("hall"), "north")
+   # let a monster roar every 50 steps
+   timer = world.schedule(50, roar, every=50)
+   world.cancel(timer)
+
+Scheduled functions may return a string, it's added to the output of the command
+during which the event happened. Events are kept in a heap, so checking for due
+events costs nothing if nothing is due, and a step with ``k`` due events costs
+``O(k log n)``.
+
+If the game gets saved, all scheduled functions and their arguments get pickled.
+Use module level functions or methods, not lambdas.
+"""
+
+from heapq import heappush, heappop, heapify
+from itertools import count
+import logging
+logger = logging.getLogger("textgame.scheduler")
+logger.addHandler(logging.NullHandler())
+
+
+class Timer:
+    """
+    a scheduled call of ``func(*args)``, returned by :func:`textgame.scheduler.Scheduler.schedule`
+
+    :param time: world time at which func gets called
+    :param every: if not ``None``, call func again every ``every`` steps
+    """
+
+    __slots__ = ("time", "func", "args", "every", "cancelled", "queued")
+
+    def __init__(self, time, func, args=(), every=None):
+        self.time = time
+        self.func = func
+        self.args = args
+        self.every = every
+        self.cancelled = False
+        # False once a timer that doesn't repeat has been taken out of the heap
+        self.queued = True
+
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+    def __setstate__(self, state):
+        for k,v in state.items():
+            setattr(self, k, v)
+
+
+    def __repr__(self):
+        return "Timer({}, {}, every={})".format(self.time, getattr(self.func, "__name__", self.func), self.every)
+
+
+class Scheduler:
+    """
+    heap of :class:`textgame.scheduler.Timer` objects ordered by time. Timers that
+    are due at the same time fire in the order they were scheduled
+    """
+
+    def __init__(self):
+        self.queue = []  # (time, sequence number, timer)
+        self.counter = count()
+        self.cancelled = 0
+
+
+    def __len__(self):
+        return len(self.queue) - self.cancelled
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # itertools.count can't be pickled
+        state["counter"] = next(self.counter)
+        return state
+
+
+    def __setstate__(self, state):
+        state["counter"] = count(state["counter"])
+        self.__dict__.update(state)
+
+
+    def schedule(self, time, func, *args, every=None):
+        """
+        call ``func(*args)`` at ``time``
+
+        :param every: repeat every ``every`` steps
+        :rtype: :class:`textgame.scheduler.Timer`
+        """
+        if every is not None and every < 1:
+            raise ValueError("every must be at least 1")
+        timer = Timer(time, func, args, every)
+        self._push(timer)
+        return timer
+
+
+    def _push(self, timer):
+        heappush(self.queue, (timer.time, next(self.counter), timer))
+
+
+    def cancel(self, timer):
+        """
+        make sure ``timer`` doesn't fire (again)
+        """
+        if timer.cancelled:
+            return
+        timer.cancelled = True
+        if not timer.queued:
+            return
+        self.cancelled += 1
+        # cancelled timers stay in the heap until they're due, unless they pile up
+        if self.cancelled > 64 and self.cancelled > len(self.queue) // 2:
+            self.queue = [entry for entry in self.queue if not entry[2].cancelled]
+            heapify(self.queue)
+            self.cancelled = 0
+
+
+    def next_time(self):
+        """
+        return the time of the next event or ``None`` if nothing is scheduled
+        """
+        while self.queue and self.queue[0][2].cancelled:
+            heappop(self.queue)
+            self.cancelled -= 1
+        return self.queue[0][0] if self.queue else None
+
+
+    def is_due(self, now):
+        return bool(self.queue) and self.queue[0][0] <= now
+
+
+    def pop_due(self, now):
+        """
+        remove and return the next timer that is due at ``now`` or ``None``.
+        Repeating timers get rescheduled
+        """
+        queue = self.queue
+        while queue and queue[0][0] <= now:
+            timer = heappop(queue)[2]
+            if timer.cancelled:
+                self.cancelled -= 1
+                continue
+            if timer.every is not None:
+                timer.time += timer.every
+                self._push(timer)
+            else:
+                timer.queued = False
+            return timer
+        return None
+
+
+    def run_due(self, now):
+        """
+        call all functions that are due at ``now``
+
+        :rtype: the strings returned by the functions, each on a new line
+        """
+        msg = []
+        timer = self.pop_due(now)
+        while timer is not None:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("running {} at {}".format(repr(timer), now))
+            result = timer.func(*timer.args)
+            if result:
+                msg.append(result)
+            timer = self.pop_due(now)
+        return ''.join('\n'+m for m in msg)
@@ -0,0 +1,348 @@
+"""
+textgame.simulation
+=====================
+
+This module contains :class:`textgame.simulation.MonsterSimulation`, an optional
+backend that lets large numbers of monsters wander around the world. It needs
+`NumPy <https://numpy.org>`_.
+
+.. code-block:: python
+
+   simulation = textgame.simulation.MonsterSimulation(world, move_prob=0.2, seed=1)
+   simulation.attach()
+   # from now on, every World.update moves the monsters
+
+The simulation keeps the position, state and spawn parameters of the monsters in
+arrays over room indices. Every tick, spawning, moving and the check which monsters
+are about to attack a player are done for all monsters at once. The
+:class:`textgame.movable.Monster` objects are only updated for rooms a player is in,
+so everything else (:func:`textgame.world.World.manage_fight`, describing rooms,
+saving the game) keeps working with them as usual.
+
+Monsters move through the doors of a room, locked doors are only passable if they
+were open when the simulation was created (see
+:func:`textgame.simulation.MonsterSimulation.build_adjacency`). Monsters that attack
+a player don't move. Unlike :func:`textgame.world.World.spawn_monster`, monsters
+spawn in any room that matches ``spawns_in``, even if there are other monsters.
+"""
+
+import logging
+logger = logging.getLogger("textgame.simulation")
+logger.addHandler(logging.NullHandler())
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# codes for Monster.spawns_at
+DAYTIMES = {"always": 0, "day": 1, "night": 2}
+
+
+class MonsterSimulation:
+    """
+    :param world: :class:`textgame.world.World`
+    :param monsters: list of :class:`textgame.movable.Monster` objects to simulate.
+        By default, all living monsters of the world that don't have an ``initlocation``
+    :param move_prob: probability that an active monster moves to a neighbouring room each tick
+    :param seed: seed for the random numbers, by default the world's seed
+    """
+
+    def __init__(self, world, monsters=None, move_prob=0.1, seed=None):
+        if np is None:
+            raise ImportError("MonsterSimulation needs numpy")
+        self.world = world
+        self.move_prob = move_prob
+        self.rng = np.random.default_rng(world.seed if seed is None else seed)
+        if monsters is None:
+            monsters = [m for m in world.monsters.values()
+                if not m.initlocation and m.status["alive"]]
+        self.monsters = list(monsters)
+
+        self.room_ids = list(world.rooms)
+        self.index = {ID: i for i,ID in enumerate(self.room_ids)}
+        # indices of rooms whose doors changed since the adjacency was updated
+        self.changed_rooms = set()
+        self.build_adjacency()
+        self._build_arrays()
+        # room index -> indices of monsters whose objects sit in this room
+        self.synced = {}
+        # monster index -> room index, the inverse of self.synced
+        self.placed = {}
+        self._find_active()
+
+
+    def build_adjacency(self):
+        """
+        (re)build the adjacency of the rooms in compressed sparse row format: the
+        neighbours of room ``i`` are ``indices[indptr[i]:indptr[i+1]]``. Call this
+        (or :func:`textgame.simulation.MonsterSimulation.room_changed` for single
+        rooms) if doors get added, removed, locked or opened and monsters should notice
+        """
+        indptr = [0]
+        indices = []
+        for ID in self.room_ids:
+            indices.extend(self._neighbours(self.world.rooms[ID]))
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.degree = np.diff(self.indptr)
+        self.changed_rooms.clear()
+
+
+    def _neighbours(self, room):
+        # indices of the rooms behind the open doors of room
+        index = self.index
+        door_target = self.world.door_target
+        result = []
+        for dir in room.doors:
+            other = door_target(room, dir)
+            if other is None or other.id not in index:
+                continue
+            lock = room.locked.get(dir)
+            if lock and lock["closed"]:
+                continue
+            result.append(index[other.id])
+        return result
+
+
+    def room_changed(self, ID):
+        """
+        tell the simulation that the doors of room ``ID`` changed. Its row of the
+        adjacency gets updated before monsters move the next time, used by the
+        editing methods of :class:`textgame.world.World`
+        """
+        roomindex = self.index.get(ID)
+        if roomindex is not None:
+            self.changed_rooms.add(roomindex)
+
+
+    def _update_adjacency(self):
+        # recompute the rows of the changed rooms, the other rows are copied in
+        # blocks, so this takes O(degree) steps in python plus a copy of the arrays
+        rows = sorted(self.changed_rooms)
+        self.changed_rooms.clear()
+        new = {i: self._neighbours(self.world.rooms[self.room_ids[i]]) for i in rows}
+        degree = self.degree.copy()
+        for i, neighbours in new.items():
+            degree[i] = len(neighbours)
+        indptr = np.zeros(len(degree) + 1, dtype=np.int64)
+        np.cumsum(degree, out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int64)
+        start = 0
+        for i in rows + [len(degree)]:
+            # rows start to i-1 didn't change
+            indices[indptr[start]:indptr[i]] = self.indices[self.indptr[start]:self.indptr[i]]
+            if i < len(degree):
+                indices[indptr[i]:indptr[i+1]] = new[i]
+            start = i + 1
+        self.indptr, self.indices, self.degree = indptr, indices, degree
+
+
+    def _build_arrays(self):
+        monsters = self.monsters
+        n = len(monsters)
+        self.position = np.full(n, -1, dtype=np.int64)
+        self.active = np.array([m.status["active"] for m in monsters], dtype=bool)
+        self.alive = np.array([m.status["alive"] for m in monsters], dtype=bool)
+        self.harmless = np.array([m.status["harmless"] for m in monsters], dtype=bool)
+        self.singleencounter = np.array([m.status["singleencounter"] for m in monsters], dtype=bool)
+        self.strength = np.array([m.strength for m in monsters], dtype=float)
+        self.history = np.array([m.history for m in monsters], dtype=np.int64)
+        self.spawn_prob = np.array([m.spawn_prob for m in monsters], dtype=float)
+        self.spawns_at = np.array([DAYTIMES.get(m.spawns_at, -1) for m in monsters], dtype=np.int64)
+        # monsters that have been seen by a player since they spawned
+        self.seen = np.zeros(n, dtype=bool)
+
+        # monsters with the same spawns_in list share a group of rooms they can spawn in
+        groups = {}
+        rooms = []
+        group_of = []
+        for monster in monsters:
+            key = tuple(monster.spawns_in)
+            if key not in groups:
+                groups[key] = len(rooms)
+                rooms.append([i for i,ID in enumerate(self.room_ids) if any(p in ID for p in key)])
+            group_of.append(groups[key])
+        self.group = np.array(group_of, dtype=np.int64)
+        self.group_size = np.array([len(r) for r in rooms], dtype=np.int64)
+        self.group_start = np.concatenate(([0], np.cumsum(self.group_size)[:-1])).astype(np.int64)
+        self.group_rooms = np.array([i for r in rooms for i in r], dtype=np.int64)
+
+
+    def _find_active(self):
+        # monsters that are already active sit in some room
+        where = {id(m): i for i,m in enumerate(self.monsters)}
+        for roomindex, room in enumerate(self.world.rooms.values()):
+            for monster in room.monsters.values():
+                i = where.get(id(monster))
+                if i is not None:
+                    self.position[i] = roomindex
+                    self.synced.setdefault(roomindex, set()).add(i)
+                    self.placed[i] = roomindex
+        self.active &= self.position >= 0
+
+
+    def attach(self):
+        """
+        take over spawning of the simulated monsters and let :func:`textgame.world.World.update`
+        call :func:`textgame.simulation.MonsterSimulation.tick`
+        """
+        for monster in self.monsters:
+            # World.spawn_monster must not spawn them anymore
+            monster.spawn_prob = 0
+        self.world.simulation = self
+        logger.info("simulating {} monsters".format(len(self.monsters)))
+
+
+    def detach(self):
+        """
+        undo :func:`textgame.simulation.MonsterSimulation.attach`
+        """
+        self._pull_all()
+        for i,monster in enumerate(self.monsters):
+            if monster.status["alive"]:
+                monster.spawn_prob = float(self.spawn_prob[i])
+        self.world.simulation = None
+
+
+    def tick(self, players):
+        """
+        advance the simulation by one step
+
+        :param players: list of :class:`textgame.player.Player` objects, the rooms
+            they are in get synced
+        """
+        self._pull_all()
+        occupied = np.zeros(len(self.room_ids), dtype=bool)
+        playerrooms = []
+        for player in players:
+            roomindex = self.index.get(player.location.id)
+            if roomindex is not None:
+                occupied[roomindex] = True
+                playerrooms.append(roomindex)
+
+        active, alive = self.active, self.alive
+        position = self.position
+        here = np.zeros(len(position), dtype=bool)
+        placed = position >= 0
+        here[placed] = occupied[position[placed]]
+        engaged = active & alive & ~self.harmless & here
+
+        # single encounters vanish when nobody is around anymore
+        gone = active & self.singleencounter & self.seen & ~here
+        active[gone] = False
+        self.seen[gone] = False
+
+        self._spawn()
+        self._move(active & alive & ~engaged)
+
+        for roomindex in playerrooms:
+            self.sync(roomindex)
+
+
+    def _spawn(self):
+        daytime = DAYTIMES[self.world.daytime]
+        candidates = ~self.active & self.alive & (self.spawn_prob > 0) & \
+            ((self.spawns_at == 0) | (self.spawns_at == daytime)) & \
+            (self.group_size[self.group] > 0)
+        candidates &= self._draw("spawn") < self.spawn_prob
+        spawned = np.flatnonzero(candidates)
+        if not len(spawned):
+            return
+        group = self.group[spawned]
+        offset = (self._draw("spawnroom", spawned) * self.group_size[group]).astype(np.int64)
+        self.position[spawned] = self.group_rooms[self.group_start[group] + offset]
+        self.active[spawned] = True
+        self.history[spawned] = 0
+
+
+    def _draw(self, purpose, indices=None):
+        # one random number per monster in indices (default: all). With the world's
+        # textgame.rng.Streams, a monster's number only depends on the time and its index
+        n = len(self.position) if indices is None else len(indices)
+        streams = self.world.rng
+        if streams is None:
+            return self.rng.random(n)
+        numbers = streams.batch(len(self.position), self.world.time, "simulation", purpose)
+        return numbers if indices is None else numbers[indices]
+
+
+    def _move(self, movable):
+        if self.changed_rooms:
+            self._update_adjacency()
+        movers = np.flatnonzero(movable)
+        if not len(movers):
+            return
+        movers = movers[self._draw("move", movers) < self.move_prob]
+        position = self.position[movers]
+        degree = self.degree[position]
+        movers, position, degree = movers[degree > 0], position[degree > 0], degree[degree > 0]
+        offset = (self._draw("direction", movers) * degree).astype(np.int64)
+        self.position[movers] = self.indices[self.indptr[position] + offset]
+
+
+    def _pull(self, indices):
+        # read back what happened to the monster objects (eg. they got killed)
+        for i in indices:
+            monster = self.monsters[i]
+            self.alive[i] = monster.status["alive"]
+            self.active[i] = monster.status["active"]
+            self.history[i] = monster.history
+
+
+    def _pull_all(self):
+        self._pull(self.placed)
+
+
+    def sync(self, roomindex):
+        """
+        update the monster objects in the room with index ``roomindex`` to match the
+        arrays. This gets called for all rooms with players on
+        :func:`textgame.simulation.MonsterSimulation.tick`
+        """
+        before = self.synced.pop(roomindex, set())
+        present = np.flatnonzero((self.position == roomindex) & self.active & self.alive)
+        present = set(present.tolist())
+        for i in before - present:
+            self._remove(i, roomindex)
+        room = self.world.rooms[self.room_ids[roomindex]]
+        for i in present - before:
+            # the monster's object might still sit in a room nobody looked at since
+            old = self.placed.get(i)
+            if old is not None:
+                self._remove(i, old)
+                self.synced[old].discard(i)
+            monster = self.monsters[i]
+            room.add_monster(monster)
+            monster.status["active"] = True
+            monster.history = int(self.history[i])
+            self.placed[i] = roomindex
+            self.seen[i] = True
+            feed = self.world.feed
+            if feed is not None and feed.subscriptions:
+                feed.monster_changed(monster.id, monster, room)
+        if present:
+            self.synced[roomindex] = present
+
+
+    def _remove(self, i, roomindex):
+        monster = self.monsters[i]
+        room = self.world.rooms[self.room_ids[roomindex]]
+        if room.monsters.get(monster.id) is monster:
+            del room.monsters[monster.id]
+            feed = self.world.feed
+            if feed is not None and feed.subscriptions:
+                feed.monster_changed(monster.id, monster, None)
+        del self.placed[i]
+
+
+    def sync_room(self, room):
+        """
+        sync a :class:`textgame.room.Room` before a player enters it
+        """
+        roomindex = self.index.get(room.id)
+        if roomindex is not None:
+            self._pull(self.synced.get(roomindex, ()))
+            self.sync(roomindex)
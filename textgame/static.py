@@ -0,0 +1,416 @@
+"""
+textgame.static
+=====================
+
+This module puts the parts of a world that never change (room texts, the door
+table, ``errors`` and ``dir_descriptions``, item and monster templates) into one
+read-only buffer that many worker processes can share, either as a
+:class:`multiprocessing.shared_memory.SharedMemory` segment or as a file that gets
+mapped with :mod:`mmap`:
+
+.. code-block:: python
+
+   # in the main process
+   data = textgame.static.export(rooms=myrooms, items=myitems, monsters=mymonsters)
+   segment = textgame.static.to_shared_memory(data, name="mygame")
+
+   # in every worker
+   static = textgame.static.StaticWorld.attach("mygame")
+   world = static.build_world()
+
+   # or with a file
+   textgame.static.to_file(data, "mygame.static")
+   static = textgame.static.StaticWorld.open("mygame.static")
+
+The rooms of such a world are :class:`textgame.static.MappedRoom` objects. They only
+hold the state that can change during a game (doors, locks, darkness, items,
+monsters) and decode their texts from the shared buffer whenever they're needed.
+Assigning or changing a text (eg. with :func:`textgame.room.Room.fill_info` or
+``room.errors["north"] = ...``) overrides it for this process only.
+
+The owner of a shared memory segment has to ``unlink()`` it when all workers are done.
+"""
+
+from array import array
+from collections import OrderedDict
+import json
+import mmap
+import struct
+import logging
+logger = logging.getLogger("textgame.static")
+logger.addHandler(logging.NullHandler())
+
+from textgame.room import Room
+from textgame.world import World
+from textgame.globals import DIRECTIONS, MOVING, DESCRIPTIONS
+
+
+MAGIC = b"TGSTATIC"
+VERSION = 1
+# magic, version, length of the header
+_PREAMBLE = struct.Struct("<8sII")
+# the door tables store room indices, -1 means no door
+NO_DOOR = -1
+
+
+def export(rooms=None, items=None, weapons=None, monsters=None):
+    """
+    pack the descriptions of a world (formatted like the arguments of
+    :class:`textgame.world.World`) into bytes
+
+    :rtype: bytes
+    """
+    rooms = rooms or {}
+    ids = list(rooms)
+    index = {ID: i for i,ID in enumerate(ids)}
+    width = len(DIRECTIONS)
+    doors = array("i", [NO_DOOR]) * (len(ids) * width)
+    hiddendoors = array("i", [NO_DOOR]) * (len(ids) * width)
+
+    records = []
+    for i,ID in enumerate(ids):
+        description = dict(rooms[ID] or {})
+        for key, table in (("doors", doors), ("hiddendoors", hiddendoors)):
+            for dir,other in (description.pop(key, None) or {}).items():
+                if dir in DIRECTIONS and other in index:
+                    table[i*width + DIRECTIONS.index(dir)] = index[other]
+                else:
+                    logger.warning("can't export {} {} of room {}".format(key, dir, ID))
+        records.append(description)
+
+    templates = []
+    for tag, descriptions in (("items", items), ("weapons", weapons), ("monsters", monsters)):
+        for ID, description in (descriptions or {}).items():
+            templates.append((tag, ID, description))
+
+    sections = [
+        ("doors", doors.tobytes()),
+        ("hiddendoors", hiddendoors.tobytes()),
+    ]
+    for name, values in (("rooms", records), ("templates", templates)):
+        encoded = [json.dumps(v, separators=(",", ":")).encode() for v in values]
+        offsets = array("q", [0])
+        for record in encoded:
+            offsets.append(offsets[-1] + len(record))
+        sections.append((name + "_offsets", offsets.tobytes()))
+        sections.append((name, b"".join(encoded)))
+
+    # every section is aligned to 8 bytes so it can be cast to an array in place
+    header = {"rooms": ids, "sections": {}}
+    position = 0
+    for name, data in sections:
+        header["sections"][name] = [position, len(data)]
+        position += len(data) + (-len(data) % 8)
+    headerbytes = json.dumps(header).encode()
+    headerbytes += b" " * (-(_PREAMBLE.size + len(headerbytes)) % 8)
+
+    parts = [_PREAMBLE.pack(MAGIC, VERSION, len(headerbytes)), headerbytes]
+    for name, data in sections:
+        parts.append(data)
+        parts.append(b"\0" * (-len(data) % 8))
+    return b"".join(parts)
+
+
+def to_shared_memory(data, name=None):
+    """
+    copy ``data`` into a new shared memory segment and return the
+    :class:`multiprocessing.shared_memory.SharedMemory` object
+    """
+    from multiprocessing.shared_memory import SharedMemory
+    segment = SharedMemory(name=name, create=True, size=len(data))
+    segment.buf[:len(data)] = data
+    logger.info("exported static world data to shared memory {} ({} bytes)".format(segment.name, len(data)))
+    return segment
+
+
+def to_file(data, path):
+    """
+    write ``data`` to a file that can be opened with :func:`textgame.static.StaticWorld.open`
+    """
+    with open(path, "wb") as f:
+        f.write(data)
+    logger.info("exported static world data to {} ({} bytes)".format(path, len(data)))
+
+
+class StaticWorld:
+    """
+    read-only view of exported world data
+
+    :param buffer: object supporting the buffer protocol, eg. bytes, a ``SharedMemory.buf`` or an ``mmap``
+    :param cache_size: number of decoded room records that are kept in this process
+    """
+
+    def __init__(self, buffer, owner=None, cache_size=1024):
+        self.buffer = memoryview(buffer)
+        # room index -> decoded record, the least recently used first
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        # keep the segment / mmap alive
+        self.owner = owner
+        magic, version, headerlength = _PREAMBLE.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a textgame static world (version {})".format(VERSION))
+        start = _PREAMBLE.size
+        header = json.loads(bytes(self.buffer[start:start+headerlength]))
+        self.room_ids = header["rooms"]
+        self.index = {ID: i for i,ID in enumerate(self.room_ids)}
+        base = start + headerlength
+        self.sections = {
+            name: self.buffer[base+offset:base+offset+length]
+            for name,(offset,length) in header["sections"].items()
+        }
+        self.doors = self.sections["doors"].cast("i")
+        self.hiddendoors = self.sections["hiddendoors"].cast("i")
+        self.room_offsets = self.sections["rooms_offsets"].cast("q")
+        self.template_offsets = self.sections["templates_offsets"].cast("q")
+
+
+    @classmethod
+    def attach(cls, name):
+        """
+        map the shared memory segment ``name`` created by :func:`textgame.static.to_shared_memory`
+        """
+        from multiprocessing.shared_memory import SharedMemory
+        try:
+            # don't let this process' resource tracker unlink the segment on exit
+            segment = SharedMemory(name=name, track=False)
+        except TypeError:
+            segment = SharedMemory(name=name)
+        return cls(segment.buf, owner=segment)
+
+
+    @classmethod
+    def open(cls, path):
+        """
+        map the file ``path`` written by :func:`textgame.static.to_file`
+        """
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, owner=mapped)
+
+
+    def close(self):
+        """
+        release the buffer. Rooms that still use it can't be described anymore
+        """
+        if self.buffer is None:
+            return
+        for view in [self.doors, self.hiddendoors, self.room_offsets, self.template_offsets]:
+            view.release()
+        for view in self.sections.values():
+            view.release()
+        self.buffer.release()
+        self.buffer = None
+        self.cache.clear()
+        if self.owner is not None:
+            self.owner.close()
+
+
+    def __del__(self):
+        # the views must be released before the segment / mmap can be closed
+        if hasattr(self, "template_offsets"):
+            self.close()
+
+
+    def room_record(self, index, cached=True):
+        """
+        return the description dict of the room with index ``index`` (without doors).
+        The rooms the players are in get read many times per command, so the last
+        ``cache_size`` records are kept decoded. Don't change a cached record
+
+        :param cached: if false, decode a fresh copy
+        """
+        cache = self.cache
+        record = cache.get(index) if cached else None
+        if record is not None:
+            cache.move_to_end(index)
+            return record
+        offsets = self.room_offsets
+        data = self.sections["rooms"][offsets[index]:offsets[index+1]]
+        record = json.loads(bytes(data))
+        if cached:
+            cache[index] = record
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return record
+
+
+    def templates(self):
+        """
+        generator of ``(tag, ID, description)`` of all items, weapons and monsters
+        """
+        offsets = self.template_offsets
+        data = self.sections["templates"]
+        for i in range(len(offsets) - 1):
+            yield tuple(json.loads(bytes(data[offsets[i]:offsets[i+1]])))
+
+
+    def connections(self, index, hidden=False):
+        """
+        return ``{direction: room index}`` of the room with index ``index``
+        """
+        table = self.hiddendoors if hidden else self.doors
+        start = index * len(DIRECTIONS)
+        result = {}
+        for offset, dir in enumerate(DIRECTIONS):
+            other = table[start+offset]
+            if other != NO_DOOR:
+                result[dir] = other
+        return result
+
+
+    def build_world(self, seed=None, world_class=World, **kwargs):
+        """
+        create a world whose rooms are :class:`textgame.static.MappedRoom` objects
+        that read their texts from this buffer. ``kwargs`` are passed to ``world_class``
+        """
+        world = world_class(seed=seed, **kwargs)
+        rooms = [MappedRoom(ID, self, i) for i,ID in enumerate(self.room_ids)]
+        for room in rooms:
+            world.rooms[room.id] = room
+        for i,room in enumerate(rooms):
+            for dir,other in self.connections(i).items():
+                room.doors[dir] = world._door(rooms[other])
+            for dir,other in self.connections(i, hidden=True).items():
+                room.hiddendoors[dir] = world._door(rooms[other])
+        templates = {"items": {}, "weapons": {}, "monsters": {}}
+        for tag, ID, description in self.templates():
+            templates[tag][ID] = description
+        for tag, descriptions in templates.items():
+            if descriptions:
+                world.create_items(descriptions, tag=tag)
+        world.put_items_in_place()
+        world.put_monsters_in_place()
+        return world
+
+
+class _Locks(dict):
+    """
+    lock states, directions that are not in the dict are open doors without key
+    """
+
+    def __missing__(self, dir):
+        lock = self[dir] = {"closed": False, "key": None}
+        return lock
+
+
+class _StaticField:
+    """
+    attribute of a :class:`textgame.static.MappedRoom` that is read from the buffer
+    as long as it's not assigned
+    """
+
+    def __init__(self, key, default):
+        self.key = key
+        self.default = default
+
+
+    def __get__(self, room, owner):
+        if room is None:
+            return self
+        return room.record().get(self.key, self.default)
+
+
+class _DirectionTexts(dict):
+    """
+    texts per direction read from the buffer. The first change stores the dict in
+    the room, so it's not lost and later reads see it (copy on write)
+    """
+
+    __slots__ = ("room", "name")
+
+    def _own(self):
+        if self.room is not None:
+            self.room.__dict__[self.name] = self
+            self.room = None
+
+
+def _owning(method):
+    def f(self, *args, **kwargs):
+        self._own()
+        return method(self, *args, **kwargs)
+    f.__name__ = method.__name__
+    return f
+
+for _name in ("__setitem__", "__delitem__", "__ior__", "update", "pop", "popitem",
+              "setdefault", "clear"):
+    setattr(_DirectionTexts, _name, _owning(getattr(dict, _name)))
+
+
+class _StaticDirections(_StaticField):
+    # errors and dir_descriptions have a value for every direction
+
+    def __get__(self, room, owner):
+        if room is None:
+            return self
+        texts = dict.fromkeys(DIRECTIONS, self.default)
+        texts.update(room.record().get(self.key) or {})
+        result = _DirectionTexts(texts)
+        result.room = room
+        result.name = self.name
+        return result
+
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+
+class MappedRoom(Room):
+    """
+    :class:`textgame.room.Room` that reads its texts from a :class:`textgame.static.StaticWorld`
+
+    :param ID: room ID
+    :param static: :class:`textgame.static.StaticWorld`
+    :param index: index of the room in ``static``
+    """
+
+    description = _StaticField("descript", "")
+    shortdescription = _StaticField("sdescript", "")
+    value = _StaticField("value", 5)
+    sound = _StaticField("sound", DESCRIPTIONS.NO_SOUND)
+    hint = _StaticField("hint", "")
+    hint_value = _StaticField("hint_value", 2)
+    errors = _StaticDirections("errors", MOVING.FAIL_CANT_GO)
+    dir_descriptions = _StaticDirections("dir_descriptions", "")
+
+    def __init__(self, ID, static, index):
+        # don't call Room.__init__, it would copy all texts
+        self.id = ID
+        self.static = static
+        self.index = index
+        # a fresh copy, locked and dark get changed during the game
+        record = static.room_record(index, cached=False)
+        self.doors = dict.fromkeys(DIRECTIONS)
+        self.hiddendoors = {}
+        self.locked = _Locks(record.get("locked") or {})
+        self.dark = record.get("dark") or {"now": False, "always": False}
+        self.items = {}
+        self.monsters = {}
+        self.visited = False
+        self.special_func = None
+        self.special_args = {}
+
+
+    def record(self):
+        """
+        return the room's description dict from the buffer
+        """
+        return self.static.room_record(self.index)
+
+
+    def __getstate__(self):
+        # the buffer can't be pickled, store everything as a normal room would
+        state = self.__dict__.copy()
+        for name in ("description", "shortdescription", "value", "sound", "hint",
+                     "hint_value"):
+            state[name] = getattr(self, name)
+        for name in ("errors", "dir_descriptions"):
+            state[name] = dict(getattr(self, name))
+        state["locked"] = dict(self.locked)
+        del state["static"]
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.locked = _Locks(self.locked)
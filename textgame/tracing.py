@@ -0,0 +1,240 @@
+"""
+textgame.tracing
+=====================
+
+Lightweight tracing of single commands. Every sampled call of
+:func:`textgame.parser.Parser.understand` produces a tree of
+:class:`textgame.tracing.Span` objects with timings, eg.
+
+.. code-block:: text
+
+   parser.understand                 1.20ms
+     player.go                       1.10ms
+       world.spawn_monster           0.05ms
+       room.check_restrictions       0.80ms
+         room.special_func           0.78ms
+       room.describe                 0.02ms
+       world.manage_fight            0.01ms
+
+Finished traces are handed to sinks, eg. a :class:`textgame.tracing.RingBufferSink`
+that keeps the last few traces in memory or a :class:`textgame.tracing.JSONLinesSink`
+that appends them to a file:
+
+.. code-block:: python
+
+   import textgame.tracing
+
+   buffer = textgame.tracing.RingBufferSink(100)
+   textgame.tracing.enable(sample_rate=0.01, sinks=[buffer])
+   # ... play ...
+   print(buffer.traces[-1].format())
+
+Tracing is disabled by default. If it's disabled or a command is not sampled,
+instrumented code only checks a module attribute and a thread local.
+"""
+
+from collections import deque
+from functools import wraps
+from time import perf_counter, time
+import threading
+import random
+import json
+import logging
+logger = logging.getLogger("textgame.tracing")
+logger.addHandler(logging.NullHandler())
+
+
+#: the active :class:`textgame.tracing.Tracer` or ``None`` if tracing is disabled
+tracer = None
+
+
+class _Local(threading.local):
+    # the innermost open span of the current thread, None if nothing is traced
+    span = None
+
+_local = _Local()
+
+
+def enable(instance=None, **kwargs):
+    """
+    start tracing with ``instance`` or a new :class:`textgame.tracing.Tracer` created
+    with ``kwargs`` and return it
+    """
+    global tracer
+    tracer = instance if instance is not None else Tracer(**kwargs)
+    logger.info("tracing enabled with sample rate {}".format(tracer.sample_rate))
+    return tracer
+
+
+def disable():
+    """
+    stop tracing
+    """
+    global tracer
+    tracer = None
+    logger.info("tracing disabled")
+
+
+def current():
+    """
+    return the innermost open span of the current thread or ``None``
+    """
+    return _local.span
+
+
+class Span:
+    """
+    a timed section of code
+
+    :param name: what is being timed, eg. "world.spawn_monster"
+    :param parent: enclosing span or ``None`` for the root of a trace
+    :param attributes: additional information, should be JSON serializable
+    """
+
+    __slots__ = ("name", "parent", "attributes", "children", "timestamp", "start", "duration")
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.children = []
+        self.timestamp = time() if parent is None else None
+        self.start = perf_counter()
+        self.duration = None
+        if parent is not None:
+            parent.children.append(self)
+
+
+    def finish(self):
+        self.duration = perf_counter() - self.start
+
+
+    def as_dict(self):
+        result = {"name": self.name, "duration": self.duration}
+        if self.timestamp is not None:
+            result["timestamp"] = self.timestamp
+        if self.attributes:
+            result["attributes"] = self.attributes
+        if self.children:
+            result["children"] = [c.as_dict() for c in self.children]
+        return result
+
+
+    def format(self, indent=0):
+        """
+        return a human readable tree of this span and its children
+        """
+        lines = ["{:<40} {:8.3f}ms".format("  "*indent + self.name, (self.duration or 0)*1000)]
+        for child in self.children:
+            lines.append(child.format(indent+1))
+        return "\n".join(lines)
+
+
+def start_span(name, **attributes):
+    """
+    open a new span below the current one and return it. Returns ``None`` if the
+    current command is not traced
+    """
+    parent = _local.span
+    if parent is None:
+        return None
+    span = Span(name, parent, **attributes)
+    _local.span = span
+    return span
+
+
+def finish_span(span):
+    """
+    close a span returned by :func:`textgame.tracing.start_span`
+    """
+    span.finish()
+    _local.span = span.parent
+
+
+def traced(name):
+    """
+    decorator that puts every call of the decorated function in a span called ``name``
+    """
+    def decorator(f):
+        @wraps(f)
+        def _f(*args, **kwargs):
+            if tracer is None or _local.span is None:
+                return f(*args, **kwargs)
+            span = start_span(name)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                finish_span(span)
+        return _f
+    return decorator
+
+
+class Tracer:
+    """
+    decides which commands get traced and passes finished traces to the sinks
+
+    :param sample_rate: fraction of commands that get traced (between 0 and 1)
+    :param sinks: list of callables that take the root :class:`textgame.tracing.Span` of a finished trace
+    :param seed: seed for the sampling decisions
+    """
+
+    def __init__(self, sample_rate=1.0, sinks=None, seed=None):
+        self.sample_rate = sample_rate
+        self.sinks = list(sinks) if sinks else []
+        self.random = random.Random(seed)
+
+
+    def begin(self, name, **attributes):
+        """
+        start a new trace if this command is sampled (and no trace is running in
+        this thread) and return its root span, else ``None``
+        """
+        if _local.span is not None:
+            return None
+        if self.sample_rate < 1 and self.random.random() >= self.sample_rate:
+            return None
+        span = Span(name, **attributes)
+        _local.span = span
+        return span
+
+
+    def end(self, span):
+        """
+        finish the trace started by :func:`textgame.tracing.Tracer.begin`
+        """
+        span.finish()
+        _local.span = None
+        for sink in self.sinks:
+            try:
+                sink(span)
+            except Exception:
+                logger.exception("trace sink {} failed".format(repr(sink)))
+
+
+class RingBufferSink:
+    """
+    keeps the last ``capacity`` traces in ``self.traces``
+    """
+
+    def __init__(self, capacity=1000):
+        self.traces = deque(maxlen=capacity)
+
+    def __call__(self, span):
+        self.traces.append(span)
+
+
+class JSONLinesSink:
+    """
+    appends every trace as one line of JSON to the file ``path``
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a")
+
+    def __call__(self, span):
+        self.file.write(json.dumps(span.as_dict()) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
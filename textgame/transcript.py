@@ -0,0 +1,321 @@
+"""
+textgame.transcript
+=====================
+
+Record games and replay them later to find out if the game still behaves the same
+and if it got slower. A game is created by a factory, a function that takes a seed
+and returns a :class:`textgame.parser.Parser`. It must be importable (module level),
+so transcripts can be replayed in other processes:
+
+.. code-block:: python
+
+   import textgame.transcript
+
+   # mygame.py
+   def new_game(seed):
+       world = textgame.world.World(rooms=myrooms, items=myitems, seed=seed)
+       return textgame.parser.Parser(textgame.player.Player(world, world.room("field_0")))
+
+   # record
+   transcript = textgame.transcript.record("mygame:new_game", ["look", "n", "take key"], seed=1)
+   transcript.save("golden/key.json")
+
+   # after changing the code
+   result = textgame.transcript.replay(textgame.transcript.Transcript.load("golden/key.json"))
+   print(result.format())
+   # many transcripts on all cores
+   results = textgame.transcript.replay_many(glob.glob("golden/*.json"))
+
+or from the command line::
+
+    python -m textgame.transcript record mygame:new_game commands.txt --seed 1 --output golden/key.json
+    python -m textgame.transcript replay golden/*.json --threshold 0.5
+
+A command counts as slower if it takes more than ``1 + threshold`` times as long as
+in the recording and at least ``min_delta`` seconds more. Before the timed runs, the
+transcript is played once untimed, so a fresh process (eg. a pool worker) doesn't
+count its cold caches as slow commands. Timings are still noisy, so by default the
+whole transcript runs ``repeat=3`` times and the fastest run of every command counts.
+
+This module is not imported by ``import textgame``, import it yourself.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+from time import perf_counter
+import argparse
+import gc
+import json
+import os
+import sys
+import logging
+logger = logging.getLogger("textgame.transcript")
+logger.addHandler(logging.NullHandler())
+
+
+def factory_name(factory):
+    """
+    return the ``"module:function"`` string of a factory
+    """
+    if isinstance(factory, str):
+        return factory
+    return "{}:{}".format(factory.__module__, factory.__qualname__)
+
+
+def load_factory(factory):
+    """
+    import a factory given as ``"module:function"``, callables are returned unchanged
+    """
+    if not isinstance(factory, str):
+        return factory
+    modulename, _, attribute = factory.partition(":")
+    result = import_module(modulename)
+    for name in attribute.split("."):
+        result = getattr(result, name)
+    return result
+
+
+class Transcript:
+    """
+    a recorded game
+
+    :param factory: ``"module:function"`` that creates the game
+    :param seed: seed passed to the factory
+    :param commands: list of inputs
+    :param responses: list of the responses to the inputs
+    :param timings: list of seconds each input took
+    :param name: name of the transcript, used in reports
+    """
+
+    def __init__(self, factory, seed, commands, responses, timings, name=""):
+        self.factory = factory_name(factory)
+        self.seed = seed
+        self.commands = list(commands)
+        self.responses = list(responses)
+        self.timings = list(timings)
+        self.name = name
+
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "factory": self.factory,
+            "seed": self.seed,
+            "commands": self.commands,
+            "responses": self.responses,
+            "timings": self.timings,
+        }
+
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["factory"], data["seed"], data["commands"], data["responses"],
+                   data["timings"], name=data.get("name", ""))
+
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=1)
+
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            transcript = cls.from_dict(json.load(f))
+        if not transcript.name:
+            transcript.name = path
+        return transcript
+
+
+def play(factory, seed, commands, repeat=1, warmup=True):
+    """
+    create a game with ``factory(seed)`` and feed it all commands. Repeat this
+    ``repeat`` times with a fresh game. Like :mod:`timeit`, the garbage collector is
+    off while the commands run, so its pauses don't show up as slow commands
+
+    :param warmup: play the commands once more before, without timing them
+    :returns: ``(responses, timings)`` where timings are the fastest of all runs
+    """
+    factory = load_factory(factory)
+    if warmup:
+        understand = factory(seed).understand
+        for command in commands:
+            understand(command)
+    timings = None
+    for _ in range(repeat):
+        parser = factory(seed)
+        understand = parser.understand
+        responses = []
+        run = []
+        gcold = gc.isenabled()
+        gc.disable()
+        try:
+            for command in commands:
+                start = perf_counter()
+                response = understand(command)
+                run.append(perf_counter() - start)
+                responses.append(response)
+        finally:
+            if gcold:
+                gc.enable()
+        timings = run if timings is None else [min(a,b) for a,b in zip(timings, run)]
+    return responses, timings or []
+
+
+def record(factory, commands, seed=0, name="", repeat=3):
+    """
+    play ``commands`` and return a :class:`textgame.transcript.Transcript`
+    """
+    responses, timings = play(factory, seed, commands, repeat)
+    return Transcript(factory, seed, commands, responses, timings, name=name)
+
+
+class ReplayResult:
+    """
+    outcome of :func:`textgame.transcript.replay`
+
+    - ``mismatches``: list of ``(index, command, expected, actual)``
+    - ``regressions``: list of ``(index, command, recorded seconds, replayed seconds)``
+    - ``error``: the exception as string if the replay crashed
+    """
+
+    def __init__(self, name, mismatches, regressions, recorded, replayed, error=None):
+        self.name = name
+        self.mismatches = mismatches
+        self.regressions = regressions
+        self.recorded = recorded
+        self.replayed = replayed
+        self.error = error
+
+
+    @property
+    def ok(self):
+        return not (self.mismatches or self.regressions or self.error)
+
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "mismatches": self.mismatches,
+            "regressions": self.regressions,
+            "recorded_seconds": self.recorded,
+            "replayed_seconds": self.replayed,
+            "error": self.error,
+        }
+
+
+    def format(self):
+        """
+        return a human readable report
+        """
+        lines = ["{}: {} ({:.3f}ms recorded, {:.3f}ms replayed)".format(
+            self.name, "ok" if self.ok else "FAILED", self.recorded*1000, self.replayed*1000)]
+        if self.error:
+            lines.append("  crashed: {}".format(self.error))
+        for index, command, expected, actual in self.mismatches:
+            lines.append("  #{} {}: expected {} got {}".format(index, repr(command), repr(expected), repr(actual)))
+        for index, command, before, after in self.regressions:
+            lines.append("  #{} {}: {:.3f}ms -> {:.3f}ms".format(index, repr(command), before*1000, after*1000))
+        return "\n".join(lines)
+
+
+def replay(transcript, threshold=0.5, min_delta=0.0005, repeat=3, factory=None):
+    """
+    replay a transcript and compare responses and timings
+
+    :param transcript: :class:`textgame.transcript.Transcript`
+    :param threshold: relative slowdown that counts as regression
+    :param min_delta: a command must also be at least this many seconds slower
+    :param factory: use this factory instead of the one in the transcript
+    :rtype: :class:`textgame.transcript.ReplayResult`
+    """
+    try:
+        responses, timings = play(factory or transcript.factory, transcript.seed,
+                                  transcript.commands, repeat)
+    except Exception as e:
+        logger.exception("replaying {} failed".format(transcript.name))
+        return ReplayResult(transcript.name, [], [], sum(transcript.timings), 0.0,
+                            error="{}: {}".format(type(e).__name__, e))
+    mismatches = []
+    regressions = []
+    for i, command in enumerate(transcript.commands):
+        expected, actual = transcript.responses[i], responses[i]
+        if expected != actual:
+            mismatches.append((i, command, expected, actual))
+        before, after = transcript.timings[i], timings[i]
+        if after > before * (1 + threshold) and after - before > min_delta:
+            regressions.append((i, command, before, after))
+    return ReplayResult(transcript.name, mismatches, regressions,
+                        sum(transcript.timings), sum(timings))
+
+
+def _replay_job(job):
+    # paths are loaded in the worker so only the file name has to be sent there
+    transcript, kwargs = job
+    if isinstance(transcript, str):
+        transcript = Transcript.load(transcript)
+    return replay(transcript, **kwargs)
+
+
+def replay_many(transcripts, processes=None, **kwargs):
+    """
+    replay many transcripts in a process pool
+
+    :param transcripts: list of :class:`textgame.transcript.Transcript` objects or paths to them
+    :param processes: number of worker processes (default: number of CPUs), 0 to replay in this process
+    :param kwargs: passed to :func:`textgame.transcript.replay`
+    :rtype: list of :class:`textgame.transcript.ReplayResult` in the same order
+    """
+    jobs = [(t, kwargs) for t in transcripts]
+    if processes == 0:
+        return [_replay_job(job) for job in jobs]
+    processes = processes or os.cpu_count() or 1
+    # big chunks keep the overhead low with thousands of short transcripts
+    chunksize = max(1, len(jobs) // (4 * processes))
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_replay_job, jobs, chunksize=chunksize))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="record and replay textgame transcripts")
+    subparsers = parser.add_subparsers(dest="command")
+
+    record_parser = subparsers.add_parser("record", help="record a transcript")
+    record_parser.add_argument("factory", help="module:function that takes a seed and returns a parser")
+    record_parser.add_argument("commands", help="file with one input per line")
+    record_parser.add_argument("--seed", type=int, default=0)
+    record_parser.add_argument("--repeat", type=int, default=3)
+    record_parser.add_argument("--output", help="write the transcript here instead of stdout")
+
+    replay_parser = subparsers.add_parser("replay", help="replay transcripts")
+    replay_parser.add_argument("transcripts", nargs="+")
+    replay_parser.add_argument("--threshold", type=float, default=0.5)
+    replay_parser.add_argument("--min-delta", type=float, default=0.0005)
+    replay_parser.add_argument("--repeat", type=int, default=3)
+    replay_parser.add_argument("--processes", type=int, default=None)
+
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        with open(args.commands) as f:
+            commands = [line.rstrip("\n") for line in f]
+        transcript = record(args.factory, commands, seed=args.seed, name=args.commands, repeat=args.repeat)
+        if args.output:
+            transcript.save(args.output)
+        else:
+            print(json.dumps(transcript.as_dict(), indent=1))
+    elif args.command == "replay":
+        results = replay_many(args.transcripts, processes=args.processes, threshold=args.threshold,
+                              min_delta=args.min_delta, repeat=args.repeat)
+        failed = 0
+        for result in results:
+            if not result.ok:
+                failed += 1
+                print(result.format())
+        print("{} of {} transcripts failed".format(failed, len(results)))
+        sys.exit(1 if failed else 0)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""
+textgame.vocabulary
+=====================
+
+This module contains :class:`textgame.vocabulary.Vocabulary`, the dict-like
+container behind :class:`textgame.parser.Parser`'s ``legal_verbs`` and ``legal_nouns``.
+Besides exact lookups, a vocabulary keeps two indices up to date on every change:
+
+- a :class:`textgame.vocabulary.Trie` to resolve unique abbreviations ("tak" → "take")
+- a :class:`textgame.vocabulary.BKTree` to find words within a small edit distance
+  ("inventry" → "inventory")
+
+Both get updated incrementally, so extending a vocabulary like this
+
+.. code-block:: python
+
+   parser.legal_verbs.update({
+    "scream": "scream",
+    "shout": "scream"
+   })
+
+makes the new words available for abbreviation and typo correction right away.
+"""
+
+from collections.abc import MutableMapping
+import logging
+logger = logging.getLogger("textgame.vocabulary")
+logger.addHandler(logging.NullHandler())
+
+
+def levenshtein(a, b, limit=None):
+    """
+    return the edit distance between the strings ``a`` and ``b``. If ``limit`` is
+    given, stop as soon as the distance is known to be larger than ``limit``
+    and return ``limit+1``
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j-1] + 1,
+                previous[j-1] + (ca != cb)
+            ))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_distance(word):
+    """
+    how many typos are tolerated in ``word``. Very short words don't get
+    corrected at all, everything else is allowed one typo per five letters
+    """
+    if len(word) < 3:
+        return 0
+    return 1 + (len(word) - 1) // 5
+
+
+class Trie:
+    """
+    prefix tree mapping words to values. Every node counts the values of the words
+    below it, so it's cheap to tell if a prefix stands for exactly one value
+    """
+
+    def __init__(self):
+        # a node is a list [children, value_counts]
+        self.root = [{}, {}]
+
+
+    def insert(self, word, value):
+        node = self.root
+        self._count(node, value, 1)
+        for char in word:
+            node = node[0].setdefault(char, [{}, {}])
+            self._count(node, value, 1)
+
+
+    def remove(self, word, value):
+        path = [self.root]
+        for char in word:
+            path.append(path[-1][0][char])
+        for node in path:
+            self._count(node, value, -1)
+        # prune branches that don't lead to any word anymore
+        for char, parent, node in zip(reversed(word), reversed(path[:-1]), reversed(path)):
+            if node[1]:
+                break
+            del parent[0][char]
+
+
+    def values(self, prefix):
+        """
+        return a dict mapping the values of all words starting with ``prefix``
+        to the number of these words. Don't modify it!
+        """
+        node = self.root
+        for char in prefix:
+            node = node[0].get(char)
+            if node is None:
+                return {}
+        return node[1]
+
+
+    def complete(self, prefix):
+        """
+        return the value all words starting with ``prefix`` have in common or
+        ``None`` if there are none or several different ones
+        """
+        values = self.values(prefix)
+        if len(values) == 1:
+            return next(iter(values))
+        return None
+
+
+    @staticmethod
+    def _count(node, value, delta):
+        counts = node[1]
+        n = counts.get(value, 0) + delta
+        if n:
+            counts[value] = n
+        else:
+            del counts[value]
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree for fast lookup of words within a given edit distance.
+    Removed words are only marked as removed and get reactivated if they're added again
+    """
+
+    def __init__(self):
+        # a node is a tuple (word, {distance: child})
+        self.root = None
+        self.removed = set()
+
+
+    def add(self, word):
+        self.removed.discard(word)
+        if self.root is None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            d = levenshtein(word, node[0])
+            if d == 0:
+                return
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = (word, {})
+                return
+            node = child
+
+
+    def remove(self, word):
+        self.removed.add(word)
+
+
+    def search(self, word, limit):
+        """
+        return a list of ``(distance, word)`` tuples of all words that are at most
+        ``limit`` edits away from ``word``, sorted by distance
+        """
+        if self.root is None:
+            return []
+        result = []
+        stack = [self.root]
+        while stack:
+            candidate, children = stack.pop()
+            # the exact distance is needed to pick the children to visit
+            d = levenshtein(word, candidate)
+            if d <= limit and candidate not in self.removed:
+                result.append((d, candidate))
+            for dist in range(max(1, d-limit), d+limit+1):
+                child = children.get(dist)
+                if child is not None:
+                    stack.append(child)
+        result.sort()
+        return result
+
+
+class Vocabulary(MutableMapping):
+    """
+    dict mapping words the user may type to the words the game understands.
+
+    :param words: dict to initialize the vocabulary with
+    :param identity: if ``True``, the values are also valid words on their own. This
+        is useful for nouns, where eg. "north" should be corrected even though only
+        "n" is a key
+    :param base: another (usually frozen) vocabulary that this one extends. Lookups
+        fall through to ``base``, changes only affect this vocabulary. This way, many
+        parsers can share one big vocabulary and only store their own additions
+    """
+
+    #: abbreviations must be at least this long to get completed
+    min_prefix = 3
+
+    def __init__(self, words=None, identity=False, base=None):
+        self._words = {}
+        self._identity = identity
+        self._base = base
+        self._frozen = False
+        # how many keys point to a value, only relevant if identity is True
+        self._values = {}
+        # words that are currently in the indices, mapped to their value
+        self._indexed = {}
+        self._trie = Trie()
+        self._bktree = BKTree()
+        if words:
+            self.update(words)
+
+
+    def __getitem__(self, word):
+        value = self.get(word)
+        if value is None:
+            raise KeyError(word)
+        return value
+
+    def __setitem__(self, word, value):
+        if self._frozen:
+            raise TypeError("this vocabulary is frozen, extend it with "
+                "Vocabulary(base=...)")
+        old = self._words.get(word)
+        if old is not None and self._identity:
+            self._count_value(old, -1)
+        self._words[word] = value
+        if self._identity:
+            self._count_value(value, 1)
+        self._reindex(word, old, value)
+
+    def __delitem__(self, word):
+        if self._frozen:
+            raise TypeError("this vocabulary is frozen")
+        old = self._words.pop(word)
+        if self._identity:
+            self._count_value(old, -1)
+        self._reindex(word, old)
+
+    def __iter__(self):
+        if self._base is None:
+            return iter(self._words)
+        return iter(set(self._words).union(self._base))
+
+    def __len__(self):
+        if self._base is None:
+            return len(self._words)
+        return len(set(self._words).union(self._base))
+
+    def __contains__(self, word):
+        return word in self._words or (self._base is not None and word in self._base)
+
+    def __repr__(self):
+        return "Vocabulary({})".format(repr(dict(self.items())))
+
+
+    def get(self, word, default=None):
+        value = self._words.get(word)
+        if value is None and self._base is not None:
+            value = self._base.get(word)
+        return default if value is None else value
+
+
+    def freeze(self):
+        """
+        make this vocabulary read-only and return it
+        """
+        self._frozen = True
+        return self
+
+
+    def _count_value(self, value, delta):
+        n = self._values.get(value, 0) + delta
+        if n:
+            self._values[value] = n
+        else:
+            del self._values[value]
+
+
+    def _reindex(self, *words):
+        """
+        bring the indices up to date for every word in ``words``
+        """
+        for word in words:
+            if word is None:
+                continue
+            if word in self._words:
+                value = self._words[word]
+            elif word in self._values:
+                value = word
+            else:
+                value = None
+            indexed = self._indexed.get(word)
+            if indexed == value:
+                continue
+            if indexed is not None:
+                self._trie.remove(word, indexed)
+                self._bktree.remove(word)
+                del self._indexed[word]
+            if value is not None:
+                self._trie.insert(word, value)
+                self._bktree.add(word)
+                self._indexed[word] = value
+
+
+    def _meaning(self, word):
+        """value of a word found in the indices"""
+        value = self._indexed.get(word)
+        if value is None and self._base is not None:
+            value = self._base._meaning(word)
+        return value
+
+
+    def _prefix_values(self, prefix):
+        values = self._trie.values(prefix)
+        if self._base is not None:
+            base_values = self._base._prefix_values(prefix)
+            if base_values:
+                values = set(values).union(base_values)
+        return values
+
+
+    def is_value(self, word):
+        """
+        returns true if ``word`` is one of the values (only if ``identity`` is set)
+        """
+        return word in self._values or (self._base is not None and self._base.is_value(word))
+
+
+    def complete(self, prefix):
+        """
+        return the value of ``prefix`` if all words starting with it mean the same
+        """
+        values = self._prefix_values(prefix)
+        if len(values) == 1:
+            return next(iter(values))
+        return None
+
+
+    def similar(self, word, limit=None):
+        """
+        return a list of ``(distance, word)`` tuples of known words that are at most
+        ``limit`` typos away (by default, see :func:`textgame.vocabulary.max_distance`)
+        """
+        if limit is None:
+            limit = max_distance(word)
+        if not limit:
+            return []
+        result = self._bktree.search(word, limit)
+        if self._base is not None:
+            result = sorted(set(result).union(self._base.similar(word, limit)))
+        return result
+
+
+    def resolve(self, word):
+        """
+        look up ``word``, allowing for abbreviations and typos
+
+        :returns: tuple ``(value, suggestions)``. ``value`` is ``None`` if the word
+            could not be resolved unambiguously, in this case ``suggestions`` is a list
+            of the closest known words
+        """
+        value = self.get(word)
+        if value is not None:
+            return value, []
+        if self.is_value(word):
+            return word, []
+        if len(word) >= self.min_prefix:
+            value = self.complete(word)
+            if value is not None:
+                return value, []
+        matches = self.similar(word)
+        if not matches:
+            return None, []
+        best = [w for d,w in matches if d == matches[0][0]]
+        values = {self._meaning(w) for w in best}
+        if len(values) == 1:
+            logger.debug("corrected {} to {}".format(repr(word), repr(best[0])))
+            return values.pop(), []
+        return None, best
+
+
+def resolve_among(word, candidates):
+    """
+    like :func:`textgame.vocabulary.Vocabulary.resolve` but for a small collection
+    of words that changes all the time (eg. the items in a room) and is therefore
+    not worth to be indexed
+
+    :returns: the unique match or ``None``
+    """
+    if word in candidates:
+        return word
+    if len(word) >= Vocabulary.min_prefix:
+        matches = [c for c in candidates if c.startswith(word)]
+        if len(matches) == 1:
+            return matches[0]
+    limit = max_distance(word)
+    if not limit:
+        return None
+    best = None
+    best_distance = limit + 1
+    for candidate in candidates:
+        d = levenshtein(word, candidate, limit)
+        if d < best_distance:
+            best, best_distance = candidate, d
+        elif d == best_distance and candidate != best:
+            # ambiguous
+            best = None
+    return best
@@ -0,0 +1,274 @@
+"""
+textgame.watchdog
+=====================
+
+Time budgets for the code of a game: ``special_func`` of rooms (see
+:func:`textgame.room.Room.set_specials`) and the methods of a player decorated with
+:func:`textgame.player.action_method`. Like :mod:`textgame.metrics`, the watchdog is
+off by default and the hooks only check ``textgame.watchdog.watchdog is None``.
+
+.. code-block:: python
+
+   import textgame.watchdog
+
+   dog = textgame.watchdog.enable(budget=0.02, policy=textgame.watchdog.SKIP,
+                                  budgets={"room": {"library": 0.1}})
+   # ... play ...
+   for offender in dog.offenders():
+       print(offender)
+
+Every call that takes longer than its budget is logged and counted for its room or
+verb. Then, depending on the policy:
+
+- ``LOG``: nothing else happens
+- ``SKIP``: once a room or verb ran over budget ``strikes`` times, its hook isn't called
+  anymore: the ``special_func`` is left out and the verb only answers ``message``.
+  :func:`textgame.watchdog.Watchdog.pardon` lets it run again
+- ``ABORT``: the command ends with ``message`` instead of the hook's output. With
+  ``interrupt=True``, a timer (:func:`signal.setitimer`) stops the hook as soon as the
+  budget is used up. This only works in the main thread on Unix, elsewhere the result
+  of the hook is thrown away after it finished
+
+The time of a verb doesn't include the time of the ``special_func`` it calls nor the
+time of :func:`textgame.world.World.update` after it, so a slow room or a slow tick
+doesn't get ``go`` or ``look`` skipped. ``SKIP`` and ``ABORT`` only apply to
+``special_func`` and to action methods defined outside of :mod:`textgame.player`
+(eg. in a subclass of :class:`textgame.player.Player`). The built-in verbs are
+only logged and counted, skipping or interrupting them could leave the game
+half-changed or the player stuck.
+"""
+
+from time import perf_counter
+import signal
+import threading
+import logging
+logger = logging.getLogger("textgame.watchdog")
+logger.addHandler(logging.NullHandler())
+
+from textgame import metrics
+from textgame.globals import INFO
+
+
+#: the active :class:`textgame.watchdog.Watchdog` or ``None`` if it's disabled
+watchdog = None
+
+LOG = "log"
+SKIP = "skip"
+ABORT = "abort"
+POLICIES = (LOG, SKIP, ABORT)
+
+# kinds of hooks
+ROOM = "room"
+VERB = "verb"
+
+
+def enable(instance=None, **kwargs):
+    """
+    start watching with ``instance`` or a new :class:`textgame.watchdog.Watchdog`
+    created with ``kwargs`` and return it
+    """
+    global watchdog
+    watchdog = instance if instance is not None else Watchdog(**kwargs)
+    logger.info("watchdog enabled with policy {}".format(watchdog.policy))
+    return watchdog
+
+
+def disable():
+    """
+    stop watching
+    """
+    global watchdog
+    watchdog = None
+    logger.info("watchdog disabled")
+
+
+class BudgetExceeded(Exception):
+    """
+    raised inside a hook by the timer if ``interrupt=True``
+    """
+
+
+class CommandAborted(Exception):
+    """
+    raised by :func:`textgame.watchdog.Watchdog.call` to end the current command,
+    caught by :func:`textgame.player.action_method`
+    """
+
+    def __init__(self, message):
+        Exception.__init__(self, message)
+        self.message = message
+
+
+class Offender:
+    """
+    statistics of a room or verb that ran over budget
+    """
+
+    __slots__ = ("kind", "key", "count", "total", "worst", "skipped")
+
+    def __init__(self, kind, key):
+        self.kind = kind
+        self.key = key
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.skipped = 0
+
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+    def __repr__(self):
+        return "Offender({} {}: {} times, worst {:.1f}ms, skipped {})".format(
+            self.kind, repr(self.key), self.count, self.worst*1000, self.skipped)
+
+
+class Watchdog:
+    """
+    :param budget: seconds a hook may take
+    :param policy: ``LOG``, ``SKIP`` or ``ABORT``
+    :param budgets: dict ``{"room": {ID: seconds}, "verb": {name: seconds}}`` to
+        override ``budget`` for single rooms or verbs
+    :param strikes: number of overruns after which ``SKIP`` skips a hook
+    :param message: answer of the game if a hook is skipped or aborted
+    :param interrupt: stop hooks with a timer when ``policy`` is ``ABORT``
+    """
+
+    def __init__(self, budget=0.05, policy=LOG, budgets=None, strikes=3,
+                 message=INFO.TOO_SLOW, interrupt=False):
+        if policy not in POLICIES:
+            raise ValueError("unknown policy {}, must be one of {}".format(repr(policy), POLICIES))
+        self.budget = budget
+        self.policy = policy
+        self.budgets = {ROOM: {}, VERB: {}}
+        for kind, table in (budgets or {}).items():
+            self.budgets[kind].update(table)
+        self.strikes = strikes
+        self.message = message
+        self.interrupt = interrupt and policy == ABORT and hasattr(signal, "setitimer")
+        # (kind, key) -> Offender
+        self.offences = {}
+        self._lock = threading.Lock()
+        # per thread: stack of the time spent in nested hooks
+        self._local = threading.local()
+        self._armed = False
+
+
+    def budget_for(self, kind, key):
+        return self.budgets[kind].get(key, self.budget)
+
+
+    def is_skipped(self, kind, key, enforce=True):
+        """
+        return True if the hook of this room or verb is skipped
+        """
+        if self.policy != SKIP or not enforce:
+            return False
+        offender = self.offences.get((kind, key))
+        return offender is not None and offender.count >= self.strikes
+
+
+    def pardon(self, kind=None, key=None):
+        """
+        forget the overruns of one room or verb, or of all if no key is given
+        """
+        with self._lock:
+            if key is None:
+                self.offences.clear()
+            else:
+                self.offences.pop((kind, key), None)
+
+
+    def offenders(self):
+        """
+        return a list of :class:`textgame.watchdog.Offender`, the worst first
+        """
+        return sorted(self.offences.values(), key=lambda o: (o.count, o.worst), reverse=True)
+
+
+    def call(self, kind, key, default, func, *args, **kwargs):
+        """
+        call ``func(*args, **kwargs)`` under the budget of the room or verb ``key``
+
+        :param kind: ``"room"`` or ``"verb"``
+        :param default: returned if the hook is skipped
+        :raises: :class:`textgame.watchdog.CommandAborted` if the command should end
+        """
+        return self._call(kind, key, default, True, func, args, kwargs)
+
+
+    def _call(self, kind, key, default, enforce, func, args, kwargs):
+        # if enforce is False, overruns are only logged and counted
+        if self.is_skipped(kind, key, enforce):
+            self.offences[(kind, key)].skipped += 1
+            return default
+        budget = self.budget_for(kind, key)
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        timer = enforce and self.interrupt and not self._armed and \
+            threading.current_thread() is threading.main_thread()
+        interrupted = False
+        stack.append(0.0)
+        start = perf_counter()
+        if timer:
+            previous = signal.signal(signal.SIGALRM, _alarm)
+            self._armed = True
+            signal.setitimer(signal.ITIMER_REAL, budget)
+        try:
+            result = func(*args, **kwargs)
+        except BudgetExceeded:
+            if not timer:
+                # the timer of an outer hook
+                raise
+            interrupted = True
+        finally:
+            if timer:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous)
+                self._armed = False
+            elapsed = perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+        # only count the time of this hook, not of the hooks it called
+        elapsed -= nested
+        if interrupted or elapsed > budget:
+            self._offence(kind, key, elapsed, budget, interrupted, enforce)
+            if interrupted or (enforce and self.policy == ABORT):
+                raise CommandAborted(self.message)
+        return result
+
+
+    def _offence(self, kind, key, elapsed, budget, interrupted, enforce):
+        with self._lock:
+            offender = self.offences.get((kind, key))
+            if offender is None:
+                offender = self.offences[(kind, key)] = Offender(kind, key)
+            offender.count += 1
+            offender.total += elapsed
+            offender.worst = max(offender.worst, elapsed)
+        logger.warning("{} {} took {:.1f}ms (budget {:.1f}ms){}".format(
+            kind, repr(key), elapsed*1000, budget*1000, ", interrupted" if interrupted else ""))
+        if metrics.registry is not None:
+            metrics.registry.inc("watchdog_overruns", "{}:{}".format(kind, key))
+        if enforce and self.policy == SKIP and offender.count == self.strikes:
+            logger.error("{} {} ran over budget {} times and will be skipped".format(kind, repr(key), offender.count))
+
+
+    def run_action(self, name, func, player, noun, enforce=True):
+        """
+        call the action method ``func`` for the verb ``name``, used by
+        :func:`textgame.player.action_method`
+
+        :param enforce: apply the policy, else only log and count overruns
+        """
+        try:
+            return self._call(VERB, name, self.message, enforce, func, (player, noun), {})
+        except CommandAborted as e:
+            return e.message
+
+
+def _alarm(signum, frame):
+    raise BudgetExceeded()
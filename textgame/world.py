@@ -30,17 +30,35 @@ The same is true for items, weapons and monsters, see the example.
 
 World has a member called ``storage_room`` of type :class:`textgame.room.Room` that
 can be used to put stuff inside that should not be visible for the player.
+
+Rooms and doors can be changed while the game is running with
+:func:`textgame.world.World.add_room`, :func:`textgame.world.World.remove_room`,
+:func:`textgame.world.World.add_door`, :func:`textgame.world.World.remove_door`,
+:func:`textgame.world.World.retarget_door` and :func:`textgame.world.World.reveal_hiddendoors`.
+The world keeps an index of the doors that lead into every room (see
+:func:`textgame.world.World.entrances`), so each of these only touches the rooms
+that are involved.
 """
 
 import logging
 logger = logging.getLogger("textgame.world")
 logger.addHandler(logging.NullHandler())
 import random
+import gc
 from collections import OrderedDict
+from time import perf_counter
 
 from textgame.room import Room
+from textgame.scheduler import Scheduler
 from textgame.movable import Item, Weapon, Monster
-from textgame.globals import INFO, FIGHTING
+from textgame.globals import INFO, FIGHTING, DIRECTIONS
+from textgame.response import FIGHT, NIGHT_FELL
+from textgame.events import MONSTER_SPAWNED, MONSTER_KILLED, TICK
+from textgame.events import NIGHT_FELL as NIGHT_FELL_EVENT
+from textgame.changefeed import PLAYER_STATUS
+from textgame.changefeed import TICK as FEED_TICK
+from textgame import metrics
+from textgame.tracing import traced
 
 
 class World:
@@ -51,17 +69,37 @@ class World:
     :param monsters: you guessed it
     :param seed: seed for the random number generator. If ``None``, a random seed is taken
     :type seed: int
+    :param door_ids: if true, the ``doors`` of the rooms contain room IDs instead of
+        the rooms themselves, use :func:`textgame.world.World.door_target` to get
+        the room behind a door. Rooms then don't reference each other, which makes
+        the garbage collector's job much easier in big worlds
     """
 
-    def __init__(self, rooms=None, items=None, weapons=None, monsters=None, seed=None):
+    # set by textgame.simulation.MonsterSimulation.attach
+    simulation = None
+    # set by textgame.migration.apply
+    content_version = None
+    # textgame.rng.Streams to draw from instead of self.random, see textgame.rng
+    rng = None
+    # textgame.events.EventBus, see textgame.events
+    events = None
+    # textgame.changefeed.ChangeFeed, see textgame.changefeed
+    feed = None
+
+    def __init__(self, rooms=None, items=None, weapons=None, monsters=None, seed=None, door_ids=False):
+        self.door_ids = door_ids
         self.rooms = OrderedDict()
         self.items = OrderedDict()
         self.monsters = OrderedDict()
         self.daytime = "day"
         self.time = 0  # increases by one after each step
         self.nighttime = 200
+        self.scheduler = Scheduler()
         # dummy room to keep stuff out of the actual world
         self.storage_room = Room("storage")
+        # target room ID -> set of (source room ID, direction) of (hidden) doors,
+        # built on first use
+        self._entrances = None
 
         # fill stuff
         if rooms:
@@ -75,12 +113,21 @@ class World:
         self.put_items_in_place()
         self.put_monsters_in_place()
 
-        self.seed = seed if seed else random.randint(0,1000000)
+        self.seed = seed if seed is not None else random.randint(0,1000000)
         logger.debug("seeding world with {}".format(self.seed))
         self.random = random.Random()
         self.random.seed(self.seed)
 
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # the event bus and the change feed belong to the server, not to the saved
+        # game, attach them again after loading
+        state.pop("events", None)
+        state.pop("feed", None)
+        return state
+
+
     def create_rooms(self, descriptions):
         """
         create :class:`textgame.room.Room` objects based on description-dict (see above).
@@ -95,6 +142,7 @@ class World:
                     " but it's already there".format(ID))
         logger.info("Created rooms")
         self._fill_room_infos(descriptions)
+        self._entrances = None
         logger.info("Added room descriptions")
 
 
@@ -103,6 +151,9 @@ class World:
             description = descriptions.get(ID)
             if not description:
                 logger.warning("Room {} does not have a description".format(ID))
+                description = {}
+            # copy, so the caller's dicts keep the room names
+            description = dict(description)
 
             # replace "doors" and "hiddendoors" dicts to dicts that
             # contain the actual room objects instead of their names
@@ -121,16 +172,278 @@ class World:
             room.fill_info(**description)
 
 
+    def add_rooms(self, descriptions):
+        """
+        create rooms from an iterable of ``(ID, description)`` tuples, where ``description``
+        is formatted like the values of the dict described above. Unlike
+        :func:`textgame.world.World.create_rooms`, this doesn't need all descriptions
+        at once, so rooms can be streamed into the world (eg. from
+        :class:`textgame.generator.WorldGenerator`). Doors may point to rooms that are
+        described later on.
+        """
+        for ID,description in descriptions:
+            room = self.rooms.get(ID)
+            if room is None:
+                room = self.rooms[ID] = Room(ID)
+            description = dict(description)
+            for key in ("doors", "hiddendoors"):
+                if key in description:
+                    description[key] = {
+                        dir: self._door(self._room_or_placeholder(other))
+                        for dir,other in description[key].items()
+                    }
+            room.fill_info(**description)
+        self._entrances = None
+        logger.info("Added rooms")
+
+
+    def _room_or_placeholder(self, ID):
+        room = self.rooms.get(ID)
+        if room is None:
+            # create 'empty' room that gets filled as soon as its description comes
+            room = self.rooms[ID] = Room(ID)
+        return room
+
+
     def _convert_door_dict(self, doordict):
         """
         take {dir: roomid} return {dir: roomobj}
         """
         true_doordict = {}
         for dir,ID in doordict.items():
-            true_doordict[dir] = self.room(ID)
+            room = self.room(ID)
+            true_doordict[dir] = self._door(room) if room else room
         return true_doordict
 
 
+    def _door(self, room):
+        # what gets stored in Room.doors
+        return room.id if self.door_ids else room
+
+
+    def door_target(self, room, direction, hidden=False):
+        """
+        return the room behind the door of ``room`` in ``direction`` or ``None``
+
+        :param hidden: look at the hidden doors instead
+        """
+        target = (room.hiddendoors if hidden else room.doors).get(direction)
+        if target.__class__ is str:
+            return self.rooms.get(target)
+        return target
+
+
+    def entrances(self, room):
+        """
+        return a list of ``(source room, direction)`` of all (not hidden) doors that lead
+        into ``room``
+
+        The index behind this is kept up to date by the editing methods of the world.
+        If you change ``doors`` of rooms directly (other than with
+        :func:`textgame.room.Room.reveal_hiddendoors`), call
+        :func:`textgame.world.World.reindex_doors` afterwards
+        """
+        result = []
+        for sourceid, dir in self._index().get(room.id, ()):
+            source = self.rooms.get(sourceid)
+            if source is not None and self.door_target(source, dir) is room:
+                result.append((source, dir))
+        return result
+
+
+    def reindex_doors(self):
+        """
+        forget the index of entrances, it's rebuilt on the next use
+        """
+        self._entrances = None
+
+
+    def _index(self):
+        if self._entrances is None:
+            self._entrances = {}
+            for room in self.rooms.values():
+                self._index_room(room)
+        return self._entrances
+
+
+    def _index_room(self, room):
+        entrances = self._entrances
+        for doors in (room.doors, room.hiddendoors):
+            for dir,other in doors.items():
+                if other is not None:
+                    target = other if other.__class__ is str else other.id
+                    entrances.setdefault(target, set()).add((room.id, dir))
+
+
+    def _unindex(self, room, dir, target):
+        # forget that (room, dir) leads to target, unless a visible or hidden door still does
+        if self._entrances is None or target is None:
+            return
+        for doors in (room.doors, room.hiddendoors):
+            if doors.get(dir) is not None and self.door_target(room, dir, doors is room.hiddendoors) is target:
+                return
+        entries = self._entrances.get(target.id)
+        if entries:
+            entries.discard((room.id, dir))
+            if not entries:
+                del self._entrances[target.id]
+
+
+    def _edit_room(self, ID):
+        room = self.rooms.get(ID)
+        if room is None:
+            raise KeyError("no room {}".format(repr(ID)))
+        return room
+
+
+    def _changed_doors(self, room):
+        # things derived from the doors of room
+        if self.simulation is not None:
+            self.simulation.room_changed(room.id)
+
+
+    def add_room(self, ID, description=None):
+        """
+        add a new room while the game is running. ``description`` is formatted like
+        the values of the dict described above, its doors must point to existing rooms
+
+        :rtype: the new :class:`textgame.room.Room`
+        """
+        if ID in self.rooms:
+            raise ValueError("there already is a room {}".format(repr(ID)))
+        if self.simulation is not None:
+            raise RuntimeError("detach the monster simulation before adding rooms")
+        description = dict(description or {})
+        for key in ("doors", "hiddendoors"):
+            for other in (description.get(key) or {}).values():
+                self._edit_room(other)
+            if key in description:
+                description[key] = {
+                    dir: self._door(self.rooms[other]) for dir,other in description[key].items()
+                }
+        room = self.rooms[ID] = Room(ID)
+        room.fill_info(**description)
+        if self._entrances is not None:
+            self._index_room(room)
+        logger.info("Added room {}".format(ID))
+        return room
+
+
+    def remove_room(self, ID):
+        """
+        remove a room and all doors that lead into it. Items and monsters inside get
+        moved to the storage room. Make sure no player is inside
+
+        :rtype: the removed :class:`textgame.room.Room`
+        """
+        room = self._edit_room(ID)
+        if self.simulation is not None:
+            raise RuntimeError("detach the monster simulation before removing rooms")
+        for sourceid, dir in list(self._index().get(ID, ())):
+            source = self.rooms.get(sourceid)
+            if source is None:
+                continue
+            for hidden in (False, True):
+                if self.door_target(source, dir, hidden) is room:
+                    self._set_door(source, dir, None, hidden)
+        for hidden in (False, True):
+            for dir in list(room.hiddendoors if hidden else room.doors):
+                self._set_door(room, dir, None, hidden)
+        self._entrances.pop(ID, None)
+        for itemid in list(room.items):
+            self.storage_room.add_item(room.items.pop(itemid))
+        for monsterid in list(room.monsters):
+            self.storage_room.add_monster(room.monsters.pop(monsterid))
+        del self.rooms[ID]
+        logger.info("Removed room {}".format(ID))
+        return room
+
+
+    def _set_door(self, room, dir, target, hidden=False):
+        doors = room.hiddendoors if hidden else room.doors
+        old = self.door_target(room, dir, hidden)
+        if target is None:
+            if hidden:
+                doors.pop(dir, None)
+            else:
+                doors[dir] = None
+        else:
+            doors[dir] = self._door(target)
+            if self._entrances is not None:
+                self._entrances.setdefault(target.id, set()).add((room.id, dir))
+        if old is not None and old is not target:
+            self._unindex(room, dir, old)
+
+
+    def add_door(self, ID, direction, target, hidden=False, locked=None):
+        """
+        add a door from room ``ID`` in ``direction`` to the room with ID ``target``.
+        An existing door in this direction gets replaced
+
+        :param hidden: add a hidden door
+        :param locked: dict like ``{"closed": True, "key": 123}``
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError("{} is not a direction".format(repr(direction)))
+        room = self._edit_room(ID)
+        self._set_door(room, direction, self._edit_room(target), hidden)
+        if locked is not None:
+            room.locked[direction] = dict(locked)
+        self._changed_doors(room)
+
+
+    def remove_door(self, ID, direction, hidden=False):
+        """
+        remove the door from room ``ID`` in ``direction``
+        """
+        room = self._edit_room(ID)
+        if self.door_target(room, direction, hidden) is None:
+            raise KeyError("room {} has no door {}".format(repr(ID), direction))
+        self._set_door(room, direction, None, hidden)
+        self._changed_doors(room)
+
+
+    def retarget_door(self, ID, direction, target, hidden=False):
+        """
+        let the existing door from room ``ID`` in ``direction`` lead to the room ``target``
+        """
+        room = self._edit_room(ID)
+        if self.door_target(room, direction, hidden) is None:
+            raise KeyError("room {} has no door {}".format(repr(ID), direction))
+        self._set_door(room, direction, self._edit_room(target), hidden)
+        self._changed_doors(room)
+
+
+    def reveal_hiddendoors(self, ID):
+        """
+        make the hidden doors of room ``ID`` visible, see :func:`textgame.room.Room.reveal_hiddendoors`
+        """
+        room = self._edit_room(ID)
+        for dir in room.hiddendoors:
+            self._set_door(room, dir, self.door_target(room, dir, hidden=True))
+        self._changed_doors(room)
+
+
+    def freeze(self):
+        """
+        run a full garbage collection and move everything that survives (the whole
+        world, but also all other objects that exist right now) to a permanent generation
+        that the garbage collector never looks at again, see :func:`gc.freeze`. Call this
+        after the world is built, it shortens the pauses of the garbage collector.
+        Objects that get created later are collected as usual
+        """
+        gc.collect()
+        gc.freeze()
+        logger.info("froze {} objects".format(gc.get_freeze_count()))
+
+
+    def unfreeze(self):
+        """
+        undo :func:`textgame.world.World.freeze`
+        """
+        gc.unfreeze()
+
+
     def room(self, ID):
         """get room by ID.
         If the room is not found, the logger prints an error
@@ -215,20 +528,102 @@ class World:
             self.room(roomid).set_specials(**restriction)
 
 
+    def schedule(self, delay, func, *args, every=None):
+        """
+        call ``func(*args)`` ``delay`` steps from now, see :mod:`textgame.scheduler`
+
+        :param every: repeat every ``every`` steps
+        :rtype: :class:`textgame.scheduler.Timer`
+        """
+        if delay < 1:
+            raise ValueError("delay must be at least 1")
+        return self.scheduler.schedule(self.time + delay, func, *args, every=every)
+
+
+    def cancel(self, timer):
+        """
+        cancel an event returned by :func:`textgame.world.World.schedule`
+        """
+        self.scheduler.cancel(timer)
+
+
     def update(self, player):
         """
-        increase the time, call :func:`textgame.world.World.manage_fight` and
-        :func:`textgame.world.World.manage_daylight`
+        increase the time, call :func:`textgame.world.World.manage_fight`,
+        :func:`textgame.world.World.manage_daylight` and run scheduled events that are due
 
-        :rtype: output of ``manage_fight`` and ``manage_daylight`` (str)
+        :rtype: output of ``manage_fight``, ``manage_daylight`` and the events (str)
         """
-        self.time += 1
-        logger.debug("time set to {}".format(self.time))
-        msg = self.manage_fight(player)
-        msg += self.manage_daylight()
+        registry = metrics.registry
+        if registry is not None:
+            start = perf_counter()
+        msg = player.join('', (self.manage_fight(player), self._tick(player)))
+        if registry is not None:
+            registry.observe("update_seconds", "", perf_counter() - start)
         return msg
 
 
+    def _tick(self, player):
+        """
+        increase the time, manage daylight, the monster simulation and scheduled events
+
+        :rtype: message that night came in and output of the events (str)
+        """
+        self.time += 1
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("time set to {}".format(self.time))
+        daylight = self.manage_daylight()
+        if daylight:
+            player.record(NIGHT_FELL, time=self.time)
+        msg = [daylight]
+        if self.feed is not None and self.feed.subscriptions:
+            self.feed.publish(FEED_TICK, self.time, self.daytime)
+        if self.events is not None:
+            ticked = self.events.emit(TICK, self, player, time=self.time)
+            if ticked:
+                msg += ['\n', ticked]
+        if self.simulation is not None:
+            self.simulation.tick((player,))
+        if self.scheduler.is_due(self.time):
+            msg.append(self.scheduler.run_due(self.time))
+        return player.join('', msg)
+
+
+    def fast_forward(self, ticks, player=None):
+        """
+        advance the time by ``ticks`` steps at once. Only the scheduled events that
+        are due in between and nightfall are processed, the cost doesn't depend on
+        ``ticks``. Unlike :func:`textgame.world.World.update`, fights are not managed
+
+        :param player: if given, nightfall gets recorded on this player
+        :rtype: the messages of nightfall and the events (str)
+        """
+        end = self.time + ticks
+        msg = []
+        while True:
+            next_time = self.scheduler.next_time()
+            if next_time is None or next_time > end:
+                break
+            # events see the time and daytime they were scheduled for
+            self.time = max(self.time, next_time)
+            msg.append(self._fast_forward_daylight(player))
+            msg.append(self.scheduler.run_due(self.time))
+        self.time = end
+        msg.append(self._fast_forward_daylight(player))
+        if self.feed is not None and self.feed.subscriptions:
+            self.feed.publish(FEED_TICK, self.time, self.daytime)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("time set to {}".format(self.time))
+        return ''.join(msg)
+
+
+    def _fast_forward_daylight(self, player):
+        daylight = self.manage_daylight()
+        if daylight and player is not None:
+            player.record(NIGHT_FELL, time=self.time)
+        return daylight
+
+
     def manage_daylight(self):
         """
         check if it's nighttime and turn all rooms dark if yes
@@ -240,10 +635,20 @@ class World:
             # turn all rooms to always dark
             for room in self.rooms.values():
                 room.dark["always"] = True
+            if self.events is not None:
+                self.events.emit(NIGHT_FELL_EVENT, self, None, time=self.time)
             return '\n\n' + INFO.NIGHT_COMES_IN
         return ''
 
 
+    def is_lit(self, room, player):
+        """
+        return ``True`` if there's light in ``room`` when ``player`` enters it
+        """
+        return room.has_light() or player.has_light()
+
+
+    @traced("world.spawn_monster")
     def spawn_monster(self, location):
         """randomly spawn a monster in location
 
@@ -257,6 +662,9 @@ class World:
 
         :param location: :class:`textgame.room.Room` in which a monster should spawn
         """
+        if self.simulation is not None:
+            # put the monsters that wandered in
+            self.simulation.sync_room(location)
         # remove singleencounters / save active monsters in room for later
         active_beast = None
         for id,monster in list(location.monsters.items()):
@@ -265,25 +673,47 @@ class World:
             elif monster.status["active"] and monster.status["singleencounter"]:
                 # remove monster from room and set active to False
                 location.monsters.pop(id).status["active"] = False
+                if self.feed is not None and self.feed.subscriptions:
+                    self.feed.monster_changed(id, monster, None)
 
         # only spawn new if room is empty
         if len(location.monsters) == 0:
+            rng = self.rng
             for monster in self.monsters.values():
-                cond = self.random.random() < monster.spawn_prob and \
-                    any([r in location.id for r in monster.spawns_in]) and \
-                    (monster.spawns_at == self.daytime or monster.spawns_at == "always") and \
-                    not monster.status["active"]
+                if rng is None:
+                    cond = self.random.random() < monster.spawn_prob and \
+                        self._can_spawn(monster, location)
+                else:
+                    # the roll doesn't depend on previous rolls, so only roll if the
+                    # monster could spawn at all
+                    cond = monster.spawn_prob > 0 and self._can_spawn(monster, location) and \
+                        rng.random(self.time, "spawn", location.id, monster.id) < monster.spawn_prob
                 if cond:
                     location.add_monster(monster)
                     monster.status["active"] = True
                     monster.history = 0
-                    logger.debug("Spawned {} in {}".format(monster.id, location.id))
+                    if self.feed is not None and self.feed.subscriptions:
+                        self.feed.monster_changed(monster.id, monster, location)
+                    if self.events is not None:
+                        self.events.emit(MONSTER_SPAWNED, self, None, (monster.id, location.id),
+                            monster=monster.id, room=location.id)
+                    if metrics.registry is not None:
+                        metrics.registry.inc("spawns", monster.id)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Spawned {} in {}".format(monster.id, location.id))
                     break   # spawn no more
         elif active_beast and active_beast.status["harmless"]:
             # TODO: implement behaviour of harmless monsters
             pass
 
 
+    def _can_spawn(self, monster, location):
+        return any([r in location.id for r in monster.spawns_in]) and \
+            (monster.spawns_at == self.daytime or monster.spawns_at == "always") and \
+            not monster.status["active"]
+
+
+    @traced("world.manage_fight")
     def manage_fight(self, player):
         """
         if there are active, harmful monsters around, this method checks if the player is
@@ -292,24 +722,31 @@ class World:
 
         :rtype: string describing the status of the fight
         """
-        msg = ''
-        for monsterid,monster in self.monsters.items():
+        msg = []
+        for monsterid,monster in self._fight_candidates(player):
             if monster.status["active"] and not monster.status["harmless"]:
-                logger.debug("managing fight with {}".format(monsterid))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("managing fight with {}".format(monsterid))
                 player.status["fighting"] = True
+                if metrics.registry is not None:
+                    metrics.registry.inc("fight_rounds", monsterid)
                 # player dies if attacked in the dark
                 if player.location.dark["now"]:
-                    player.status["alive"] = False
-                    return '\n'+FIGHTING.DARK_DEATH.format(monster.name)
+                    player.record(FIGHT, monster=monsterid, outcome="dark")
+                    player.die("dark")
+                    return player.join('\n', ('', player.say(FIGHTING.DARK_DEATH, monster.name)))
 
                 if monster.status["alive"] and player.status["alive"]:
                     if monster.status["fighting"]:
-                        msg += '\n'+FIGHTING.SURVIVED_ATTACK.format(monster.name)
+                        player.record(FIGHT, monster=monsterid, outcome="survived")
+                        msg.append(player.say(FIGHTING.SURVIVED_ATTACK, monster.name))
                     elif monster.history > 1:
-                        player.status["alive"] = False
-                        msg += '\n'+FIGHTING.IGNORE
+                        player.record(FIGHT, monster=monsterid, outcome="ignored")
+                        player.die("ignored")
+                        msg.append(FIGHTING.IGNORE)
                     elif monster.history >= 0:
-                        msg += '\n'+FIGHTING.DEFEND_REMINDER.format(monster.name)
+                        player.record(FIGHT, monster=monsterid, outcome="reminder")
+                        msg.append(player.say(FIGHTING.DEFEND_REMINDER, monster.name))
 
                 elif not monster.status["alive"]:
                     monster.status["active"] = False
@@ -318,13 +755,30 @@ class World:
                     # move monster from monsters to items to make it takable
                     monster.id = monster.name
                     player.location.add_item( player.location.monsters.pop(monsterid) )
-                    msg += '\n'+FIGHTING.SUCCESS.format(monster.name)
+                    player.record(FIGHT, monster=monsterid, outcome="killed")
+                    msg.append(player.say(FIGHTING.SUCCESS, monster.name))
+                    if self.events is not None:
+                        killed = self.events.emit(MONSTER_KILLED, self, player,
+                            (monsterid, player.location.id), monster=monsterid, room=player.location.id)
+                        if killed:
+                            msg.append(killed)
 
                 if not player.status["alive"]:
-                    msg += '\n'+FIGHTING.LOSER.format(monster.name)
+                    msg.append(player.say(FIGHTING.LOSER, monster.name))
 
                 monster.history += 1
                 monster.status["fighting"] = False
+                feed = self.feed
+                if feed is not None and feed.subscriptions:
+                    feed.monster_changed(monsterid, monster, player.location)
+                    feed.publish(PLAYER_STATUS, feed.name(player), dict(player.status))
 
-                return msg
+                return player.join('\n', [''] + msg)
         return ''
+
+
+    def _fight_candidates(self, player):
+        """
+        return ``(ID, monster)`` pairs of the monsters that may fight ``player``
+        """
+        return self.monsters.items()